@@ -9,6 +9,9 @@ import time
 # NOTE: The rag_agentic module must be available in the environment to run this app.
 # Assuming 'rag_agentic' is accessible in the environment.
 from rag_agentic import AgenticRAG
+from query_service import QueryService
+from search_filters import SearchFilter
+from named_collections import list_collections
 
 # --- RAG Parameter Defaults ---
 DEFAULT_TOP_K = 15
@@ -221,6 +224,18 @@ def get_rag_agent():
 # The RAG Agent object
 rag_agent = get_rag_agent()
 
+
+@st.cache_resource
+def get_query_service(_rag_agent):
+    """
+    One query service for all browser sessions: a long-lived event loop around the shared
+    agent, with per-request K/N and bounded concurrency toward Ollama and Chroma.
+    """
+    return QueryService(_rag_agent) if _rag_agent else None
+
+
+query_service = get_query_service(rag_agent)
+
 # Load initial state
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = load_chat_history()
@@ -284,14 +299,37 @@ def get_regular_chat_response(prompt, history):
     return response["message"]["content"]
 
 
+@st.cache_data(show_spinner=False, ttl=60)
+def get_collection_names():
+    """
+    Fetches the names of the named collections on disk (for the collection picker).
+    """
+    try:
+        return list_collections()
+    except Exception:
+        return []
+
+
+@st.cache_data(show_spinner=False, ttl=60)
+def get_file_types(_rag_agent, collections):
+    """
+    Fetches the file types of the files indexed in the selected collections (for the search filter picker).
+    """
+    try:
+        return sorted({file_type for shard in _rag_agent._shards_for(list(collections))
+                       for file_type in shard.manifest.file_types()})
+    except Exception:
+        return []
+
+
 @st.cache_data(show_spinner=False)
-def get_db_count(_rag_agent):
+def get_db_count(_rag_agent, collections):
     """
-    Fetches the document count from the vector database.
+    Fetches the document count of the selected collections from the vector database.
     """
     if _rag_agent and _rag_agent.collection:
         try:
-            return _rag_agent.collection.count()
+            return sum(shard.collection.count() for shard in _rag_agent._shards_for(list(collections)))
         except Exception:
             return -1
     return 0
@@ -307,7 +345,16 @@ with st.sidebar:
 
     # --- DATABASE STATUS UI ---
     st.subheader("Database Status")
-    db_count = get_db_count(rag_agent)
+    # Collections searched in RAG mode, in parallel (results merged by relevance)
+    if rag_agent:
+        collection_names = list(dict.fromkeys(rag_agent.collections + get_collection_names()))
+        selected_collections = st.multiselect("Collections", collection_names, default=rag_agent.collections,
+                                              help="Named collections to search. Index one with "
+                                                   "`python main.py --mode index --collection NAME`.")
+        st.session_state.collections = selected_collections or rag_agent.collections
+    else:
+        st.session_state.collections = []
+    db_count = get_db_count(rag_agent, tuple(st.session_state.collections))
 
     if db_count > 0:
         st.markdown(f"<p style='color:#10b981; font-weight: bold;'>✨ Indexed Chunks: {db_count:,}</p>",
@@ -388,6 +435,33 @@ with st.sidebar:
     st.markdown("---")
     # --- END RAG PARAMETER SETTINGS ---
 
+    # --- SEARCH FILTERS ---
+    st.subheader("Search Filters")
+    st.caption("Restrict RAG mode to part of your documents. Empty = search everything.")
+    folder_input = st.text_input(
+        "Only folders",
+        placeholder="e.g. projects/project-x, D:\\notes\\work",
+        help="Comma-separated folders, absolute or relative to the documents root.",
+    )
+    selected_types = st.multiselect("Only file types",
+                                    get_file_types(rag_agent, tuple(st.session_state.collections))
+                                    if rag_agent else [])
+    use_dates = st.checkbox("Only files modified between")
+    date_range = st.date_input("Modified between", value=(), label_visibility="collapsed",
+                               disabled=not use_dates)
+
+    modified_after = modified_before = None
+    if use_dates and len(date_range) == 2:
+        # Both dates are inclusive (SearchFilter reads a date upper bound as the end of that day)
+        modified_after, modified_before = date_range
+    st.session_state.search_filter = SearchFilter(folder_input.split(","), selected_types, modified_after,
+                                                  modified_before)
+    if not st.session_state.search_filter.is_empty():
+        st.caption(f"🗂️ {st.session_state.search_filter.describe()}")
+
+    st.markdown("---")
+    # --- END SEARCH FILTERS ---
+
     # New Chat Button
     st.button("✨ Start New Chat (Clear History)", on_click=new_chat, use_container_width=True)
     st.markdown("---")
@@ -397,11 +471,22 @@ with st.sidebar:
 
     if rag_agent:
         st.markdown(f"**LLM Model:** `{rag_agent.model}`")
-        if hasattr(rag_agent.collection, 'name'):
-            st.markdown(f"**Vector Collection:** `{rag_agent.collection.name}`")
+        st.markdown(f"**Vector Collections:** `{', '.join(st.session_state.collections)}`")
         # Display the *currently active* values from session state
         st.markdown(f"**Current K:** `{st.session_state.top_k_retrieve}`")
         st.markdown(f"**Current N:** `{st.session_state.top_n_rank}`")
+        if not st.session_state.search_filter.is_empty():
+            st.markdown(f"**Search Filter:** `{st.session_state.search_filter.describe()}`")
+        if rag_agent.semantic_cache is not None:
+            cache_stats = rag_agent.semantic_cache.stats()
+            st.markdown(f"**Semantic Cache:** `{cache_stats['hit_rate']:.0%}` hit rate "
+                        f"({cache_stats['hits']}/{cache_stats['lookups']}), "
+                        f"`{cache_stats['seconds_saved']:.1f}s` saved")
+        # This session's last answer (the shared agent serves every session)
+        generation_stats = st.session_state.get("last_generation_stats", {})
+        if generation_stats.get("query_ttft_ms") is not None:
+            st.markdown(f"**Last Time to First Token:** `{generation_stats['query_ttft_ms'] / 1000:.2f}s` "
+                        f"(generation `{generation_stats['ttft_ms'] / 1000:.2f}s`)")
     else:
         st.warning("RAG Agent not fully initialized. Check the connection errors above.")
 
@@ -485,35 +570,55 @@ if (st.session_state.chat_history and
 
     # --- RAG Mode Execution ---
     if st.session_state.rag_mode_enabled:
-        with st.spinner("🔍 Searching local documents and generating RAG response..."):
+        result = None
+        with st.spinner("🔍 Searching local documents..."):
             try:
-                # 1. Attempt local RAG query
+                # 1. Attempt local RAG query; returns once retrieval is done, the answer is streamed below
                 # --- CRITICAL: PASSING DYNAMIC K and N values ---
-                result = rag_agent.query(
+                result = query_service.query_stream(
                     latest_prompt,
                     chat_history=rag_history,
                     top_k=st.session_state.top_k_retrieve,
-                    top_n=st.session_state.top_n_rank
+                    top_n=st.session_state.top_n_rank,
+                    search_filter=st.session_state.get("search_filter"),
+                    collections=st.session_state.get("collections") or None
                 )
-
-                # Check if local RAG was successful (found documents)
-                if result and result.get("context_chunks"):
-                    bot_message["message"] = result["answer"]
-                    bot_message["sources"] = result.get("sources", [])
-                    bot_message["context_chunks"] = result.get("context_chunks", [])
-
-                # Local RAG Fails: Couldn't find relevant context
-                else:
-                    bot_message["message"] = (
-                        "I could not find any relevant documents in the local database to confidently answer your question. "
-                        "Try a different phrasing or consider switching to **Regular Chat Mode** (`/chat`) for a general LLM response."
-                    )
-
             except Exception as e:
                 # General error in RAG process
                 print(f"RAG Processing Error: {e}")
                 bot_message["message"] = f"An internal error occurred during RAG processing. Details: {e}"
 
+        # Check if local RAG was successful (found documents)
+        if result and result.get("context_chunks"):
+            bot_message["sources"] = result.get("sources", [])
+            bot_message["context_chunks"] = result.get("context_chunks", [])
+
+            # 2. Render the answer token by token while the LLM generates it
+            with chat_container:
+                with st.chat_message("Bot"):
+                    try:
+                        answer = st.write_stream(result["answer_stream"])
+                        bot_message["message"] = answer if isinstance(answer, str) else "".join(map(str, answer))
+                        st.session_state.last_generation_stats = result.get("generation_stats", {})
+                    except Exception as e:
+                        # Keep whatever was generated before the stream broke off
+                        print(f"RAG Streaming Error: {e}")
+                        bot_message["message"] = (
+                            f"{result.get('answer') or ''}\n\n"
+                            f"_An internal error occurred while generating the answer. Details: {e}_")
+
+            if result.get("cached"):
+                bot_message["message"] += (
+                    f"\n\n_⚡ Answered from the semantic cache "
+                    f"(similarity {result['similarity']:.2f} to an earlier question)._")
+
+        # Local RAG Fails: Couldn't find relevant context
+        elif result is not None:
+            bot_message["message"] = (
+                "I could not find any relevant documents in the local database to confidently answer your question. "
+                "Try a different phrasing or consider switching to **Regular Chat Mode** (`/chat`) for a general LLM response."
+            )
+
     # --- Regular Chat Mode Execution ---
     else:
         with st.spinner("💬 Generating regular response..."):
@@ -0,0 +1,190 @@
+"""
+Embedding throughput benchmark against a local mock Ollama server.
+
+Starts an in-process HTTP server that mimics the /api/embed (multi-input) and
+/api/embeddings (single-input) endpoints with a configurable per-request latency,
+then measures how many HTTP requests OllamaBatchEmbedder issues and how many
+chunks/sec it achieves, comparing per-text requests against batched requests.
+
+The mock serves at most `--server-parallel` requests at a time (like OLLAMA_NUM_PARALLEL);
+the rest queue, so the table also shows where the adaptive concurrency limiter settles.
+
+Usage:
+    python benchmark_embedder.py --chunks 2000 --latency-ms 20
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import rich
+from rich.table import Table
+
+from rag_embedder import OllamaBatchEmbedder
+
+console = rich.get_console()
+
+
+class MockOllamaServer:
+    """
+    Minimal stand-in for an Ollama server that only implements the embedding endpoints.
+
+    Every request sleeps for `latency_ms` (fixed round-trip overhead) plus
+    `per_input_ms` for each input, and returns random vectors of size `dim`.
+    At most `parallel` requests are processed at once (None = unlimited); the rest wait.
+    """
+
+    def __init__(self, dim=1024, latency_ms=20.0, per_input_ms=0.5, legacy_only=False, parallel=None):
+        self.dim = dim
+        self.latency = latency_ms / 1000.0
+        self.per_input = per_input_ms / 1000.0
+        self.legacy_only = legacy_only
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(parallel) if parallel else None
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def host(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def _vector(self):
+        return [random.random() for _ in range(self.dim)]
+
+    def _work(self, seconds):
+        """Simulates model compute, queueing behind other requests when all slots are busy."""
+        if self._slots is None:
+            time.sleep(seconds)
+            return
+        with self._slots:
+            time.sleep(seconds)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass  # Keep benchmark output clean
+
+            def _reply(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                with server._lock:
+                    server.request_count += 1
+
+                if self.path == "/api/embed" and not server.legacy_only:
+                    inputs = request.get("input", [])
+                    inputs = [inputs] if isinstance(inputs, str) else inputs
+                    server._work(server.latency + server.per_input * len(inputs))
+                    self._reply(200, {"model": request.get("model"),
+                                      "embeddings": [server._vector() for _ in inputs]})
+                elif self.path == "/api/embeddings":
+                    server._work(server.latency + server.per_input)
+                    self._reply(200, {"embedding": server._vector()})
+                else:
+                    self._reply(404, {"error": f"404 page not found: {self.path}"})
+
+        return Handler
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.request_count = 0
+
+
+async def _run_embedder(embedder, chunks, batch_size):
+    """Feeds chunks to the embedder the same way IngestPipeline does (in API batches)."""
+    total = 0
+    for i in range(0, len(chunks), batch_size):
+        total += len(await embedder.embed_batch(chunks[i:i + batch_size]))
+    return total
+
+
+def run_case(server, label, chunks, batch_size, **embedder_kwargs):
+    """Runs one benchmark case and returns a result row."""
+    force_per_text = embedder_kwargs.pop("force_per_text", False)
+    embedder = OllamaBatchEmbedder(host=server.host, **embedder_kwargs)
+    if force_per_text:
+        embedder.multi_input_supported = False
+
+    server.reset()
+    start = time.perf_counter()
+    embedded = asyncio.run(_run_embedder(embedder, chunks, batch_size))
+    elapsed = time.perf_counter() - start
+    embedder.executor.shutdown(wait=True)
+
+    stats = embedder.stats()
+    return (label, embedded, server.request_count, elapsed, embedded / elapsed if elapsed else 0.0,
+            stats["concurrency"], stats["p50_ms"], stats["p95_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OllamaBatchEmbedder against a mock Ollama server.")
+    parser.add_argument("--chunks", type=int, default=2000, help="Number of synthetic chunks to embed.")
+    parser.add_argument("--chunk-chars", type=int, default=512, help="Characters per synthetic chunk.")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Chunks per embed_batch call.")
+    parser.add_argument("--sub-batch-size", type=int, default=64, help="Max inputs per /api/embed request.")
+    parser.add_argument("--max-tokens", type=int, default=8192, help="Token budget per request.")
+    parser.add_argument("--max-concurrency", type=int, default=32, help="Upper bound for the adaptive limiter.")
+    parser.add_argument("--server-parallel", type=int, default=4,
+                        help="Requests the mock serves at once; the rest queue (0 = unlimited).")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Mock round-trip overhead per request.")
+    parser.add_argument("--per-input-ms", type=float, default=0.5, help="Mock compute cost per input.")
+    parser.add_argument("--dim", type=int, default=1024, help="Embedding dimension returned by the mock.")
+    args = parser.parse_args()
+
+    chunks = ["x" * args.chunk_chars for _ in range(args.chunks)]
+    common = dict(max_concurrency=args.max_concurrency, sub_batch_size=args.sub_batch_size,
+                  max_tokens_per_request=args.max_tokens)
+
+    parallel = args.server_parallel or None
+    server = MockOllamaServer(dim=args.dim, latency_ms=args.latency_ms, per_input_ms=args.per_input_ms,
+                              parallel=parallel).start()
+    legacy_server = MockOllamaServer(dim=args.dim, latency_ms=args.latency_ms, per_input_ms=args.per_input_ms,
+                                     legacy_only=True, parallel=parallel).start()
+    try:
+        rows = [
+            run_case(server, "per-text (/api/embeddings)", chunks, args.batch_size, force_per_text=True, **common),
+            run_case(server, "batched (/api/embed)", chunks, args.batch_size, **common),
+            run_case(legacy_server, "batched, legacy server fallback", chunks, args.batch_size, **common),
+        ]
+    finally:
+        server.stop()
+        legacy_server.stop()
+
+    table = Table(title=f"Embedding benchmark ({args.chunks} chunks, {args.latency_ms} ms/request overhead)")
+    table.add_column("Mode")
+    table.add_column("Chunks", justify="right")
+    table.add_column("HTTP requests", justify="right")
+    table.add_column("Seconds", justify="right")
+    table.add_column("Chunks/sec", justify="right")
+    table.add_column("Final concurrency", justify="right")
+    table.add_column("p50 / p95 ms", justify="right")
+    for label, embedded, requests, elapsed, rate, concurrency, p50, p95 in rows:
+        table.add_row(label, str(embedded), str(requests), f"{elapsed:.2f}", f"{rate:,.0f}",
+                      str(concurrency), f"{p50:.0f} / {p95:.0f}")
+    console.print(table)
+
+
+if __name__ == "__main__":
+    main()
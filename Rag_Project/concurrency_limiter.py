@@ -0,0 +1,207 @@
+import asyncio
+import math
+import random
+import threading
+import time
+from collections import deque
+
+# Completions kept for the p50/p95 latency and throughput figures
+_SAMPLE_WINDOW = 256
+
+
+def _percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+def backoff_delay(attempt, base=0.25, cap=10.0):
+    """
+    "Full jitter" exponential backoff: a random delay in [0, min(cap, base * 2**attempt)].
+
+    Randomizing the whole interval keeps concurrent retries from hitting a recovering
+    server in lockstep.
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Latency-aware AIMD limiter for requests to a shared backend (e.g. Ollama).
+
+    The limit is re-evaluated after every `limit` completions (one "window"):
+      - any failure (timeout, overloaded server)         -> multiplicative decrease (halve)
+      - median latency > `latency_tolerance` x baseline   -> gentle decrease (requests are queueing
+                                                            on the server instead of running)
+      - the window ran saturated and throughput improved -> additive increase (+1)
+      - otherwise                                         -> hold
+
+    The baseline is the lowest window median seen so far, slowly decayed upwards so a
+    single lucky window does not pin the limit down forever.
+
+    Slots are handed out by a thread-safe counter rather than an asyncio.Semaphore so
+    one limiter can be shared by event loops created with asyncio.run() on every call.
+    """
+
+    def __init__(self, initial=2, min_limit=1, max_limit=32, latency_tolerance=2.0):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(self.max_limit, max(self.min_limit, initial))
+        self.latency_tolerance = latency_tolerance
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiters = deque()  # futures of acquire() calls waiting for a slot
+
+        # Current window
+        self._window_started = time.monotonic()
+        self._window_latencies = []
+        self._window_items = 0
+        self._window_failed = False
+        self._window_saturated = False
+
+        self._baseline_latency = None
+        self._last_throughput = None
+
+        # Rolling figures for stats()
+        self._latencies = deque(maxlen=_SAMPLE_WINDOW)
+        self._completions = deque(maxlen=_SAMPLE_WINDOW)  # (finished_at, items)
+        self.requests = 0
+        self.failures = 0
+
+    # --- Slots ---
+
+    async def acquire(self):
+        """Waits for a free slot. Every successful acquire() must be paired with release()."""
+        with self._lock:
+            if self._in_flight < self.limit and not self._waiters:
+                self._take_slot()
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted just as we were cancelled; hand it back.
+                # (A cancelled waiter that was already granted is returned by _grant.)
+                self.release(0.0, 0, record=False)
+            raise
+
+    def _take_slot(self):
+        """Must be called with the lock held."""
+        self._in_flight += 1
+        if self._in_flight >= self.limit:
+            self._window_saturated = True
+
+    def release(self, latency, items=1, failed=False, record=True):
+        """
+        Returns a slot and feeds the outcome of the request into the controller.
+
+        Args:
+            latency (float): Seconds the request took.
+            items (int): Work items the request carried (e.g. texts embedded), for throughput.
+            failed (bool): True for timeouts / overload errors, which trigger a backoff.
+            record (bool): False to return a slot without recording a sample.
+        """
+        with self._lock:
+            self._in_flight -= 1
+            if record:
+                self._record(latency, items, failed)
+            self._wake_waiters()
+
+    def _wake_waiters(self):
+        """Grants free slots to waiting acquire() calls. Must be called with the lock held."""
+        while self._waiters and self._in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self._take_slot()
+            # The waiter may belong to another thread's event loop
+            waiter.get_loop().call_soon_threadsafe(_grant, waiter, self)
+
+    # --- Controller ---
+
+    def _record(self, latency, items, failed):
+        now = time.monotonic()
+        self.requests += 1
+        if failed:
+            self.failures += 1
+            self._window_failed = True
+        else:
+            self._latencies.append(latency)
+            self._completions.append((now, items))
+            self._window_latencies.append(latency)
+            self._window_items += items
+
+        # Back off immediately on failure; otherwise decide once per window
+        if failed or len(self._window_latencies) >= self.limit:
+            self._end_window(now)
+
+    def _end_window(self, now):
+        elapsed = max(now - self._window_started, 1e-6)
+        throughput = self._window_items / elapsed
+        median = _percentile(sorted(self._window_latencies), 50) if self._window_latencies else None
+
+        if median is not None:
+            if self._baseline_latency is None or median < self._baseline_latency:
+                self._baseline_latency = median
+            else:
+                # Let the baseline drift up slowly (model swaps, larger chunks, ...)
+                self._baseline_latency *= 1.01
+
+        if self._window_failed:
+            self.limit = max(self.min_limit, self.limit // 2)
+        elif median is not None and median > self._baseline_latency * self.latency_tolerance:
+            self.limit = max(self.min_limit, math.floor(self.limit * 0.9))
+        elif self._window_saturated and (self._last_throughput is None or throughput > self._last_throughput * 1.05):
+            self.limit = min(self.max_limit, self.limit + 1)
+
+        self._last_throughput = throughput if not self._window_failed else None
+        self._window_started = now
+        self._window_latencies = []
+        self._window_items = 0
+        self._window_failed = False
+        self._window_saturated = self._in_flight >= self.limit
+
+    # --- Reporting ---
+
+    def stats(self):
+        """
+        Returns:
+            dict: concurrency (current limit), in_flight, p50_ms, p95_ms, throughput
+            (items/sec over the recent completions), requests and failures.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            completions = list(self._completions)
+            stats = {
+                "concurrency": self.limit,
+                "in_flight": self._in_flight,
+                "requests": self.requests,
+                "failures": self.failures,
+            }
+        stats["p50_ms"] = _percentile(latencies, 50) * 1000
+        stats["p95_ms"] = _percentile(latencies, 95) * 1000
+        if len(completions) >= 2:
+            span = completions[-1][0] - completions[0][0]
+            # The first completion opens the interval, so its items are not counted
+            items = sum(n for _, n in completions[1:])
+            stats["throughput"] = items / span if span > 0 else 0.0
+        else:
+            stats["throughput"] = 0.0
+        return stats
+
+
+def _grant(waiter, limiter):
+    """Resolves a waiting acquire() on its own loop, returning the slot if nobody is waiting any more."""
+    if waiter.done():
+        limiter.release(0.0, 0, record=False)
+    else:
+        waiter.set_result(None)
@@ -11,6 +11,196 @@ MASTER_DOCS_PATH = os.getenv("MASTER_DOCS_PATH", r"D:\obsidian notes\Note")
 # Used by vector_db_factory.py
 CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH", r"D:\rag_storage")
 
-# The vector database type to use (currently only 'chroma' is supported)
+# Named collection that indexing, watching, wiping, normalization and compaction write to.
+# Every collection has its own vector store collection, file manifest and lexical index, so a
+# large document root can be indexed, rebuilt or wiped without touching the others. The
+# default 'rag_docs' keeps the original storage paths.
+# Used by vector_db_factory.py, ingest_pipeline.py and main.py
+COLLECTION_NAME = os.getenv("COLLECTION_NAME", "rag_docs")
+
+# Collections searched by queries (comma-separated); several are searched in parallel and
+# their results merged by distance. Requests can choose other collections.
+# Used by rag_agentic.py
+QUERY_COLLECTIONS = [name.strip() for name in os.getenv("QUERY_COLLECTIONS", COLLECTION_NAME).split(",")
+                     if name.strip()]
+
+# The vector database type to use: 'chroma' (ChromaDB) or 'numpy' (in-process engine over a
+# memory-mapped embedding matrix; exact search, no server)
 # Used by vector_db_factory.py
 VECTOR_DB = os.getenv("VECTOR_DB", "chroma")
+
+# Directory of the 'numpy' vector store (embedding matrix + SQLite sidecar)
+# Used by vector_db_factory.py
+NUMPY_DB_PATH = os.getenv("NUMPY_DB_PATH", os.path.join(CHROMA_DB_PATH, "numpy_store"))
+
+# Search index of the 'numpy' vector store: 'flat' (exact search over every row) or 'ivf'
+# (k-means inverted lists; only the IVF_NPROBE lists nearest to the query are scored)
+# Used by vector_db_factory.py
+NUMPY_INDEX = os.getenv("NUMPY_INDEX", "flat")
+
+# Number of IVF lists (0 = about 4 * sqrt(chunks), chosen when the index is trained)
+# and lists probed per query: more probes = higher recall, slower queries
+# Used by vector_db_factory.py
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+
+# The IVF index is trained once the store holds this many chunks (exact search below that),
+# and retrained when the store has grown IVF_RETRAIN_GROWTH times since
+# Used by vector_db_factory.py
+IVF_TRAIN_MIN_CHUNKS = int(os.getenv("IVF_TRAIN_MIN_CHUNKS", "20000"))
+IVF_RETRAIN_GROWTH = float(os.getenv("IVF_RETRAIN_GROWTH", "4"))
+
+# The 'numpy' store compacts itself (moves live rows into deleted slots, shrinks the file,
+# purges stale IVF entries) once this fraction of its slots are tombstones
+# Used by vector_db_factory.py
+NUMPY_COMPACT_RATIO = float(os.getenv("NUMPY_COMPACT_RATIO", "0.25"))
+
+# Compressed copy of the 'numpy' store's vectors used to score search candidates: 'none',
+# 'float16' (half the memory) or 'int8' (a quarter, per-vector scale). The best
+# NUMPY_RESCORE_FACTOR * K candidates are then re-scored from the float32 vectors
+# Used by vector_db_factory.py
+NUMPY_QUANTIZATION = os.getenv("NUMPY_QUANTIZATION", "none")
+NUMPY_RESCORE_FACTOR = int(os.getenv("NUMPY_RESCORE_FACTOR", "4"))
+
+# Maximum number of chunks sent to Ollama in a single multi-input /api/embed request
+# Used by rag_embedder.py
+EMBED_SUB_BATCH_SIZE = int(os.getenv("EMBED_SUB_BATCH_SIZE", "64"))
+
+# Approximate token budget for a single embed request (estimated at ~4 characters per token)
+# Used by rag_embedder.py
+EMBED_MAX_TOKENS_PER_REQUEST = int(os.getenv("EMBED_MAX_TOKENS_PER_REQUEST", "8192"))
+
+# Persistent embedding cache keyed by (embedding model, chunk SHA-256), stored next to the vector DB
+# Used by embedding_cache.py and ingest_pipeline.py
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(CHROMA_DB_PATH, "embedding_cache.sqlite3"))
+
+# Upper bound on the cache size; least recently used vectors are evicted beyond this
+# Used by embedding_cache.py
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "2048"))
+
+# Number of worker processes used to parse documents in parallel (0 = parse serially in-process)
+# Used by ingest_pipeline.py
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0"))
+
+# Seconds a single file may take to parse before its worker is killed and the file is skipped
+# Used by ingest_pipeline.py
+PARSE_TIMEOUT_SECONDS = float(os.getenv("PARSE_TIMEOUT_SECONDS", "300"))
+
+# SQLite manifest of indexed files (path, size, mtime, content hash, chunk IDs) used for change detection
+# Used by file_manifest.py and ingest_pipeline.py
+FILE_MANIFEST_PATH = os.getenv("FILE_MANIFEST_PATH", os.path.join(CHROMA_DB_PATH, "file_manifest.sqlite3"))
+
+# Threads used to hash files whose size/mtime changed since the last index run
+# Used by ingest_pipeline.py
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "4"))
+
+# Insert the spaces missing between run-together words, numbers and sentences (common in PDF
+# text) once at ingest time, before chunks are stored and embedded. Collections indexed
+# without it can be migrated with: python main.py --mode normalize
+# Used by ingest_pipeline.py
+TEXT_NORMALIZATION_ENABLED = os.getenv("TEXT_NORMALIZATION_ENABLED", "true").lower() == "true"
+
+# Watch mode: a file is re-indexed once it has not changed for this many seconds
+# (coalesces bursts such as Obsidian's save-on-keystroke)
+# Used by watcher.py
+WATCH_DEBOUNCE_SECONDS = float(os.getenv("WATCH_DEBOUNCE_SECONDS", "2.0"))
+
+# Adaptive concurrency for embedding requests: the embedder starts at the initial value and
+# ramps up while throughput improves, backing off on timeouts or rising server-side queueing
+# Used by rag_embedder.py
+EMBED_INITIAL_CONCURRENCY = int(os.getenv("EMBED_INITIAL_CONCURRENCY", "2"))
+EMBED_MIN_CONCURRENCY = int(os.getenv("EMBED_MIN_CONCURRENCY", "1"))
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "32"))
+
+# Back off when the median request latency exceeds the best observed latency by this factor
+# Used by rag_embedder.py
+EMBED_LATENCY_TOLERANCE = float(os.getenv("EMBED_LATENCY_TOLERANCE", "2.0"))
+
+# Per-request timeout and retry budget (retries use jittered exponential backoff)
+# Used by rag_embedder.py
+EMBED_REQUEST_TIMEOUT_SECONDS = float(os.getenv("EMBED_REQUEST_TIMEOUT_SECONDS", "120"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+
+# Cache of HyDE documents and query embeddings, so repeated questions skip both LLM round trips.
+# Entries expire after the TTL and whenever the indexed collection changes.
+# Used by query_cache.py and rag_agentic.py
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "true").lower() == "true"
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1024"))
+# On-disk tier (set to an empty string to keep the cache in memory only)
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", os.path.join(CHROMA_DB_PATH, "query_cache.sqlite3"))
+
+# Opt-in semantic answer cache: a question whose embedding is at least this cosine-similar to a
+# previously answered one gets the stored answer, as long as its source chunks are still indexed
+# Used by semantic_cache.py and rag_agentic.py
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", os.path.join(CHROMA_DB_PATH, "semantic_cache.sqlite3"))
+
+# Retrieval strategy: "multi" searches with the raw question right away while HyDE (and optional
+# LLM rewrites) run concurrently, then merges the result lists with reciprocal rank fusion;
+# "hyde" is the original sequential HyDE-only search
+# Used by rag_agentic.py
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "multi")
+# Number of LLM query rewrites searched in "multi" mode (0 = none)
+QUERY_REWRITES = int(os.getenv("QUERY_REWRITES", "0"))
+# Reciprocal rank fusion smoothing constant
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Re-ranking of the retrieved candidates before the top N reach the LLM:
+# "auto" (cross-encoder if sentence-transformers is installed, else lexical), "cross-encoder",
+# "ollama" (LLM relevance judge), "lexical" (BM25 + vector similarity) or "none" (keep retrieval order)
+# Used by reranker.py
+RERANKER = os.getenv("RERANKER", "auto")
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANKER_OLLAMA_MODEL = os.getenv("RERANKER_OLLAMA_MODEL", "llama3.2:latest")
+# Only the first M candidates are scored, in batches, until the latency budget is spent
+RERANK_TOP_M = int(os.getenv("RERANK_TOP_M", "30"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "1500"))
+# Scores cached per (question, chunk ID)
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "4096"))
+
+# On-disk BM25 inverted index over chunk text, fused with dense retrieval so exact identifiers,
+# error codes and function names are found; also answers queries when Ollama is unavailable
+# Used by lexical_index.py, ingest_pipeline.py and rag_agentic.py
+LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX_ENABLED", "true").lower() == "true"
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", os.path.join(CHROMA_DB_PATH, "lexical_index.sqlite3"))
+
+# Prompt packing: history, chunks and question are fitted into LLM_CONTEXT_WINDOW tokens and
+# num_ctx is sized per call to what was packed (smaller prompts = faster prefill)
+# Used by context_builder.py and rag_agentic.py
+LLM_CONTEXT_WINDOW = int(os.getenv("LLM_CONTEXT_WINDOW", "8192"))
+# Output cap of the answer call (num_predict); at most half the window
+ANSWER_MAX_TOKENS = int(os.getenv("ANSWER_MAX_TOKENS", "2048"))
+# Tokens reserved for the chat history; older turns are condensed, then dropped
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "1500"))
+# Output cap of the HyDE call (a 3-4 sentence hypothetical answer)
+HYDE_MAX_TOKENS = int(os.getenv("HYDE_MAX_TOKENS", "256"))
+# tiktoken encoding used to count tokens (a character-based estimate is used if it cannot be loaded)
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+# Chunks sharing at least this fraction of their text with a better-ranked chunk are dropped
+CHUNK_DEDUP_THRESHOLD = float(os.getenv("CHUNK_DEDUP_THRESHOLD", "0.8"))
+
+# Shared query service (Streamlit sessions, HTTP API): requests retrieving at once, and answers
+# generated at once (match Ollama's OLLAMA_NUM_PARALLEL); further requests wait for a slot
+# Used by query_service.py
+QUERY_MAX_CONCURRENCY = int(os.getenv("QUERY_MAX_CONCURRENCY", "4"))
+QUERY_MAX_CONCURRENT_GENERATIONS = int(os.getenv("QUERY_MAX_CONCURRENT_GENERATIONS", "2"))
+
+# Micro-batching window for the query embeddings and vector searches of concurrent requests
+# (0 = no batching) and the largest batch
+# Used by query_service.py
+REQUEST_BATCH_WINDOW_MS = float(os.getenv("REQUEST_BATCH_WINDOW_MS", "5"))
+REQUEST_BATCH_MAX_SIZE = int(os.getenv("REQUEST_BATCH_MAX_SIZE", "32"))
+
+# Local HTTP query API (python main.py --mode serve)
+# Used by query_server.py
+SERVE_HOST = os.getenv("SERVE_HOST", "127.0.0.1")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "8765"))
+# Largest top_k / top_n a request may ask for (larger values are rejected with 400): every
+# candidate is fetched, fused and re-ranked, so an unbounded K lets one request stall the
+# shared agent. Matches the Streamlit app's limit.
+SERVE_MAX_TOP_K = int(os.getenv("SERVE_MAX_TOP_K", "100"))
@@ -0,0 +1,232 @@
+import re
+import math
+import threading
+
+from config import (LLM_CONTEXT_WINDOW, ANSWER_MAX_TOKENS, HISTORY_MAX_TOKENS, TOKENIZER_ENCODING,
+                    CHUNK_DEDUP_THRESHOLD)
+
+# Separator between chunks in the context handed to the LLM
+CHUNK_SEPARATOR = "\n\n---\n\n"
+
+# Our token counts come from tiktoken (or a heuristic), not from the model's own tokenizer:
+# keep this much slack when sizing num_ctx so a prompt is never silently truncated by Ollama
+_TOKEN_MARGIN = 0.10
+# num_ctx is rounded up to a multiple of this, so similar prompts share one KV-cache size
+_NUM_CTX_STEP = 512
+_MIN_NUM_CTX = 2048
+
+# Word 5-grams used to detect chunks repeating text of a better-ranked chunk
+_SHINGLE_SIZE = 5
+_WORD = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"(?<=[.?!])\s")
+# Condensed earlier turns are cut to this many tokens each
+_CONDENSED_TURN_TOKENS = 40
+
+_encoding = None
+_encoding_failed = False
+# Concurrent first calls (query service threads) load the encoding once
+_encoding_lock = threading.Lock()
+
+
+def count_tokens(text):
+    """
+    Number of tokens in text, using tiktoken when its encoding can be loaded.
+
+    tiktoken downloads the encoding on first use; offline, a conservative
+    characters-per-token estimate is used instead.
+    """
+    global _encoding, _encoding_failed
+    if not text:
+        return 0
+    if _encoding is None and not _encoding_failed:
+        with _encoding_lock:
+            if _encoding is None and not _encoding_failed:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+                except Exception as e:
+                    _encoding_failed = True
+                    print(f"tiktoken encoding '{TOKENIZER_ENCODING}' unavailable ({type(e).__name__}); "
+                          "estimating token counts.")
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    # ~4 characters per token for English prose; 3 leaves room for code and numbers
+    return math.ceil(len(text) / 3)
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cuts text to at most max_tokens tokens."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text, disallowed_special=())[:max_tokens])
+    return text[:max_tokens * 3]
+
+
+def _shingles(text):
+    words = _WORD.findall(text.lower())
+    if len(words) < _SHINGLE_SIZE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + _SHINGLE_SIZE]) for i in range(len(words) - _SHINGLE_SIZE + 1)}
+
+
+def dedupe_chunks(chunks, threshold=CHUNK_DEDUP_THRESHOLD):
+    """
+    Drops chunks whose text is mostly contained in better-ranked chunks.
+
+    Catches the same passage indexed from copied files and neighbouring chunks that
+    largely repeat each other through the splitter's overlap.
+
+    Args:
+        chunks (list[str]): Chunks, best first.
+        threshold (float): Share of a chunk's word 5-grams already seen above which it is dropped.
+
+    Returns:
+        list[int]: Indices of the chunks to keep, in their original order.
+    """
+    kept = []
+    seen = set()
+    for i, chunk in enumerate(chunks):
+        shingles = _shingles(chunk)
+        if shingles and len(shingles & seen) / len(shingles) >= threshold:
+            continue
+        kept.append(i)
+        seen |= shingles
+    return kept
+
+
+def _condense(message):
+    """First sentence of a message, capped at a few tokens: an extractive summary of a turn."""
+    first = _SENTENCE_END.split(" ".join(message.split()), maxsplit=1)[0]
+    condensed = truncate_to_tokens(first, _CONDENSED_TURN_TOKENS)
+    return condensed if condensed == first else condensed + " ..."
+
+
+def llm_options(messages, num_predict, context_window=LLM_CONTEXT_WINDOW):
+    """
+    num_ctx / num_predict sized for one call: the prompt plus the expected output, not a fixed
+    8000-token window. A smaller num_ctx means a smaller KV cache and faster prefill.
+
+    Returns:
+        dict: Ollama options with 'num_ctx' and 'num_predict'.
+    """
+    prompt_tokens = sum(count_tokens(m["content"]) for m in messages)
+    return {"num_ctx": _num_ctx(prompt_tokens, num_predict, context_window), "num_predict": num_predict}
+
+
+def _num_ctx(prompt_tokens, num_predict, context_window):
+    needed = math.ceil(prompt_tokens * (1 + _TOKEN_MARGIN)) + num_predict
+    num_ctx = max(_MIN_NUM_CTX, math.ceil(needed / _NUM_CTX_STEP) * _NUM_CTX_STEP)
+    return min(num_ctx, context_window)
+
+
+class ContextBuilder:
+    """
+    Packs the answer prompt (system prompt, chat history, retrieved chunks, question) into
+    the model's context window.
+
+    - The answer reserve (num_predict) and the fixed parts (system prompt, template,
+      question) are taken off the window first.
+    - Up to `history_max_tokens` are reserved for the conversation: the newest turns are kept
+      verbatim, older ones are condensed to their first sentence, the oldest are dropped.
+    - Chunks fill the rest in rank order after near-duplicates are removed; chunks that do not
+      fit are skipped (the best chunk is truncated rather than dropped).
+    - num_ctx is then sized to what was actually packed.
+    """
+
+    def __init__(self, context_window=LLM_CONTEXT_WINDOW, max_answer_tokens=ANSWER_MAX_TOKENS,
+                 history_max_tokens=HISTORY_MAX_TOKENS):
+        self.context_window = context_window
+        # Never let the answer take more than half of the window
+        self.num_predict = max(1, min(max_answer_tokens, context_window // 2))
+        self.history_max_tokens = history_max_tokens
+
+    def _pack_history(self, chat_history, budget):
+        """
+        Returns:
+            tuple[str, int, int]: (history text, turns condensed, turns dropped).
+        """
+        lines = [f"{h['speaker']}: {h['message']}" for h in chat_history]
+        kept = []
+        used = 0
+        # Newest turns verbatim while they fit
+        index = len(lines) - 1
+        while index >= 0:
+            cost = count_tokens(lines[index]) + 1
+            if used + cost > budget:
+                break
+            kept.append(lines[index])
+            used += cost
+            index -= 1
+
+        # Older turns condensed while they fit, the rest dropped
+        condensed = []
+        while index >= 0:
+            line = f"{chat_history[index]['speaker']}: {_condense(chat_history[index]['message'])}"
+            cost = count_tokens(line) + 1
+            if used + cost > budget:
+                break
+            condensed.append(line)
+            used += cost
+            index -= 1
+
+        text = "\n".join(reversed(kept))
+        if condensed:
+            text = "(Earlier turns, condensed)\n" + "\n".join(reversed(condensed)) + ("\n\n" + text if text else "")
+        return text, len(condensed), index + 1
+
+    def build(self, template_tokens, chunks, chat_history):
+        """
+        Args:
+            template_tokens (int): Tokens of everything but history and context (system prompt,
+                instructions, question).
+            chunks (list[str]): Retrieved chunks, best first.
+            chat_history (list[dict]): Turns with 'speaker' and 'message', oldest first.
+
+        Returns:
+            dict: 'context' (packed chunks), 'history' (packed conversation), 'kept' (indices of the
+            chunks used), 'prompt_tokens', 'num_ctx', 'num_predict', and 'duplicates', 'skipped',
+            'condensed_turns' and 'dropped_turns' counts.
+        """
+        prompt_budget = math.floor((self.context_window - self.num_predict) / (1 + _TOKEN_MARGIN))
+        available = max(0, prompt_budget - template_tokens)
+
+        history_tokens = sum(count_tokens(f"{h['speaker']}: {h['message']}") + 1 for h in chat_history)
+        history_budget = min(history_tokens, self.history_max_tokens, available)
+
+        # --- Chunks ---
+        unique = dedupe_chunks(chunks)
+        chunk_budget = available - history_budget
+        kept, parts, used = [], [], 0
+        separator_tokens = count_tokens(CHUNK_SEPARATOR)
+        for i in unique:
+            cost = count_tokens(chunks[i]) + (separator_tokens if parts else 0)
+            if used + cost <= chunk_budget:
+                kept.append(i)
+                parts.append(chunks[i])
+                used += cost
+            elif not parts and chunk_budget > 0:
+                # Better a truncated best chunk than no context at all
+                kept.append(i)
+                parts.append(truncate_to_tokens(chunks[i], chunk_budget))
+                used = count_tokens(parts[0])
+
+        # --- History (plus whatever the chunks left over, up to the cap) ---
+        history_budget = min(self.history_max_tokens, available - used)
+        history, condensed_turns, dropped_turns = self._pack_history(chat_history, history_budget)
+
+        prompt_tokens = template_tokens + used + count_tokens(history)
+        return {
+            "context": CHUNK_SEPARATOR.join(parts),
+            "history": history,
+            "kept": kept,
+            "prompt_tokens": prompt_tokens,
+            "num_ctx": _num_ctx(prompt_tokens, self.num_predict, self.context_window),
+            "num_predict": self.num_predict,
+            "duplicates": len(chunks) - len(unique),
+            "skipped": len(unique) - len(kept),
+            "condensed_turns": condensed_turns,
+            "dropped_turns": dropped_turns,
+        }
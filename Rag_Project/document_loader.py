@@ -0,0 +1,162 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+# Changed to use UnstructuredPDFLoader for better handling of complex PDF layouts
+from langchain_community.document_loaders import UnstructuredPDFLoader, UnstructuredMarkdownLoader
+
+# How often the dispatcher wakes up to check for files exceeding their timeout
+_POLL_SECONDS = 0.5
+
+
+def load_document(filepath):
+    """
+    Parses a single .pdf or .md file into LangChain Documents.
+
+    Kept at module level so it can be pickled and executed inside a worker process.
+    """
+    loader = UnstructuredPDFLoader(filepath) if filepath.endswith(".pdf") else UnstructuredMarkdownLoader(filepath)
+    return loader.load()
+
+
+class FileParseTimeout(Exception):
+    """Reported for a file that exceeded the per-file parse timeout."""
+
+
+class WorkerCrashed(Exception):
+    """Reported for a file whose parsing killed its worker process."""
+
+
+class ParallelDocumentLoader:
+    """
+    Parses documents across a ProcessPoolExecutor with per-file timeouts and crash isolation.
+
+    - At most `max_workers` files are in flight, so each submitted file is actually running
+      and its timeout clock starts at submission.
+    - A file that runs longer than `timeout` seconds is reported as failed; the pool is torn
+      down (killing the hung worker) and the other in-flight files are resubmitted.
+    - If a worker dies (e.g. a segfault inside unstructured), the pool is rebuilt and every file
+      that was in flight is retried on its own, so the culprit is identified without taking
+      innocent files down with it.
+
+    Results are yielded in completion order.
+    """
+
+    def __init__(self, max_workers, timeout=300.0, load_fn=load_document):
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        self.load_fn = load_fn
+        self._executor = None
+
+    def _new_executor(self):
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def _kill_executor(self):
+        """Terminates all worker processes, including hung ones that shutdown() would wait on."""
+        if self._executor is None:
+            return
+        # ProcessPoolExecutor has no public API to kill a stuck worker
+        for process in list(getattr(self._executor, "_processes", {}).values()):
+            try:
+                process.kill()
+            except Exception:
+                pass
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    def imap(self, jobs):
+        """
+        Parses files in parallel.
+
+        Args:
+            jobs (Iterable[tuple[str, Any]]): (filepath, context) pairs. The iterable is consumed
+                lazily, only as fast as worker slots free up. `context` is passed through untouched.
+
+        Yields:
+            tuple[str, Any, list | None, Exception | None]:
+                (filepath, context, documents, error) in completion order. Exactly one of
+                documents / error is None.
+        """
+        jobs = iter(jobs)
+        pending = deque()  # Jobs to (re)submit before pulling new ones
+        suspects = deque()  # Jobs that were in flight when a worker crashed; run one at a time
+        in_flight = {}  # future -> (filepath, context, started_at, isolated)
+        exhausted = False
+
+        self._new_executor()
+        try:
+            while True:
+                # 1. Fill free worker slots. While isolating suspects, run exactly one of them alone.
+                while not in_flight and suspects:
+                    filepath, context = suspects.popleft()
+                    future = self._executor.submit(self.load_fn, filepath)
+                    in_flight[future] = (filepath, context, time.monotonic(), True)
+
+                while not suspects and len(in_flight) < self.max_workers:
+                    if pending:
+                        filepath, context = pending.popleft()
+                    elif not exhausted:
+                        try:
+                            filepath, context = next(jobs)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                    else:
+                        break
+                    future = self._executor.submit(self.load_fn, filepath)
+                    in_flight[future] = (filepath, context, time.monotonic(), False)
+
+                if not in_flight:
+                    if exhausted and not pending and not suspects:
+                        return
+                    continue
+
+                # 2. Wait for something to finish (or for the next timeout check)
+                done, _ = wait(list(in_flight), timeout=_POLL_SECONDS, return_when=FIRST_COMPLETED)
+
+                broken = False
+                for future in done:
+                    filepath, context, _, isolated = in_flight.pop(future)
+                    try:
+                        documents = future.result()
+                    except BrokenProcessPool:
+                        broken = True
+                        if isolated:
+                            # Ran alone and still killed the worker: this file is the culprit
+                            yield filepath, context, None, WorkerCrashed(
+                                f"Worker process died while parsing {os.path.basename(filepath)}")
+                        else:
+                            suspects.append((filepath, context))
+                        continue
+                    except Exception as e:
+                        yield filepath, context, None, e
+                        continue
+                    yield filepath, context, documents, None
+
+                if broken:
+                    # Every other in-flight future is doomed as well; retry them in isolation
+                    for future, (filepath, context, _, _) in in_flight.items():
+                        suspects.append((filepath, context))
+                    in_flight.clear()
+                    self._kill_executor()
+                    self._new_executor()
+                    continue
+
+                # 3. Enforce the per-file timeout
+                now = time.monotonic()
+                timed_out = [f for f, (_, _, started, _) in in_flight.items() if now - started > self.timeout]
+                if timed_out:
+                    for future in timed_out:
+                        filepath, context, _, _ = in_flight.pop(future)
+                        yield filepath, context, None, FileParseTimeout(
+                            f"Parsing {os.path.basename(filepath)} exceeded {self.timeout:.0f}s")
+                    # Killing the hung worker means rebuilding the pool; innocent files start over
+                    for future, (filepath, context, _, isolated) in in_flight.items():
+                        (suspects if isolated else pending).append((filepath, context))
+                    in_flight.clear()
+                    self._kill_executor()
+                    self._new_executor()
+        finally:
+            self._kill_executor()
@@ -0,0 +1,167 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import time
+from array import array
+
+from config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_MB
+
+# SQLite limits the number of bound parameters per statement; stay well below it
+_SQL_PARAM_CHUNK = 500
+
+# After an eviction, shrink to this fraction of the limit so we don't evict on every insert
+_EVICTION_TARGET_RATIO = 0.9
+
+
+def content_hash(text):
+    """SHA-256 of a chunk's text. This is the same hash IngestPipeline uses for chunk IDs."""
+    return hashlib.sha256(text.encode('utf-8', errors='ignore')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed embedding cache backed by SQLite.
+
+    Vectors are stored as packed float32 blobs keyed by (embedding model, chunk hash),
+    so unchanged chunks never need to be re-embedded: not after a file edit, not after
+    a --mode wipe, and not when the same paragraph appears in many notes.
+
+    The cache is size-bounded. Every hit refreshes an entry's `last_used` stamp and,
+    once the stored vectors exceed `max_bytes`, the least recently used entries are evicted.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_bytes=EMBEDDING_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        # Called from whichever thread runs the embedder's event loop, so the connection is
+        # not tied to the thread that opened it and the lock serializes access to it
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model     TEXT    NOT NULL,
+                text_hash TEXT    NOT NULL,
+                vector    BLOB    NOT NULL,
+                nbytes    INTEGER NOT NULL,
+                last_used INTEGER NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+        # Track the total payload size in memory so eviction checks are free
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model, hashes):
+        """
+        Looks up cached vectors.
+
+        Args:
+            model (str): Embedding model name.
+            hashes (list[str]): Chunk hashes to look up.
+
+        Returns:
+            dict[str, list[float]]: Mapping of hash -> vector for every cache hit.
+        """
+        found = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        with self._lock:
+            for i in range(0, len(unique_hashes), _SQL_PARAM_CHUNK):
+                part = unique_hashes[i:i + _SQL_PARAM_CHUNK]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *part]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    vector = array('f')
+                    vector.frombytes(blob)
+                    found[text_hash] = vector.tolist()
+
+            if found:
+                # Refresh recency for LRU eviction
+                now = time.time_ns()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found]
+                )
+                self._conn.commit()
+
+        self.hits += len(found)
+        self.misses += len(unique_hashes) - len(found)
+        return found
+
+    def put_many(self, model, items):
+        """
+        Stores vectors and evicts least recently used entries if the size limit is exceeded.
+
+        Args:
+            model (str): Embedding model name.
+            items (list[tuple[str, list[float]]]): (hash, vector) pairs.
+        """
+        if not items:
+            return
+
+        now = time.time_ns()
+        rows = []
+        for text_hash, vector in items:
+            blob = array('f', vector).tobytes()
+            rows.append((model, text_hash, blob, len(blob), now))
+
+        with self._lock:
+            # Subtract the size of rows we are about to overwrite so the running total stays exact
+            replaced = 0
+            hashes = [r[1] for r in rows]
+            for i in range(0, len(hashes), _SQL_PARAM_CHUNK):
+                part = hashes[i:i + _SQL_PARAM_CHUNK]
+                placeholders = ",".join("?" * len(part))
+                replaced += self._conn.execute(
+                    f"SELECT COALESCE(SUM(nbytes), 0) FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *part]
+                ).fetchone()[0]
+
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, nbytes, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._total_bytes += sum(r[3] for r in rows) - replaced
+
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Deletes least recently used entries until the cache is below the target size. Lock must be held."""
+        target = int(self.max_bytes * _EVICTION_TARGET_RATIO)
+        cursor = self._conn.execute("SELECT model, text_hash, nbytes FROM embeddings ORDER BY last_used ASC")
+        victims = []
+        freed = 0
+        for model, text_hash, nbytes in cursor:
+            if self._total_bytes - freed <= target:
+                break
+            victims.append((model, text_hash))
+            freed += nbytes
+        cursor.close()
+
+        self._conn.executemany("DELETE FROM embeddings WHERE model = ? AND text_hash = ?", victims)
+        self._total_bytes -= freed
+
+    def size_bytes(self):
+        """Returns the total size of all cached vectors in bytes."""
+        return self._total_bytes
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
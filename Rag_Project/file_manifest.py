@@ -0,0 +1,348 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import FILE_MANIFEST_PATH
+from search_filters import file_type_of
+
+# SQLite limits the number of bound parameters per statement; stay well below it
+_SQL_PARAM_CHUNK = 500
+
+
+class FileManifest:
+    """
+    Persistent, indexed record of every indexed source file.
+
+    One row per file (path, size, mtime, inode, content hash) plus the IDs of the chunks
+    it produced. Change detection becomes a primary-key lookup per file instead of a
+    scan over the metadata of every chunk in the vector database.
+
+    The manifest is always written AFTER the matching vector DB operation succeeds
+    (upsert before record_files, delete before remove_file). If a run dies in between,
+    the manifest still describes the previous state and the file is simply re-detected
+    as changed on the next run.
+
+    The files table doubles as the secondary index for filtered retrieval: path prefixes
+    are range scans on the primary key, and file types and mtimes have indexes of their
+    own (see matching_files).
+    """
+
+    def __init__(self, path=FILE_MANIFEST_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        # Shared by the pipeline's producer thread and the event loop thread
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path       TEXT PRIMARY KEY,
+                size       INTEGER,
+                mtime      REAL,
+                mtime_ns   INTEGER,
+                inode      INTEGER,
+                file_hash  TEXT NOT NULL,
+                indexed_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_files_hash ON files(file_hash);
+
+            CREATE TABLE IF NOT EXISTS file_chunks (
+                path     TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                PRIMARY KEY (path, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_file_chunks_chunk ON file_chunks(chunk_id);
+
+            CREATE TABLE IF NOT EXISTS meta (
+                key   TEXT PRIMARY KEY,
+                value TEXT
+            );
+            """
+        )
+        # Manifests created before filtered retrieval have no file_type column yet
+        if "file_type" not in [row[1] for row in self._conn.execute("PRAGMA table_info(files)")]:
+            with self.transaction():
+                self._conn.execute("ALTER TABLE files ADD COLUMN file_type TEXT")
+                self._conn.executemany("UPDATE files SET file_type = ? WHERE path = ?",
+                                       [(file_type_of(path), path)
+                                        for (path,) in self._conn.execute("SELECT path FROM files").fetchall()])
+        self._conn.executescript(
+            """
+            CREATE INDEX IF NOT EXISTS idx_files_type ON files(file_type, mtime);
+            CREATE INDEX IF NOT EXISTS idx_files_mtime ON files(mtime);
+            """
+        )
+
+    @contextmanager
+    def transaction(self):
+        """Groups several writes into one atomic SQLite transaction."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _row_to_record(self, row):
+        path, size, mtime, mtime_ns, inode, file_hash, indexed_at = row
+        chunk_ids = [r[0] for r in self._conn.execute(
+            "SELECT chunk_id FROM file_chunks WHERE path = ?", (path,))]
+        return {
+            "path": path,
+            "size": size,
+            "mtime": mtime,
+            "mtime_ns": mtime_ns,
+            "inode": inode,
+            "file_hash": file_hash,
+            "indexed_at": indexed_at,
+            "chunk_ids": chunk_ids,
+        }
+
+    def get(self, path):
+        """Returns the record for one file (including its chunk IDs), or None if it was never indexed."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path, size, mtime, mtime_ns, inode, file_hash, indexed_at FROM files WHERE path = ?",
+                (path,)
+            ).fetchone()
+            return self._row_to_record(row) if row else None
+
+    def find_by_hash(self, file_hash):
+        """Returns the records of every indexed file with the given content hash."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, mtime, mtime_ns, inode, file_hash, indexed_at FROM files WHERE file_hash = ?",
+                (file_hash,)
+            ).fetchall()
+            return [self._row_to_record(row) for row in rows]
+
+    def paths_under(self, folder):
+        """Returns all indexed paths inside folder, using an index range scan on the primary key."""
+        prefix = os.path.join(os.path.abspath(folder), "")
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM files WHERE path >= ? AND path < ?",
+                (prefix, prefix + "\U0010ffff")
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def matching_files(self, search_filter, root):
+        """
+        Returns the indexed paths matching a SearchFilter, resolved on the manifest's indexes:
+        one primary-key range scan per path prefix, the file_type and the mtime indexes.
+
+        Args:
+            search_filter (SearchFilter): The conditions to apply.
+            root (str): Folder that relative path prefixes are relative to.
+        """
+        clauses, params = [], []
+        prefixes = search_filter.resolved_prefixes(root)
+        if prefixes:
+            ranges = []
+            for prefix in prefixes:
+                folder = os.path.join(prefix, "")
+                ranges.append("path = ? OR (path >= ? AND path < ?)")
+                params += [prefix, folder, folder + "\U0010ffff"]
+            clauses.append("(" + " OR ".join(f"({r})" for r in ranges) + ")")
+        if search_filter.file_types:
+            clauses.append(f"file_type IN ({','.join('?' * len(search_filter.file_types))})")
+            params += search_filter.file_types
+        if search_filter.modified_after is not None:
+            clauses.append("mtime >= ?")
+            params.append(search_filter.modified_after)
+        if search_filter.modified_before is not None:
+            clauses.append("mtime <= ?")
+            params.append(search_filter.modified_before)
+        sql = "SELECT path FROM files" + (" WHERE " + " AND ".join(clauses) if clauses else "")
+        with self._lock:
+            return [r[0] for r in self._conn.execute(sql, params)]
+
+    def chunk_sources(self, paths):
+        """
+        Maps every chunk produced by the given files to those of the files containing it.
+
+        A chunk shared by several files is stored once, with the first indexed file as its
+        source, which may lie outside the given files.
+        """
+        paths = list(paths)
+        sources = {}
+        with self._lock:
+            for i in range(0, len(paths), _SQL_PARAM_CHUNK):
+                part = paths[i:i + _SQL_PARAM_CHUNK]
+                for path, chunk_id in self._conn.execute(
+                        f"SELECT path, chunk_id FROM file_chunks WHERE path IN ({','.join('?' * len(part))})", part):
+                    sources.setdefault(chunk_id, []).append(path)
+        return sources
+
+    def file_types(self):
+        """Returns the distinct file types of the indexed files (for filter pickers)."""
+        with self._lock:
+            return [r[0] for r in self._conn.execute(
+                "SELECT DISTINCT file_type FROM files WHERE file_type IS NOT NULL AND file_type != '' "
+                "ORDER BY file_type")]
+
+    def orphaned_chunk_ids(self, chunk_ids, paths):
+        """
+        Filters chunk_ids down to the ones no file outside `paths` still references.
+
+        Identical chunks in different files share one ID, so deleting a file must not
+        remove chunks another file still needs.
+        """
+        chunk_ids = list(dict.fromkeys(chunk_ids))
+        paths = list(paths)
+        path_placeholders = ",".join("?" * len(paths))
+        shared = set()
+        with self._lock:
+            for i in range(0, len(chunk_ids), _SQL_PARAM_CHUNK):
+                part = chunk_ids[i:i + _SQL_PARAM_CHUNK]
+                placeholders = ",".join("?" * len(part))
+                shared.update(r[0] for r in self._conn.execute(
+                    f"SELECT chunk_id FROM file_chunks "
+                    f"WHERE path NOT IN ({path_placeholders}) AND chunk_id IN ({placeholders})",
+                    [*paths, *part]
+                ))
+        return [c for c in chunk_ids if c not in shared]
+
+    def chunk_owners(self, chunk_ids, paths):
+        """
+        Maps each of chunk_ids that a file outside `paths` still references to one such file
+        (the first by path), e.g. to re-label shared chunks when a file is removed.
+        """
+        chunk_ids = list(dict.fromkeys(chunk_ids))
+        paths = list(paths)
+        path_placeholders = ",".join("?" * len(paths))
+        owners = {}
+        with self._lock:
+            for i in range(0, len(chunk_ids), _SQL_PARAM_CHUNK):
+                part = chunk_ids[i:i + _SQL_PARAM_CHUNK]
+                placeholders = ",".join("?" * len(part))
+                owners.update(self._conn.execute(
+                    f"SELECT chunk_id, MIN(path) FROM file_chunks "
+                    f"WHERE path NOT IN ({path_placeholders}) AND chunk_id IN ({placeholders}) GROUP BY chunk_id",
+                    [*paths, *part]
+                ).fetchall())
+        return owners
+
+    def record_files(self, records):
+        """
+        Inserts or replaces file records and their chunk IDs in a single transaction.
+
+        Args:
+            records (list[dict]): Dicts with keys path, size, mtime, mtime_ns, inode,
+                file_hash and chunk_ids. An optional 'replaces' key names the old path of a
+                moved file, whose record is removed in the same transaction.
+        """
+        if not records:
+            return
+        now = str(datetime.now())
+        with self.transaction():
+            for r in records:
+                if r.get("replaces"):
+                    self._conn.execute("DELETE FROM file_chunks WHERE path = ?", (r["replaces"],))
+                    self._conn.execute("DELETE FROM files WHERE path = ?", (r["replaces"],))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO files (path, size, mtime, mtime_ns, inode, file_hash, indexed_at, file_type) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (r["path"], r.get("size"), r.get("mtime"), r.get("mtime_ns"), r.get("inode"),
+                     r["file_hash"], now, file_type_of(r["path"]))
+                )
+                self._conn.execute("DELETE FROM file_chunks WHERE path = ?", (r["path"],))
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO file_chunks (path, chunk_id) VALUES (?, ?)",
+                    [(r["path"], chunk_id) for chunk_id in r["chunk_ids"]]
+                )
+            self._bump_generation()
+
+    def update_stat(self, file_info):
+        """Refreshes the stored size/mtime/inode of a file whose content did not change."""
+        with self.transaction():
+            self._conn.execute(
+                "UPDATE files SET size = ?, mtime = ?, mtime_ns = ?, inode = ? WHERE path = ?",
+                (file_info["size"], file_info["mtime"], file_info["mtime_ns"], file_info["inode"], file_info["path"])
+            )
+
+    def remove_file(self, path):
+        """Deletes a file record and its chunk list."""
+        with self.transaction():
+            self._conn.execute("DELETE FROM file_chunks WHERE path = ?", (path,))
+            self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+            self._bump_generation()
+
+    def clear(self):
+        """Forgets every file, e.g. after the vector database was wiped."""
+        with self.transaction():
+            self._conn.execute("DELETE FROM file_chunks")
+            self._conn.execute("DELETE FROM files")
+            # An empty collection holds no legacy vectors; the next index run records the flag again
+            self._conn.execute("DELETE FROM meta WHERE key = 'unit_vectors'")
+            self._bump_generation()
+
+    def unit_vectors(self):
+        """
+        Whether the collection's embeddings are unit-length (L2-normalized, what the embedder
+        produces): True / False, or None if never recorded (collections indexed before the flag).
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'unit_vectors'").fetchone()
+        return None if row is None else row[0] == "1"
+
+    def set_unit_vectors(self, value):
+        with self.transaction():
+            self._conn.execute("INSERT INTO meta (key, value) VALUES ('unit_vectors', ?) "
+                               "ON CONFLICT(key) DO UPDATE SET value = excluded.value", ("1" if value else "0",))
+
+    def _bump_generation(self):
+        """Increments the change counter. Must be called inside a transaction."""
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('generation', '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    def generation(self):
+        """Returns a counter that changes whenever the indexed file set changes."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return int(row[0]) if row else 0
+
+    def file_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def bootstrap_from_collection(self, collection):
+        """
+        One-time migration for vector databases indexed before the manifest existed.
+
+        Rebuilds file records from chunk metadata. size/mtime_ns/inode are left empty so
+        the next run falls back to comparing content hashes for these files.
+
+        Returns:
+            int: Number of files recorded.
+        """
+        db_results = collection.get(include=['metadatas'])
+
+        files = {}
+        for chunk_id, md in zip(db_results.get('ids', []), db_results.get('metadatas', [])):
+            source = md.get('source') if md else None
+            if not source or not md.get('file_hash'):
+                continue
+            record = files.setdefault(source, {
+                "path": source,
+                "mtime": md.get('file_mtime'),
+                "file_hash": md['file_hash'],
+                "chunk_ids": [],
+            })
+            record["chunk_ids"].append(chunk_id)
+
+        self.record_files(list(files.values()))
+        return len(files)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
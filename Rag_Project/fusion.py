@@ -0,0 +1,27 @@
+def reciprocal_rank_fusion(ranked_lists, k=60):
+    """
+    Merges several ranked lists of IDs with Reciprocal Rank Fusion.
+
+    Each ID scores sum(1 / (k + rank)) over the lists it appears in (rank starts at 1).
+    Only ranks are used, so lists produced by different query vectors (raw question,
+    HyDE document, rewrites) or different retrievers can be merged without calibrating
+    their distance scales. k = 60 is the constant from the original RRF paper; larger
+    values flatten the advantage of top ranks.
+
+    Args:
+        ranked_lists (list[list[str]]): Best-first ID lists. Duplicates within a list count once.
+        k (int): Rank smoothing constant.
+
+    Returns:
+        list[tuple[str, float]]: (id, fused score) pairs, best first.
+    """
+    scores = {}
+    for ranked in ranked_lists:
+        seen = set()
+        for rank, item_id in enumerate(ranked, start=1):
+            if item_id in seen:
+                continue
+            seen.add(item_id)
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    # sorted() is stable: ties keep first-seen order, i.e. the earlier list wins
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
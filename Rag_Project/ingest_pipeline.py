@@ -1,23 +1,45 @@
 import os
 import hashlib
+import functools
 import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import uuid
 import rich
 import json  # CRITICAL: Needed for metadata sanitization
 from rich.progress import track
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-# Changed to use UnstructuredPDFLoader for better handling of complex PDF layouts
-from langchain_community.document_loaders import UnstructuredPDFLoader, UnstructuredMarkdownLoader
 
 # External dependencies (assumed to be available in the project structure)
 from rag_embedder import OllamaBatchEmbedder
-from vector_db_factory import get_vector_db
+from embedding_cache import EmbeddingCache, content_hash
+from document_loader import load_document, ParallelDocumentLoader
+from text_normalizer import normalize_texts
+from vector_db_factory import open_collection
+from config import (EMBEDDING_CACHE_ENABLED, PARSE_WORKERS, PARSE_TIMEOUT_SECONDS, HASH_WORKERS,
+                    TEXT_NORMALIZATION_ENABLED, COLLECTION_NAME)
 
 # --- Configuration & Memory Management Constants ---
 # NOTE: The constants are now assumed to be in the global scope or imported from config.py
 EMBEDDING_API_BATCH_SIZE = 1000  # Default to high speed
-VECTOR_DB_COMMIT_BATCH_SIZE = 1000
+VECTOR_DB_COMMIT_BATCH_SIZE = 1000  # Chunks per vector DB write, independent of the embedding batch size
+# Embedded batches allowed to wait for the vector DB writer. When the writer falls behind,
+# the embed stage blocks (backpressure) instead of piling embeddings up in memory.
+MAX_INFLIGHT_COMMIT_BATCHES = 2
+
+# --- Streaming Pipeline Constants ---
+# Bounded queues between the stages of index_folder(). Peak memory is proportional
+# to these sizes (plus one embedding batch), not to the size of the corpus.
+INGEST_DOC_QUEUE_SIZE = 8  # Parsed files waiting to be split
+INGEST_CHUNK_QUEUE_SIZE = 2000  # Chunks waiting to be embedded
+# If no new chunk arrives within this many seconds, a partial batch is embedded and
+# committed anyway, so early files become queryable while slow PDFs are still parsing.
+INGEST_FLUSH_SECONDS = 2.0
+
+# Sentinel marking the end of a stage's output
+_END_OF_STREAM = object()
 
 console = rich.get_console()
 
@@ -35,134 +57,437 @@ def _get_file_sha256(filepath, block_size=65536):
         return None
 
 
+def is_supported_file(path):
+    """True for the document types the pipeline indexes (.pdf, .md)."""
+    return path.endswith((".pdf", ".md"))
+
+
+def _discover_files(folder):
+    """Yields every relevant file (.pdf, .md) under folder, lazily."""
+    for root, _, fs in os.walk(folder):
+        for f in fs:
+            if is_supported_file(f):
+                yield os.path.join(root, f)
+
+
+def _sanitize_metadata(metadata):
+    """
+    Converts metadata values into types ChromaDB accepts (str, int, float).
+    """
+    sanitized_metadata = {}
+    for key, value in metadata.items():
+        # ChromaDB only supports str, int, float for metadata values
+        if isinstance(value, (str, int, float)):
+            # Handle potential NaN, Inf/-Inf floats which break JSON/Chroma
+            if isinstance(value, float) and (value != value or value in [float('inf'), float('-inf')]):
+                sanitized_metadata[key] = str(value)
+            else:
+                sanitized_metadata[key] = value
+        else:
+            # Convert all other complex types (e.g., lists, dicts) to JSON string
+            try:
+                sanitized_metadata[key] = json.dumps(value)
+            except:
+                # Fallback to string representation if JSON serialization fails
+                sanitized_metadata[key] = str(value)
+    return sanitized_metadata
+
+
 class IngestPipeline:
     """
     Handles incremental loading, chunking, embedding, and indexing of documents
     into the vector database.
+
+    Two entry points exist:
+      - parse_docs() + index_docs(): the original parse-everything-then-index flow.
+      - index_folder(): a streaming pipeline (discover -> hash -> load -> split ->
+        embed -> upsert) with bounded queues between stages.
+
+    Each pipeline writes to one named collection (default COLLECTION_NAME): its own vector
+    store collection, file manifest and lexical index, independent of all other collections.
     """
 
-    def __init__(self):
-        self.collection = get_vector_db()
-        self.embedder = OllamaBatchEmbedder()
+    def __init__(self, parse_workers=PARSE_WORKERS, parse_timeout=PARSE_TIMEOUT_SECONDS, verify=False,
+                 normalize=TEXT_NORMALIZATION_ENABLED, collection=COLLECTION_NAME):
+        shard = open_collection(collection)
+        self.collection_name = shard.name
+        self.collection = shard.collection
+        # The embedding cache lets unchanged chunks skip Ollama entirely on re-index
+        self.embedder = OllamaBatchEmbedder(cache=EmbeddingCache() if EMBEDDING_CACHE_ENABLED else None)
+        self.splitter = RecursiveCharacterTextSplitter(chunk_size=512, chunk_overlap=60)
+        # Fix run-together words/numbers in chunk text before it is stored and embedded
+        self.normalize = normalize
+        # Single writer thread: vector DB writes are serialized and never block the event loop
+        self._commit_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vector-db-commit")
+        # Parallel parsing settings used by index_folder() (0 workers = serial, in-process parsing)
+        self.parse_workers = parse_workers
+        self.parse_timeout = parse_timeout
+        # verify=True hashes every file instead of trusting matching (size, mtime_ns, inode)
+        self.verify = verify
+        # Indexed per-file state (hash, stat, chunk IDs) used for change detection and cleanup
+        self.manifest = shard.manifest
+        self._manifest_checked = False
+        # BM25 inverted index over chunk text, kept in step with the vector DB (None = disabled)
+        self.lexical_index = shard.lexical_index
+        # Files loaded by parse_docs() that index_docs() still has to record in the manifest
+        self._parsed_files = {}
+
+    def _ensure_manifest(self, allow_legacy=False):
+        """
+        Makes sure the file manifest describes the collection. Databases indexed before
+        the manifest existed are migrated once with a single metadata scan.
 
-    def parse_docs(self, folder):
+        Raises ValueError if the collection holds embeddings from before vector normalization
+        (unless allow_legacy, which only the reembed migration sets): new unit-length vectors
+        cannot be mixed with them under L2 distance.
         """
-        Scans a folder, checks files for modifications using mtime and content hash.
-        CRITICAL UPDATE: Now checks for identical content (file_hash) at a new location
-        to prevent unnecessary re-embedding of moved files.
+        if not self._manifest_checked:
+            self._manifest_checked = True
+            if self.manifest.unit_vectors() is None:
+                # Collections indexed before embeddings were L2-normalized hold the unnormalized
+                # /api/embeddings vectors. Only an empty collection is known to be consistent.
+                self.manifest.set_unit_vectors(self.collection.count() == 0)
+            if self.manifest.file_count() == 0 and self.collection.count() > 0:
+                console.print("[cyan]Building file manifest from existing collection (one-time migration)...[/cyan]")
+                migrated = self.manifest.bootstrap_from_collection(self.collection)
+                console.print(f"[cyan]Manifest created for {migrated} indexed files.[/cyan]")
+            if self.lexical_index is not None and self.lexical_index.chunk_count() == 0 and self.collection.count() > 0:
+                console.print("[cyan]Building lexical index from existing collection (one-time migration)...[/cyan]")
+                indexed = self.lexical_index.bootstrap_from_collection(self.collection)
+                console.print(f"[cyan]Lexical index created for {indexed} chunks.[/cyan]")
+        if not allow_legacy and not self.manifest.unit_vectors():
+            raise ValueError(f"Collection '{self.collection_name}' holds embeddings from before vector normalization; "
+                             f"run 'python main.py --mode reembed --collection {self.collection_name}' "
+                             "before writing to it")
+
+    def check_writable(self):
+        """Raises ValueError if new chunks cannot be added to the collection yet (see _ensure_manifest)."""
+        self._ensure_manifest()
+
+    def _delete_chunks(self, chunk_ids):
+        """Deletes chunks from the vector database and the lexical index."""
+        self.collection.delete(ids=chunk_ids)
+        if self.lexical_index is not None:
+            self.lexical_index.remove_chunks(chunk_ids)
+
+    def _remove_indexed_file(self, record):
         """
-        docs = []
-        files = []
-
-        # 1. Collect all relevant files (.pdf, .md)
-        for root, _, fs in os.walk(folder):
-            for f in fs:
-                if f.endswith((".pdf", ".md")):
-                    files.append(os.path.join(root, f))
-
-        # 2. Get all unique source paths and their associated hashes from the database
-        db_results = self.collection.get(include=['metadatas'])
-
-        # Mapping: file_hash -> set of (source_path, mtime)
-        hash_to_sources = {}
-        for md in db_results.get('metadatas', []):
-            f_hash = md.get('file_hash')
-            f_source = md.get('source')
-            f_mtime = md.get('file_mtime')
-            if f_hash and f_source:
-                if f_hash not in hash_to_sources:
-                    hash_to_sources[f_hash] = set()
-                # We store the mtime from the database to ensure we use the same mtime consistently
-                hash_to_sources[f_hash].add((f_source, f_mtime))
-
-        # 3. Processing Loop
-        for filepath in track(files, description="Parsing documents"):
-            try:
-                current_source_key = os.path.abspath(filepath)
-                file_mtime = os.path.getmtime(filepath)
-                file_hash = _get_file_sha256(filepath)
+        Deletes a file's chunks from the vector database, then its manifest record.
 
-                if not file_hash:
-                    continue  # Skip if hashing failed
+        Chunks that another indexed file still references (identical text) are kept, and
+        re-labelled with that file if they named the removed one as their source.
+        """
+        orphaned_ids = self.manifest.orphaned_chunk_ids(record["chunk_ids"], [record["path"]])
+        if orphaned_ids:
+            self._delete_chunks(orphaned_ids)
+        orphaned = set(orphaned_ids)
+        self._relabel_kept_chunks([c for c in record["chunk_ids"] if c not in orphaned], record["path"])
+        self.manifest.remove_file(record["path"])
+        return len(orphaned_ids)
+
+    def _relabel_kept_chunks(self, chunk_ids, removed_path):
+        """
+        Points shared chunks whose stored source is a removed file at a file that still
+        contains them (source, file_mtime and file_hash from its manifest record).
+        """
+        owners = self.manifest.chunk_owners(chunk_ids, [removed_path])
+        if not owners:
+            return
+        stored = self.collection.get(ids=list(owners), include=['metadatas'])
+        owner_records = {}
+        ids, metadatas = [], []
+        for chunk_id, metadata in zip(stored['ids'], stored['metadatas']):
+            if (metadata or {}).get("source") != removed_path:
+                continue
+            owner = owners[chunk_id]
+            if owner not in owner_records:
+                owner_records[owner] = self.manifest.get(owner)
+            owner_record = owner_records[owner]
+            if owner_record is None:
+                continue
+            ids.append(chunk_id)
+            relabelled = {"source": owner, "file_mtime": owner_record["mtime"], "file_hash": owner_record["file_hash"]}
+            metadatas.append(_sanitize_metadata(
+                {**metadata, **{key: value for key, value in relabelled.items() if value is not None}}))
+        if ids:
+            self.collection.update(ids=ids, metadatas=metadatas)
+
+    def _stat_file(self, filepath):
+        """
+        Stat-first check: compares (size, mtime_ns, inode) with the manifest record.
 
-                # Check 1: Does the content hash already exist in the database?
-                if file_hash in hash_to_sources:
+        Returns:
+            tuple[dict, dict | None] | None: (file_info, manifest_record) if the file must be
+            hashed, or None if all three match (unchanged file, hashing skipped entirely).
+            In verify mode every file is hashed.
+        """
+        st = os.stat(filepath)
+        current_source_key = os.path.abspath(filepath)
+        file_info = {
+            "path": current_source_key,
+            "size": st.st_size,
+            "mtime": st.st_mtime,
+            "mtime_ns": st.st_mtime_ns,
+            "inode": st.st_ino,
+        }
+
+        record = self.manifest.get(current_source_key)
+        if (not self.verify and record is not None
+                and record["size"] == st.st_size
+                and record["mtime_ns"] == st.st_mtime_ns
+                and record["inode"] == st.st_ino):
+            console.print(
+                f"[yellow]Skipping unchanged file (size and mtime match):[/yellow] {os.path.basename(filepath)}")
+            return None
 
-                    found_at_current_location = False
+        return file_info, record
 
-                    # Check if the content is already indexed at the CURRENT location
-                    for source, stored_mtime in hash_to_sources[file_hash]:
-                        if source == current_source_key:
-                            found_at_current_location = True
+    def _check_file(self, filepath):
+        """
+        Decides whether a single file needs (re)indexing: stat first, then content hash.
 
-                            # Check 1a: Content exists and is at the current location. Check mtime.
-                            if stored_mtime and abs(stored_mtime - file_mtime) < 1:
-                                console.print(
-                                    f"[yellow]Skipping unchanged file (mtime and hash match):[/yellow] {os.path.basename(filepath)}")
-                                break  # Skip to the next file
+        Returns:
+            dict | None: File info (path, size, mtime, mtime_ns, inode, file_hash) if the file
+            must be loaded, else None.
+        """
+        checked = self._stat_file(filepath)
+        if checked is None:
+            return None
+        file_info, record = checked
+        file_info["file_hash"] = _get_file_sha256(filepath)
+        return self._resolve_change(file_info, record)
+
+    def _resolve_change(self, file_info, record):
+        """
+        Decides whether a hashed file needs (re)indexing.
+        CRITICAL UPDATE: Checks for identical content (file_hash) at a new location
+        to prevent unnecessary re-embedding of moved files.
 
-                    if found_at_current_location:
-                        # Continue to next file if the file is unchanged
-                        continue
+        Every check is an indexed manifest lookup; the vector database is never scanned.
+        Nothing is deleted here: the previous manifest record of a modified or moved file is
+        attached as file_info["previous"], and the chunk-level diff happens once the new
+        chunks are known (see _split_doc and _finalize_files).
 
-                    # Check 1b: Content exists, but is NOT at the current location. (MOVED FILE)
-                    if not found_at_current_location:
-                        console.print(f"[cyan]Content match found. File MOVED:[/cyan] {os.path.basename(filepath)}")
+        Returns:
+            dict | None: file_info if the file must be loaded, else None.
+        """
+        current_source_key = file_info["path"]
+        file_hash = file_info["file_hash"]
 
-                        # Delete the old source chunks associated with this hash
-                        for old_source, _ in hash_to_sources[file_hash]:
-                            if old_source != current_source_key:
-                                console.print(
-                                    f"[yellow]Deleting old chunks for moved file:[/yellow] {os.path.basename(old_source)}")
-                                self.collection.delete(where={"source": old_source})
+        if not file_hash:
+            return None  # Skip if hashing failed
 
-                        # Proceed to re-index below. Since the content is the same,
-                        # the chunk IDs will perform a fast UPSERT to update the metadata.
+        # Check 1: Is this exact content already indexed at the CURRENT location?
+        if record is not None and record["file_hash"] == file_hash:
+            # Same content, different stat (touched, restored, or a migrated record):
+            # store the new stat so the next run takes the fast path.
+            self.manifest.update_stat(file_info)
+            console.print(
+                f"[yellow]Skipping unchanged file (hash match):[/yellow] {os.path.basename(current_source_key)}")
+            return None
 
-                # Check 2: File is new or modified (mtime or hash check failed). Proceed with loading.
+        # Check 1b: Content exists, but under a path that no longer exists on disk. (MOVED FILE)
+        if record is None:
+            for previous in self.manifest.find_by_hash(file_hash):
+                if previous["path"] != current_source_key and not os.path.exists(previous["path"]):
+                    console.print(
+                        f"[cyan]Content match found. File MOVED:[/cyan] {os.path.basename(previous['path'])} -> {os.path.basename(current_source_key)}")
+                    # Every chunk ID will match, so the move becomes a metadata-only update
+                    record = previous
+                    break
+
+        # Check 2: File is new or modified. Proceed with loading; the diff against the
+        # previous chunk IDs decides what actually gets embedded, updated or deleted.
+        elif record is not None:
+            console.print(
+                f"[yellow]File modified. Diffing against {len(record['chunk_ids'])} indexed chunks:[/yellow] {os.path.basename(current_source_key)}")
 
-                # Check for existing chunks related to this current path
-                existing_chunks_at_current_path = self.collection.get(
-                    where={"source": current_source_key},
-                    include=["metadatas"]
-                )
+        file_info["previous"] = record
+        return file_info
 
-                if existing_chunks_at_current_path["ids"]:
-                    # If we are here, it means the mtime/hash comparison failed, so it must be re-indexed.
-                    console.print(
-                        f"[yellow]File modified. Deleting {len(existing_chunks_at_current_path['ids'])} old chunks for:[/yellow] {os.path.basename(filepath)}")
-                    self.collection.delete(ids=existing_chunks_at_current_path["ids"])
+    def _attach_source_metadata(self, file_info, parsed_docs):
+        """Attaches source metadata to every parsed page/section for later filtering and cleanup."""
+        for doc in parsed_docs:
+            doc.metadata["source"] = file_info["path"]
+            doc.metadata["file_mtime"] = file_info["mtime"]
+            doc.metadata["file_hash"] = file_info["file_hash"]  # Store the hash with every chunk
 
-                # Load the document
-                # --- Switched to UnstructuredPDFLoader ---
-                loader = UnstructuredPDFLoader(filepath) if filepath.endswith(".pdf") else UnstructuredMarkdownLoader(
-                    filepath)
+        console.print(
+            f"[green]Parsed:[/green] {os.path.basename(file_info['path'])} ({len(parsed_docs)} pages/sections)")
+        return parsed_docs
 
-                # --- CRITICAL LOAD ERROR HANDLING ADDED ---
-                try:
-                    parsed_docs = loader.load()
-                except Exception as load_e:
-                    # Catch and log any deep errors during the parsing process and continue
-                    console.print(
-                        f"[bold red]CRITICAL LOAD ERROR:[/bold red] Failed to parse {os.path.basename(filepath)}. Skipping. Reason: {load_e}")
-                    continue
-                    # -----------------------------------------------
+    def _load_file(self, filepath, file_info):
+        """
+        Loads a single document in-process and attaches source metadata to every page/section.
 
-                # Attach source metadata for later
-                for doc in parsed_docs:
-                    doc.metadata["source"] = current_source_key
-                    doc.metadata["file_mtime"] = file_mtime
-                    doc.metadata["file_hash"] = file_hash  # Store the hash with every chunk
+        Returns:
+            list[Document] | None: The parsed documents, or None if parsing failed.
+        """
+        # --- CRITICAL LOAD ERROR HANDLING ADDED ---
+        try:
+            parsed_docs = load_document(filepath)
+        except Exception as load_e:
+            # Catch and log any deep errors during the parsing process and continue
+            console.print(
+                f"[bold red]CRITICAL LOAD ERROR:[/bold red] Failed to parse {os.path.basename(filepath)}. Skipping. Reason: {load_e}")
+            return None
+            # -----------------------------------------------
 
-                docs.extend(parsed_docs)
-                console.print(
-                    f"[green]Parsed:[/green] {os.path.basename(filepath)} ({len(parsed_docs)} pages/sections)")
+        return self._attach_source_metadata(file_info, parsed_docs)
 
-            except Exception as e:
-                console.print(f"[red]Error processing file {os.path.basename(filepath)} (pre-load issue):[/red] {e}")
+    def parse_docs(self, folder):
+        """
+        Scans a folder, checks files for modifications using the file manifest,
+        and loads every new or changed document into memory.
+        """
+        docs = []
+
+        # Discover -> stat -> hash (threaded) yields only the files that changed
+        for filepath, file_info in track(self._changed_files(_discover_files(folder)), description="Parsing documents"):
+            parsed_docs = self._load_file(filepath, file_info)
+            if parsed_docs is not None:
+                docs.extend(parsed_docs)
+                # Remember the file so index_docs() can record it in the manifest once committed
+                self._parsed_files[file_info["path"]] = file_info
 
         return docs
 
+    def _split_doc(self, d, previous_ids=frozenset()):
+        """
+        Splits one parsed document into chunk records ready for embedding.
+
+        Args:
+            d (Document): Parsed page/section with source metadata attached.
+            previous_ids (set[str]): Chunk IDs the file had when it was last indexed.
+                Chunks whose ID is in this set are flagged 'unchanged'; they only
+                need a metadata update, not a new embedding.
+
+        Returns:
+            list[dict]: Records with keys 'chunk', 'id', 'metadata' and 'unchanged'.
+            'chunk' is the normalized text (when enabled); 'id' hashes the raw text, so
+            toggling normalization does not change chunk IDs.
+        """
+        # --- RESILIENCE CHECK ---
+        if not d.page_content or not isinstance(d.page_content, str) or d.page_content.strip() == "":
+            source_file = d.metadata.get('source', 'Unknown File')
+            console.print(
+                f"[bold red]Skipping Document:[/bold red] '{os.path.basename(source_file)}'. Document content is empty or invalid.")
+            return []
+
+        text_chunks = self.splitter.split_text(d.page_content)
+
+        if not text_chunks:
+            source_file = d.metadata.get('source', 'Unknown File')
+            console.print(
+                f"[bold yellow]Skipping Document:[/bold yellow] '{os.path.basename(source_file)}'. No chunks generated (content too short or sparse).")
+            return []
+
+        stored_chunks = normalize_texts(text_chunks) if self.normalize else text_chunks
+
+        records = []
+        for chunk, stored_chunk in zip(text_chunks, stored_chunks):
+            # Use 'ignore' error handling for encoding when hashing
+            h = content_hash(chunk)
+            chunk_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, h))
+
+            metadata = d.metadata.copy()
+            metadata["indexed_at"] = str(datetime.now())
+
+            records.append({
+                "chunk": stored_chunk,
+                "id": chunk_id,
+                "metadata": _sanitize_metadata(metadata),  # Use sanitized metadata (CRITICAL FOR CHROMA DB VALIDATION)
+                # Chunk IDs are content hashes, so an ID seen before means identical text
+                "unchanged": chunk_id in previous_ids,
+            })
+        return records
+
+    async def _prepare_batch(self, batch_data):
+        """
+        Embed half of the embed/commit pipeline: dedupes one batch of chunk records and
+        embeds the ones that need it.
+
+        Records flagged 'unchanged' already have their embedding stored and only get a
+        metadata update.
+
+        Returns:
+            tuple[list[dict], list[list[float]], list[dict]]: (records to upsert, their embeddings,
+            records that only need a metadata update)
+        """
+        # Chroma rejects duplicate IDs within a single call, so keep the first occurrence only
+        unique = {}
+        for d in batch_data:
+            unique.setdefault(d['id'], d)
+
+        to_embed = [d for d in unique.values() if not d['unchanged']]
+        to_update = [d for d in unique.values() if d['unchanged']]
+
+        # Guard against chunks that disappeared since the manifest was written
+        # (e.g. an interrupted run): an ID lookup is cheap, a missing chunk is not.
+        if to_update:
+            found = await asyncio.to_thread(self.collection.get, ids=[d['id'] for d in to_update], include=[])
+            existing = set(found['ids'])
+            to_embed.extend(d for d in to_update if d['id'] not in existing)
+            to_update = [d for d in to_update if d['id'] in existing]
+
+        # Generate embeddings asynchronously
+        embeddings = await self.embedder.embed_batch([d['chunk'] for d in to_embed]) if to_embed else []
+        return to_embed, embeddings, to_update
+
+    def _write_batch(self, upserts, updates):
+        """
+        Commit half of the embed/commit pipeline (blocking; runs on the single commit thread).
+
+        Args:
+            upserts (list[tuple[dict, list[float]]]): (record, embedding) pairs to upsert.
+            updates (list[dict]): Records that only need a metadata update.
+        """
+        if upserts:
+            # A commit slice can span two embed batches; the last occurrence of an ID wins
+            unique = dict((record['id'], (record, embedding)) for record, embedding in upserts)
+            # UPSERT (rather than add) so chunks shared with an earlier batch simply refresh their metadata
+            self.collection.upsert(
+                documents=[record['chunk'] for record, _ in unique.values()],
+                embeddings=[embedding for _, embedding in unique.values()],
+                metadatas=[record['metadata'] for record, _ in unique.values()],
+                ids=list(unique)
+            )
+
+        if updates:
+            unique = dict((record['id'], record) for record in updates)
+            # Same text, same embedding: only source/mtime/hash metadata needs to move
+            self.collection.update(
+                ids=list(unique),
+                metadatas=[record['metadata'] for record in unique.values()]
+            )
+
+        if self.lexical_index is not None:
+            # Already-indexed IDs are skipped, so metadata-only records cost one lookup
+            self.lexical_index.add_chunks(
+                [(record['id'], record['chunk']) for record, _ in upserts] +
+                [(record['id'], record['chunk']) for record in updates])
+
+    def _finalize_files(self, file_infos):
+        """
+        Completes the chunk-level diff for files whose new chunks are all committed:
+        deletes chunk IDs that disappeared from each file, then records the files in the manifest.
+        """
+        for file_info in file_infos:
+            previous = file_info.get("previous")
+            if previous is None:
+                continue
+            removed_ids = set(previous["chunk_ids"]) - set(file_info["chunk_ids"])
+            # Keep chunks that some other file still references
+            orphaned_ids = self.manifest.orphaned_chunk_ids(removed_ids, [file_info["path"], previous["path"]])
+            if orphaned_ids:
+                self._delete_chunks(orphaned_ids)
+            file_info["removed"] = len(orphaned_ids)
+            if previous["path"] != file_info["path"]:
+                # Moved file: the old path's record is replaced in the same transaction
+                file_info["replaces"] = previous["path"]
+
+        self.manifest.record_files(file_infos)
+
     async def index_docs(self, docs):
         """
         Chunks the documents, queues unique chunks, and processes them in batches
@@ -173,141 +498,379 @@ class IngestPipeline:
             return
 
         # 1. Chunking and Deduplication
-        splitter = RecursiveCharacterTextSplitter(chunk_size=512, chunk_overlap=60)
         chunks_map = {}
+        chunk_ids_by_source = {}
 
         for d in docs:
-            # --- RESILIENCE CHECK ---
-            if not d.page_content or not isinstance(d.page_content, str) or d.page_content.strip() == "":
-                source_file = d.metadata.get('source', 'Unknown File')
-                console.print(
-                    f"[bold red]Skipping Document:[/bold red] '{os.path.basename(source_file)}'. Document content is empty or invalid.")
-                continue
-
-            # Use 'ignore' error handling for encoding when hashing
-            text_chunks = splitter.split_text(d.page_content)
-
-            if not text_chunks:
-                source_file = d.metadata.get('source', 'Unknown File')
-                console.print(
-                    f"[bold yellow]Skipping Document:[/bold yellow] '{os.path.basename(source_file)}'. No chunks generated (content too short or sparse).")
-                continue
-
-            for chunk in text_chunks:
-                h = hashlib.sha256(chunk.encode('utf-8', errors='ignore')).hexdigest()
-                chunk_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, h))
-
-                if chunk_id in chunks_map:
+            source = d.metadata.get("source")
+            previous = self._parsed_files.get(source, {}).get("previous")
+            previous_ids = set(previous["chunk_ids"]) if previous else frozenset()
+            for record in self._split_doc(d, previous_ids):
+                chunk_ids_by_source.setdefault(source, []).append(record["id"])
+                if record["id"] in chunks_map:
                     continue
-
-                metadata = d.metadata.copy()
-                metadata["indexed_at"] = str(datetime.now())
-
-                # --- Metadata Sanitization (CRITICAL FOR CHROMA DB VALIDATION) ---
-                sanitized_metadata = {}
-                for key, value in metadata.items():
-                    # ChromaDB only supports str, int, float for metadata values
-                    if isinstance(value, (str, int, float)):
-                        # Handle potential NaN, Inf/-Inf floats which break JSON/Chroma
-                        if isinstance(value, float) and (value != value or value in [float('inf'), float('-inf')]):
-                            sanitized_metadata[key] = str(value)
-                        else:
-                            sanitized_metadata[key] = value
-                    else:
-                        # Convert all other complex types (e.g., lists, dicts) to JSON string
-                        try:
-                            sanitized_metadata[key] = json.dumps(value)
-                        except:
-                            # Fallback to string representation if JSON serialization fails
-                            sanitized_metadata[key] = str(value)
-
-                # ------------------------------------------------------------------
-
-                chunks_map[chunk_id] = {
-                    "chunk": chunk,
-                    "id": chunk_id,
-                    "metadata": sanitized_metadata  # Use sanitized metadata
-                }
+                chunks_map[record["id"]] = record
 
         all_chunks_data = list(chunks_map.values())
 
         num_chunks_to_add = len(all_chunks_data)
         if num_chunks_to_add == 0:
             console.print("[bold yellow]No new unique chunks found to embed or index.[/bold yellow]")
+            self._record_parsed_files(chunk_ids_by_source)
             return
 
         console.print(f"\n[bold blue]Total unique chunks to process (will use UPSERT):[/bold blue] {num_chunks_to_add}")
         console.print(f"--- Starting Batched Embedding and Indexing ---")
 
-        # 2. Batched Embedding and Indexing
-        for i in track(range(0, num_chunks_to_add, EMBEDDING_API_BATCH_SIZE), description="Generating and Indexing"):
+        # 2. Pipelined Embedding and Indexing (batch N+1 embeds while batch N is written)
+        chunk_queue = asyncio.Queue()
+        for record in all_chunks_data:
+            chunk_queue.put_nowait(("chunk", record))
+        chunk_queue.put_nowait(_END_OF_STREAM)
+        await self._embed_and_commit(chunk_queue, self._new_stats())
+
+        # 3. Every chunk is committed; only now record the files in the manifest
+        self._record_parsed_files(chunk_ids_by_source)
+
+        console.print(f"[bold green]Indexing complete. Total {num_chunks_to_add} unique chunks processed.[/bold green]")
+        self._report_embedding_stats()
+
+    def _record_parsed_files(self, chunk_ids_by_source):
+        """Finalizes files loaded by parse_docs() once their chunks were committed."""
+        records = []
+        for source, file_info in list(self._parsed_files.items()):
+            file_info["chunk_ids"] = chunk_ids_by_source.get(source, [])
+            records.append(file_info)
+            del self._parsed_files[source]
+        self._finalize_files(records)
+
+    def _report_embedding_stats(self):
+        stats = self.embedder.stats()
+        if stats["requests"]:
+            console.print(
+                f"[cyan]Embedding requests:[/cyan] concurrency {stats['concurrency']}, "
+                f"p50 {stats['p50_ms']:.0f} ms, p95 {stats['p95_ms']:.0f} ms, "
+                f"{stats['throughput']:,.0f} chunks/sec, {stats['retries']} retries")
+        if self.embedder.cache is not None:
+            console.print(
+                f"[cyan]Embedding cache:[/cyan] {self.embedder.cache.hits} hits, {self.embedder.cache.misses} misses "
+                f"({self.embedder.cache.size_bytes() / (1024 * 1024):.1f} MB on disk)")
+
+    # --- Streaming Pipeline ---
+
+    def _finish_check(self, filepath, file_info, record, hash_future):
+        """Completes a change check once the file's hash is available."""
+        try:
+            file_info["file_hash"] = hash_future.result()
+            if self._resolve_change(file_info, record) is not None:
+                return filepath, file_info
+        except Exception as e:
+            console.print(f"[red]Error processing file {os.path.basename(filepath)} (pre-load issue):[/red] {e}")
+        return None
+
+    def _changed_files(self, filepaths, stop_event=None):
+        """
+        Stat -> hash: lazily yields (filepath, file_info) for every file in filepaths
+        that needs (re)indexing.
+
+        Files whose stat matches the manifest are skipped without being read. The rest are
+        hashed in a thread pool (up to 2 * HASH_WORKERS files ahead), so reading one file
+        overlaps with hashing others.
+        """
+        self._ensure_manifest()
+        in_flight = deque()
+
+        with ThreadPoolExecutor(max_workers=HASH_WORKERS) as hash_pool:
+            for filepath in filepaths:
+                if stop_event is not None and stop_event.is_set():
+                    return
+                try:
+                    checked = self._stat_file(filepath)
+                except Exception as e:
+                    console.print(f"[red]Error processing file {os.path.basename(filepath)} (pre-load issue):[/red] {e}")
+                    continue
+                if checked is None:
+                    continue
 
-            embed_start = i
-            embed_end = min(i + EMBEDDING_API_BATCH_SIZE, num_chunks_to_add)
+                file_info, record = checked
+                in_flight.append((filepath, file_info, record, hash_pool.submit(_get_file_sha256, filepath)))
 
-            batch_data = all_chunks_data[embed_start:embed_end]
-            batch_chunks = [d['chunk'] for d in batch_data]
+                # Keep a bounded window of hashes running ahead of the consumer
+                while len(in_flight) >= HASH_WORKERS * 2:
+                    changed = self._finish_check(*in_flight.popleft())
+                    if changed is not None:
+                        yield changed
 
-            # Generate embeddings asynchronously
-            batch_embeddings = await self.embedder.embed_batch(batch_chunks)
+            while in_flight:
+                if stop_event is not None and stop_event.is_set():
+                    return
+                changed = self._finish_check(*in_flight.popleft())
+                if changed is not None:
+                    yield changed
 
-            # Add embeddings to the batch_data objects for later indexing
-            for j, embed in enumerate(batch_embeddings):
-                batch_data[j]["embedding"] = embed
+    def _produce_docs(self, filepaths, loop, doc_queue, stop_event):
+        """
+        Stage 1 (worker thread): discover -> hash -> load.
 
-            # --- Indexing Commit Batch ---
+        Pushes one (file_info, parsed_docs) item per changed file into doc_queue.
+        queue.put() is awaited from this thread, so a full queue blocks parsing
+        (backpressure) instead of accumulating parsed documents in memory.
 
-            commit_chunks = [d['chunk'] for d in batch_data]
-            commit_embeddings = [d['embedding'] for d in batch_data]
-            commit_metadatas = [d['metadata'] for d in batch_data]
-            commit_ids = [d['id'] for d in batch_data]
+        With parse_workers > 0, loading is spread across a process pool and parsed
+        files are pushed in completion order.
+        """
 
-            # Since the IDs in commit_ids are now guaranteed to be unique within this batch
-            # the ChromaDB add/upsert operation will succeed.
-            self.collection.add(
-                documents=commit_chunks,
-                embeddings=commit_embeddings,
-                metadatas=commit_metadatas,
-                ids=commit_ids
-            )
+        def put(item):
+            asyncio.run_coroutine_threadsafe(doc_queue.put(item), loop).result()
+
+        try:
+            changed = self._changed_files(filepaths, stop_event)
 
+            if self.parse_workers > 0:
+                loader = ParallelDocumentLoader(self.parse_workers, timeout=self.parse_timeout)
+                for filepath, file_info, parsed_docs, error in loader.imap(changed):
+                    if error is not None:
+                        # A hung or crashed worker only costs this one file
+                        console.print(
+                            f"[bold red]CRITICAL LOAD ERROR:[/bold red] Failed to parse {os.path.basename(filepath)}. Skipping. Reason: {error}")
+                        continue
+                    if stop_event.is_set():
+                        break
+                    self._attach_source_metadata(file_info, parsed_docs)
+                    put((file_info, parsed_docs))
+            else:
+                for filepath, file_info in changed:
+                    parsed_docs = self._load_file(filepath, file_info)
+                    if parsed_docs is not None:
+                        put((file_info, parsed_docs))
+        finally:
+            put(_END_OF_STREAM)
+
+    async def _split_stage(self, doc_queue, chunk_queue):
+        """
+        Stage 2: split parsed files into chunk records.
+
+        Emits ("chunk", record) items followed by one ("file", file_info) marker per file.
+        The marker carries the file's chunk IDs for the manifest.
+        """
+        while True:
+            item = await doc_queue.get()
+            if item is _END_OF_STREAM:
+                break
+
+            file_info, parsed_docs = item
+            previous = file_info.get("previous")
+            previous_ids = set(previous["chunk_ids"]) if previous else frozenset()
+            file_info["chunk_ids"] = []
+            for d in parsed_docs:
+                for record in self._split_doc(d, previous_ids):
+                    file_info["chunk_ids"].append(record["id"])
+                    await chunk_queue.put(("chunk", record))
+            file_info["unchanged"] = len(previous_ids.intersection(file_info["chunk_ids"]))
+            # Release the parsed text before waiting for the next file
+            del parsed_docs, item
+            await chunk_queue.put(("file", file_info))
+
+        await chunk_queue.put(_END_OF_STREAM)
+
+    @staticmethod
+    def _new_stats():
+        return {"files": 0, "chunks": 0, "unchanged": 0, "removed": 0, "batches": 0, "commits": 0}
+
+    async def _embed_stage(self, chunk_queue, commit_queue, stats):
+        """
+        Stage 3: embed.
+
+        Accumulates chunk records into batches of EMBEDDING_API_BATCH_SIZE, embeds them and
+        hands the result to the commit stage. A partial batch is flushed early when the
+        upstream stages go quiet for INGEST_FLUSH_SECONDS.
+
+        Commit items are (records to upsert, embeddings, metadata-only records,
+        files completed by this batch, force) where force asks the writer to commit
+        everything it holds instead of waiting for a full VECTOR_DB_COMMIT_BATCH_SIZE.
+        """
+        batch = []
+        completed_files = []
+
+        async def flush(force):
+            if not batch and not completed_files:
+                return
+            to_embed, embeddings, to_update = await self._prepare_batch(batch) if batch else ([], [], [])
+            if batch:
+                stats["batches"] += 1
+                stats["chunks"] += len(to_embed)
+                stats["unchanged"] += len(to_update)
+            # Blocks while MAX_INFLIGHT_COMMIT_BATCHES batches are already waiting (backpressure)
+            await commit_queue.put((to_embed, embeddings, to_update, list(completed_files), force))
+            batch.clear()
+            completed_files.clear()
+
+        while True:
+            try:
+                item = await asyncio.wait_for(chunk_queue.get(), timeout=INGEST_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                await flush(force=True)
+                continue
+
+            if item is _END_OF_STREAM:
+                break
+
+            kind, payload = item
+            if kind == "chunk":
+                batch.append(payload)
+                if len(batch) >= EMBEDDING_API_BATCH_SIZE:
+                    await flush(force=False)
+            else:
+                completed_files.append(payload)
+
+        await flush(force=True)
+        await commit_queue.put(_END_OF_STREAM)
+
+    async def _commit_stage(self, commit_queue, stats):
+        """
+        Stage 4: upsert.
+
+        Writes embedded chunks in slices of VECTOR_DB_COMMIT_BATCH_SIZE on a dedicated
+        thread, so the event loop keeps feeding Ollama while Chroma writes. Files are
+        finalized (removed chunks deleted, manifest recorded) only once every chunk
+        received before their completion marker has been written.
+        """
+        loop = asyncio.get_running_loop()
+        upserts = []
+        updates = []
+        pending_files = []
+
+        async def write_slice():
+            upsert_slice = upserts[:VECTOR_DB_COMMIT_BATCH_SIZE]
+            update_slice = updates[:VECTOR_DB_COMMIT_BATCH_SIZE - len(upsert_slice)]
+            del upserts[:len(upsert_slice)]
+            del updates[:len(update_slice)]
+            await loop.run_in_executor(self._commit_executor, self._write_batch, upsert_slice, update_slice)
+            stats["commits"] += 1
             console.print(
-                f"[green]Successfully indexed batch {i // EMBEDDING_API_BATCH_SIZE + 1} ({len(commit_chunks)} chunks).[/green]")
+                f"[green]Successfully indexed batch {stats['commits']} "
+                f"({len(upsert_slice)} embedded, {len(update_slice)} metadata-only).[/green]")
+
+        async def finalize_pending():
+            # Every chunk of these files has now been committed: delete what disappeared and record them
+            await loop.run_in_executor(self._commit_executor, self._finalize_files, list(pending_files))
+            for file_info in pending_files:
+                stats["files"] += 1
+                stats["removed"] += file_info.get("removed", 0)
+                new_chunks = len(set(file_info["chunk_ids"])) - file_info["unchanged"]
+                console.print(
+                    f"[green]Indexed:[/green] {os.path.basename(file_info['path'])} "
+                    f"({new_chunks} new, {file_info['unchanged']} unchanged, {file_info.get('removed', 0)} removed chunks)")
+            pending_files.clear()
+
+        while True:
+            item = await commit_queue.get()
+            if item is _END_OF_STREAM:
+                break
+
+            to_embed, embeddings, to_update, completed_files, force = item
+            upserts.extend(zip(to_embed, embeddings))
+            updates.extend(to_update)
+            pending_files.extend(completed_files)
+
+            while len(upserts) + len(updates) >= VECTOR_DB_COMMIT_BATCH_SIZE:
+                await write_slice()
+            if force:
+                while upserts or updates:
+                    await write_slice()
+            if pending_files and not upserts and not updates:
+                await finalize_pending()
+
+        while upserts or updates:
+            await write_slice()
+        if pending_files:
+            await finalize_pending()
+
+    async def _embed_and_commit(self, chunk_queue, stats):
+        """
+        Runs the embed and commit stages concurrently, connected by a queue of at most
+        MAX_INFLIGHT_COMMIT_BATCHES embedded batches.
+        """
+        commit_queue = asyncio.Queue(maxsize=MAX_INFLIGHT_COMMIT_BATCHES)
+        embed_task = asyncio.create_task(self._embed_stage(chunk_queue, commit_queue, stats))
+        commit_task = asyncio.create_task(self._commit_stage(commit_queue, stats))
+        try:
+            await asyncio.gather(embed_task, commit_task)
+        finally:
+            # If one stage failed, don't leave the other blocked on its queue
+            embed_task.cancel()
+            commit_task.cancel()
+
+    async def index_folder(self, folder):
+        """
+        Streaming, bounded-memory indexing of every .pdf/.md file under a folder.
+        See index_files().
+        """
+        return await self.index_files(_discover_files(folder))
 
-        console.print(f"[bold green]Indexing complete. Total {num_chunks_to_add} unique chunks processed.[/bold green]")
+    async def index_files(self, filepaths):
+        """
+        Streaming, bounded-memory indexing of the given files (consumed lazily).
+        Unchanged files are skipped, so this is also the targeted path used by watch mode.
+
+        Stages run concurrently and are connected by bounded queues:
+            discover -> hash -> load  (worker thread, optionally fanning out to a process pool)
+            split                     (event loop)
+            embed                     (event loop + embedder thread pool)
+            upsert                    (dedicated commit thread, overlapping the next embed)
+
+        Returns:
+            dict: Counters for indexed files, embedded / unchanged / removed chunks and committed batches.
+        """
+        loop = asyncio.get_running_loop()
+        doc_queue = asyncio.Queue(maxsize=INGEST_DOC_QUEUE_SIZE)
+        chunk_queue = asyncio.Queue(maxsize=INGEST_CHUNK_QUEUE_SIZE)
+        stop_event = threading.Event()
+        stats = self._new_stats()
+
+        console.print("--- Starting Streaming Indexing ---")
+
+        producer = loop.run_in_executor(None, self._produce_docs, filepaths, loop, doc_queue, stop_event)
+        splitter = asyncio.create_task(self._split_stage(doc_queue, chunk_queue))
+        embedder = asyncio.create_task(self._embed_and_commit(chunk_queue, stats))
+
+        try:
+            await asyncio.gather(splitter, embedder)
+        except BaseException:
+            # Stop the producer and drain its queue so a blocked put() can return
+            stop_event.set()
+            splitter.cancel()
+            embedder.cancel()
+            while not producer.done():
+                try:
+                    doc_queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    await asyncio.sleep(0.05)
+            raise
+        await producer
+
+        console.print(
+            f"[bold green]Indexing complete. {stats['files']} files: {stats['chunks']} chunks embedded, "
+            f"{stats['unchanged']} unchanged, {stats['removed']} removed, in {stats['commits']} commits.[/bold green]")
+        self._report_embedding_stats()
+        return stats
 
     def cleanup_deleted_files(self, master_docs_path):
         """
         Identifies and removes chunks in the DB whose source file no longer exists on disk.
         """
         console.print("\n--- Starting Scoped Stale Chunk Cleanup ---")
+        self._ensure_manifest()
 
-        # 1. Normalize the path for filtering
-        scope_path_abs = os.path.abspath(master_docs_path)
-
-        # 2. Get all unique source paths currently in the database
-        db_results = self.collection.get(include=['metadatas'])
-        sources_in_db = set(md.get('source') for md in db_results.get('metadatas', []) if md.get('source'))
-
-        # 3. Filter DB sources to only include those within the current scope
-        sources_in_scope = set()
-        for source in sources_in_db:
-            if source.startswith(scope_path_abs):
-                sources_in_scope.add(source)
+        # 1. Get the indexed files within the current scope (indexed range scan on the manifest)
+        sources_in_scope = self.manifest.paths_under(master_docs_path)
 
         if not sources_in_scope:
             console.print("No previously indexed files found within the current scope for cleanup.")
             return
 
-        # 4. Get all files currently on disk within the specified master_docs_path (normalized)
-        files_on_disk_in_scope = set()
-        for root, _, fs in os.walk(master_docs_path):
-            for f in fs:
-                if f.endswith((".pdf", ".md")):
-                    files_on_disk_in_scope.add(os.path.abspath(os.path.join(root, f)))
-
-        # 5. Determine stale sources: these are files that are in the scope but NOT on disk
-        stale_sources = sources_in_scope - files_on_disk_in_scope
+        # 2. Determine stale sources: these are files that are in the scope but NOT on disk
+        stale_sources = [source for source in sources_in_scope if not os.path.exists(source)]
 
         if stale_sources:
             paths_to_delete = stale_sources
@@ -317,10 +880,116 @@ class IngestPipeline:
             for source in paths_to_delete:
                 console.print(f"    Removing stale chunks for: {os.path.basename(source)}")
                 try:
-                    # Delete by metadata filter
-                    self.collection.delete(where={"source": source})
+                    record = self.manifest.get(source)
+                    if record is not None:
+                        self._remove_indexed_file(record)
                     console.print(f"    [green]SUCCESS:[/green] Removed chunks for {os.path.basename(source)}")
                 except Exception as e:
                     console.print(f"    [red]ERROR:[/red] Failed to remove stale chunks for {source}. Reason: {e}")
         else:
             console.print("No stale source files found in the vector database.")
+
+    def remove_files(self, paths):
+        """
+        Removes the chunks of specific indexed files that no longer exist on disk
+        (targeted counterpart of cleanup_deleted_files, used by watch mode).
+
+        Returns:
+            int: Number of files removed from the index.
+        """
+        removed = 0
+        for path in paths:
+            path = os.path.abspath(path)
+            if os.path.exists(path):
+                continue
+            record = self.manifest.get(path)
+            if record is None:
+                continue
+            chunks = self._remove_indexed_file(record)
+            removed += 1
+            console.print(f"[yellow]Removed {chunks} chunks for deleted file:[/yellow] {os.path.basename(path)}")
+        return removed
+
+    def _rewrite_chunks(self, chunks, embeddings):
+        """Replaces the stored text and embedding of existing chunks (runs on the commit thread)."""
+        self.collection.update(
+            ids=[chunk_id for chunk_id, _ in chunks],
+            documents=[text for _, text in chunks],
+            embeddings=embeddings
+        )
+        if self.lexical_index is not None:
+            self.lexical_index.remove_chunks([chunk_id for chunk_id, _ in chunks])
+            self.lexical_index.add_chunks(chunks)
+
+    async def reembed_collection(self, batch_size=VECTOR_DB_COMMIT_BATCH_SIZE):
+        """
+        One-off migration for collections indexed before embeddings were L2-normalized:
+        re-embeds the stored text of every chunk, rewrites its vector in place and then marks
+        the collection as holding unit vectors. Chunk IDs and text stay the same.
+
+        Returns:
+            int: Number of chunks re-embedded.
+        """
+        self._ensure_manifest(allow_legacy=True)
+        # Collect the IDs first: rewriting while paging by offset could skip or repeat chunks
+        chunk_ids = []
+        total = self.collection.count()
+        for offset in range(0, total, batch_size):
+            page = await asyncio.to_thread(self.collection.get, include=[], limit=batch_size, offset=offset)
+            chunk_ids.extend(page['ids'])
+
+        console.print(f"[cyan]Re-embedding {len(chunk_ids)} stored chunks...[/cyan]")
+        loop = asyncio.get_running_loop()
+        for i in range(0, len(chunk_ids), batch_size):
+            page = await asyncio.to_thread(self.collection.get, ids=chunk_ids[i:i + batch_size], include=['documents'])
+            embeddings = await self.embedder.embed_batch([doc or "" for doc in page['documents']])
+            await loop.run_in_executor(self._commit_executor, functools.partial(
+                self.collection.update, ids=page['ids'], embeddings=embeddings))
+            console.print(f"    Re-embedded {min(i + batch_size, len(chunk_ids))}/{len(chunk_ids)} chunks")
+
+        self.manifest.set_unit_vectors(True)
+        console.print(f"[bold green]Re-embedding complete. {len(chunk_ids)} chunks rewritten.[/bold green]")
+        self._report_embedding_stats()
+        return len(chunk_ids)
+
+    async def normalize_collection(self, batch_size=VECTOR_DB_COMMIT_BATCH_SIZE):
+        """
+        One-off migration for collections indexed before text normalization: normalizes the
+        stored text of every chunk, re-embeds the chunks whose text changed and rewrites them
+        in place. Chunk IDs (hashes of the raw text) stay the same.
+
+        Returns:
+            int: Number of chunks rewritten.
+        """
+        # Rewritten chunks get new unit-length embeddings, which a legacy collection cannot take
+        self._ensure_manifest()
+        total = self.collection.count()
+        if not total:
+            console.print("[bold yellow]The collection is empty; nothing to normalize.[/bold yellow]")
+            return 0
+
+        # Collect the IDs first: rewriting while paging by offset could skip or repeat chunks
+        chunk_ids = []
+        for offset in range(0, total, batch_size):
+            page = await asyncio.to_thread(self.collection.get, include=[], limit=batch_size, offset=offset)
+            chunk_ids.extend(page['ids'])
+
+        console.print(f"[cyan]Normalizing {len(chunk_ids)} stored chunks...[/cyan]")
+        loop = asyncio.get_running_loop()
+        rewritten = 0
+        for i in range(0, len(chunk_ids), batch_size):
+            page = await asyncio.to_thread(self.collection.get, ids=chunk_ids[i:i + batch_size], include=['documents'])
+            documents = [doc or "" for doc in page['documents']]
+            changed = [(chunk_id, normalized) for chunk_id, doc, normalized
+                       in zip(page['ids'], documents, normalize_texts(documents)) if normalized != doc]
+            if not changed:
+                continue
+            embeddings = await self.embedder.embed_batch([text for _, text in changed])
+            await loop.run_in_executor(self._commit_executor, self._rewrite_chunks, changed, embeddings)
+            rewritten += len(changed)
+            console.print(f"    Rewrote {rewritten} chunks ({min(i + batch_size, len(chunk_ids))}/{len(chunk_ids)} checked)")
+
+        console.print(f"[bold green]Normalization complete. {rewritten} of {len(chunk_ids)} chunks rewritten.[/bold green]")
+        self._report_embedding_stats()
+        return rewritten
+
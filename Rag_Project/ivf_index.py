@@ -0,0 +1,163 @@
+import os
+
+import numpy as np
+
+# k-means trains on at most this many vectors per list (and needs at least a few per list)
+_TRAIN_POINTS_PER_LIST = 64
+_MIN_POINTS_PER_LIST = 4
+# Rows assigned to centroids per matrix product, to bound temporary memory
+_ASSIGN_BLOCK = 16384
+
+
+def default_nlist(count):
+    """Number of inverted lists for `count` vectors: ~4 * sqrt(n), with enough vectors per list."""
+    return int(max(1, min(4 * np.sqrt(count), count // _MIN_POINTS_PER_LIST)))
+
+
+class IVFIndex:
+    """
+    Inverted-file (IVF) index: a k-means coarse quantizer that splits the embedding matrix
+    of NumpyVectorStore into `nlist` clusters, and one posting list of row numbers ("slots")
+    per cluster. A query scores only the rows of its `nprobe` nearest clusters, so search
+    cost drops from the whole matrix to roughly nprobe / nlist of it.
+
+    The index only knows slots and clusters; the store keeps the authoritative cluster of
+    every slot (persisted in its sidecar) and hands it to candidates(), which drops posting
+    list entries that went stale (deleted or reused slots). New vectors are appended to the
+    list of their nearest centroid; rebuild() purges stale entries without retraining.
+    """
+
+    def __init__(self, centroids):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.centroid_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        self.nlist = len(self.centroids)
+        self._lists = [np.empty(0, dtype=np.int64) for _ in range(self.nlist)]
+        self.entries = 0  # posting list entries, including stale ones
+        self.stale = 0    # entries known to point at deleted or reassigned slots
+
+    # --- Training ---
+
+    @classmethod
+    def train(cls, vectors, nlist, rows=None, iterations=10, seed=0):
+        """
+        Trains the coarse quantizer with Lloyd's k-means on a sample of `vectors`.
+
+        Args:
+            vectors (np.ndarray): (n, dim) float32 matrix (a memmap is fine; only the sample is read).
+            nlist (int): Number of clusters.
+            rows (np.ndarray, optional): Row numbers to sample from (default: all rows).
+            iterations (int): k-means iterations.
+
+        Returns:
+            IVFIndex: An index with empty posting lists.
+        """
+        rng = np.random.default_rng(seed)
+        rows = np.arange(len(vectors)) if rows is None else np.asarray(rows)
+        n = len(rows)
+        nlist = max(1, min(nlist, n))
+        sample_size = min(n, nlist * _TRAIN_POINTS_PER_LIST)
+        sample = np.asarray(vectors[np.sort(rng.choice(rows, sample_size, replace=False))], dtype=np.float32)
+
+        # Random distinct sample points as the initial centroids
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = cls(centroids).assign(sample)
+            counts = np.bincount(labels, minlength=nlist)
+            filled = counts > 0
+            # Per-cluster sums of the sample sorted by cluster, one reduceat over the filled clusters
+            order = np.argsort(labels, kind="stable")
+            starts = np.searchsorted(labels[order], np.flatnonzero(filled))
+            centroids[filled] = np.add.reduceat(sample[order], starts) / counts[filled, None]
+            # Empty clusters restart from a random sample point
+            empty = np.flatnonzero(~filled)
+            if len(empty):
+                centroids[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+        return cls(centroids)
+
+    def assign(self, vectors, rows=None):
+        """Nearest centroid of each vector, or of the given rows of `vectors` (squared L2)."""
+        count = len(vectors) if rows is None else len(rows)
+        labels = np.empty(count, dtype=np.int32)
+        for start in range(0, count, _ASSIGN_BLOCK):
+            if rows is None:
+                block = np.asarray(vectors[start:start + _ASSIGN_BLOCK], dtype=np.float32)
+            else:
+                block = np.asarray(vectors[rows[start:start + _ASSIGN_BLOCK]], dtype=np.float32)
+            # |x|^2 is the same for every centroid, so it does not change the argmin
+            distances = self.centroid_norms[None, :] - 2.0 * (block @ self.centroids.T)
+            labels[start:start + len(block)] = np.argmin(distances, axis=1)
+        return labels
+
+    # --- Posting lists ---
+
+    def add(self, slots, clusters):
+        """Appends slots to the posting lists of their clusters."""
+        slots = np.asarray(slots, dtype=np.int64)
+        clusters = np.asarray(clusters)
+        order = np.argsort(clusters, kind="stable")
+        groups, starts = np.unique(clusters[order], return_index=True)
+        for cluster, part in zip(groups, np.split(slots[order], starts[1:])):
+            self._lists[cluster] = np.concatenate([self._lists[cluster], part])
+        self.entries += len(slots)
+
+    def discard(self, count):
+        """Records that `count` posting list entries no longer point at their chunk."""
+        self.stale += count
+
+    def rebuild(self, slots, clusters):
+        """Replaces all posting lists with the given (live) slots, dropping stale entries."""
+        self._lists = [np.empty(0, dtype=np.int64) for _ in range(self.nlist)]
+        self.entries = 0
+        self.stale = 0
+        if len(slots):
+            self.add(slots, clusters)
+
+    def stale_ratio(self):
+        return self.stale / self.entries if self.entries else 0.0
+
+    # --- Search ---
+
+    def probe(self, queries, nprobe):
+        """The `nprobe` nearest clusters of each query vector, nearest first."""
+        nprobe = max(1, min(nprobe, self.nlist))
+        distances = self.centroid_norms[None, :] - 2.0 * (queries @ self.centroids.T)
+        if nprobe < self.nlist:
+            nearest = np.argpartition(distances, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            nearest = np.tile(np.arange(self.nlist), (len(queries), 1))
+        order = np.take_along_axis(distances, nearest, axis=1).argsort(axis=1, kind="stable")
+        return np.take_along_axis(nearest, order, axis=1)
+
+    def candidates(self, clusters, slot_clusters, live):
+        """
+        Live slots in the posting lists of `clusters`.
+
+        Args:
+            clusters (Iterable[int]): Probed clusters.
+            slot_clusters (np.ndarray): The store's current cluster of every slot.
+            live (np.ndarray): Boolean mask of live (and filter-matching) slots.
+
+        Returns:
+            np.ndarray: Unique candidate slots.
+        """
+        parts = []
+        for cluster in clusters:
+            slots = self._lists[cluster]
+            # Entries of deleted slots, or of slots reused by a chunk in another cluster, are stale
+            parts.append(slots[live[slots] & (slot_clusters[slots] == cluster)])
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(parts))
+
+    # --- Persistence ---
+
+    def save(self, path):
+        """Writes the centroids atomically (posting lists are rebuilt from the store on load)."""
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, self.centroids)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path))
@@ -0,0 +1,204 @@
+import os
+import re
+import math
+import sqlite3
+import threading
+from collections import Counter
+
+from config import LEXICAL_INDEX_PATH, TEXT_NORMALIZATION_ENABLED
+from text_normalizer import normalize_text
+
+# SQLite limits the number of bound parameters per statement; stay well below it
+_SQL_PARAM_CHUNK = 500
+
+# Query terms occurring in more than this fraction of all chunks are skipped (stop words),
+# unless the query has no other terms
+_MAX_DOC_FRACTION = 0.5
+
+# Plain words plus compound identifiers (os.path.join, ERR-4012, my_func::call) kept whole,
+# so exact identifiers match as one term as well as by their parts
+_WORD = re.compile(r"\w+")
+_COMPOUND = re.compile(r"\w+(?:(?:\.|-|::|/)\w+)+")
+
+
+def tokenize(text):
+    """Lowercased word tokens plus whole compound identifiers."""
+    text = text.lower()
+    return _WORD.findall(text) + _COMPOUND.findall(text)
+
+
+class LexicalIndex:
+    """
+    On-disk inverted index with BM25 scoring, stored in SQLite next to the vector DB.
+
+    One posting (term, chunk_id, term frequency) per distinct term of a chunk, clustered
+    by term so a query reads only the posting lists of its own terms. Chunk IDs are the
+    same content-hash IDs the vector database uses: a chunk that is already indexed has
+    the same text and is skipped.
+
+    Kept in sync by IngestPipeline: chunks are added when they are committed to the
+    vector DB and removed wherever the pipeline deletes chunks from it.
+    """
+
+    def __init__(self, path=LEXICAL_INDEX_PATH, k1=1.2, b=0.75, normalize=TEXT_NORMALIZATION_ENABLED):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        # The pipeline indexes the normalized chunk text, so queries are normalized the same way
+        self.normalize = normalize
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        # Written by the pipeline's commit thread, read by queries
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                length   INTEGER NOT NULL
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS postings (
+                term     TEXT    NOT NULL,
+                chunk_id TEXT    NOT NULL,
+                tf       INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings(chunk_id);
+            """
+        )
+
+    def _existing(self, chunk_ids):
+        found = set()
+        for i in range(0, len(chunk_ids), _SQL_PARAM_CHUNK):
+            part = chunk_ids[i:i + _SQL_PARAM_CHUNK]
+            placeholders = ",".join("?" * len(part))
+            found.update(r[0] for r in self._conn.execute(
+                f"SELECT chunk_id FROM chunks WHERE chunk_id IN ({placeholders})", part))
+        return found
+
+    def add_chunks(self, chunks):
+        """
+        Indexes chunks that are not indexed yet.
+
+        Args:
+            chunks (list[tuple[str, str]]): (chunk_id, text) pairs.
+        """
+        chunks = list(dict(chunks).items())
+        if not chunks:
+            return
+        with self._lock:
+            existing = self._existing([chunk_id for chunk_id, _ in chunks])
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for chunk_id, text in chunks:
+                    if chunk_id in existing:
+                        continue
+                    counts = Counter(tokenize(text))
+                    self._conn.execute("INSERT INTO chunks (chunk_id, length) VALUES (?, ?)",
+                                       (chunk_id, sum(counts.values())))
+                    self._conn.executemany("INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                                           [(term, chunk_id, tf) for term, tf in counts.items()])
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def remove_chunks(self, chunk_ids):
+        """Removes chunks (and their postings) from the index."""
+        chunk_ids = list(dict.fromkeys(chunk_ids))
+        if not chunk_ids:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for i in range(0, len(chunk_ids), _SQL_PARAM_CHUNK):
+                    part = chunk_ids[i:i + _SQL_PARAM_CHUNK]
+                    placeholders = ",".join("?" * len(part))
+                    self._conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({placeholders})", part)
+                    self._conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({placeholders})", part)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def clear(self):
+        """Empties the index, e.g. after the vector database was wiped."""
+        with self._lock:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM chunks")
+
+    def chunk_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def search(self, query, limit=15, chunk_ids=None):
+        """
+        Ranks chunks against the query with BM25.
+
+        Args:
+            query (str): The search text.
+            limit (int): Number of results.
+            chunk_ids (set[str], optional): Only these chunks are scored (filtered retrieval);
+                corpus statistics (IDF, average length) still cover the whole index.
+
+        Returns:
+            list[tuple[str, float]]: (chunk_id, score) pairs, best first.
+        """
+        # Chunks were indexed as normalized text ("ERR4012" -> "ERR 4012"), so the normalized
+        # query's terms are what matches; the raw terms still match chunks indexed before
+        # normalization (terms without postings are dropped below)
+        terms = tokenize(query)
+        if self.normalize:
+            terms += tokenize(normalize_text(query))
+        terms = list(dict.fromkeys(terms))
+        if not terms:
+            return []
+        with self._lock:
+            n_chunks, total_length = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks").fetchone()
+            if not n_chunks:
+                return []
+            avg_length = total_length / n_chunks or 1.0
+
+            # Terms found in most chunks barely move BM25 but have the longest posting lists
+            frequencies = {term: self._conn.execute(
+                "SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0] for term in terms}
+            selective = [t for t in terms if 0 < frequencies[t] <= n_chunks * _MAX_DOC_FRACTION]
+            terms = selective or [t for t in terms if frequencies[t]]
+
+            scores = {}
+            for term in terms:
+                postings = self._conn.execute(
+                    "SELECT p.chunk_id, p.tf, c.length FROM postings p JOIN chunks c ON c.chunk_id = p.chunk_id "
+                    "WHERE p.term = ?", (term,)
+                ).fetchall()
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_chunks - len(postings) + 0.5) / (len(postings) + 0.5))
+                if chunk_ids is not None:
+                    postings = [p for p in postings if p[0] in chunk_ids]
+                for chunk_id, tf, length in postings:
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def bootstrap_from_collection(self, collection, batch_size=1000):
+        """
+        One-time build for collections indexed before the lexical index existed.
+
+        Returns:
+            int: Number of chunks indexed.
+        """
+        total = collection.count()
+        for offset in range(0, total, batch_size):
+            page = collection.get(include=['documents'], limit=batch_size, offset=offset)
+            self.add_chunks(list(zip(page['ids'], page['documents'])))
+        return self.chunk_count()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
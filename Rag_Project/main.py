@@ -8,18 +8,24 @@ import subprocess  # New import for the 'app' mode
 
 # --- Real Imports from Project Structure ---
 # These must exist in separate files for the application to run.
-from vector_db_factory import get_vector_db
+from vector_db_factory import get_vector_db, open_collection
 from ingest_pipeline import IngestPipeline
+from watcher import IndexWatcher
+from config import MASTER_DOCS_PATH, SERVE_HOST, SERVE_PORT, COLLECTION_NAME, QUERY_COLLECTIONS
 from rag_agentic import AgenticRAG
+from query_service import QueryService
+from query_server import serve
+from search_filters import SearchFilter
+from named_collections import list_collections, validate_collection_name
 
 # Initialize Rich console for clean output
 console = rich.get_console()
 
 
 # Function to wrap the async call for use in synchronous main()
-async def run_indexing(idx, documents):
-    """A wrapper for the async index_docs method."""
-    await idx.index_docs(documents)
+async def run_indexing(idx, folder):
+    """A wrapper for the async, streaming index_folder method."""
+    return await idx.index_folder(folder)
 
 
 def main():
@@ -32,26 +38,106 @@ def main():
     parser.add_argument(
         "--mode",
         # Added 'app' to the choices
-        choices=["index", "query", "wipe", "app"],
+        choices=["index", "watch", "query", "serve", "wipe", "normalize", "reembed", "compact", "collections",
+                 "app"],
         required=True,
         help="""\nMode of operation:
   - index: Parse and embed documents from a folder.
+  - watch: Keep the index up to date by watching a folder for changes
+           (defaults to MASTER_DOCS_PATH).
   - query: Retrieve and generate an answer from the indexed database.
-  - wipe: Permanently delete ALL data from the vector database.
+  - serve: Run a local HTTP query API (GET /health, POST /retrieve, POST /query)
+           on a warm agent, for scripts and other tools.
+  - wipe: Permanently delete ALL data of one collection from the vector database.
+  - normalize: One-off migration that normalizes (and re-embeds) the text of
+           chunks indexed before TEXT_NORMALIZATION_ENABLED existed.
+  - reembed: One-off migration that re-embeds every chunk of a collection indexed
+           before embeddings were L2-normalized (required before querying or indexing it).
+  - compact: Reclaim deleted rows of the 'numpy' vector store and (re)build
+           its IVF index when NUMPY_INDEX=ivf.
+  - collections: List the named collections and their chunk counts.
   - app: Launch the Streamlit web chat interface.
 """
     )
     parser.add_argument(
         "--folder",
-        help="Path to the documents folder (required for 'index' mode)."
+        help="Path to the documents folder (required for 'index' mode, optional for 'watch')."
     )
     parser.add_argument(
         "--query",
         help="The question or text query (required for 'query' mode)."
     )
+    parser.add_argument(
+        "--collection",
+        action="append",
+        default=None,
+        help="Named collection to use (default: COLLECTION_NAME from config). 'index', 'watch',\n"
+             "'wipe', 'normalize', 'reembed' and 'compact' take one; 'query' and 'serve' search every given\n"
+             "collection in parallel (default: QUERY_COLLECTIONS). Repeatable."
+    )
+    parser.add_argument(
+        "--path-prefix",
+        action="append",
+        default=None,
+        help="In 'query' mode, only search files under this folder (absolute, or relative to\nMASTER_DOCS_PATH). Repeatable."
+    )
+    parser.add_argument(
+        "--file-type",
+        action="append",
+        default=None,
+        help="In 'query' mode, only search files with this extension (e.g. md, pdf). Repeatable."
+    )
+    parser.add_argument(
+        "--modified-after",
+        default=None,
+        help="In 'query' mode, only search files modified on/after this date (YYYY-MM-DD)."
+    )
+    parser.add_argument(
+        "--modified-before",
+        default=None,
+        help="In 'query' mode, only search files modified on/before this date (YYYY-MM-DD)."
+    )
+    parser.add_argument(
+        "--host",
+        default=None,
+        help="Address the 'serve' mode API binds to (default: SERVE_HOST from config)."
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=None,
+        help="Port of the 'serve' mode API (default: SERVE_PORT from config)."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of processes used to parse documents in parallel in 'index' mode\n(default: PARSE_WORKERS from config, 0 = serial)."
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="In 'index' mode, hash every file instead of trusting unchanged size/mtime/inode."
+    )
 
     args = parser.parse_args()
 
+    try:
+        collections = [validate_collection_name(name) for name in args.collection or []]
+    except ValueError as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+    # Modes that write to (or maintain) a collection work on exactly one
+    if args.mode in ("index", "watch", "wipe", "normalize", "reembed", "compact") and len(collections) > 1:
+        print(f"❌ Error: '{args.mode}' mode works on one collection at a time.")
+        sys.exit(1)
+    collection_name = collections[0] if collections else COLLECTION_NAME
+    # Searching never creates a collection: a mistyped name is an error, not an empty result
+    unknown = [name for name in collections if name not in list_collections()]
+    if args.mode in ("query", "serve") and unknown:
+        print(f"❌ Error: unknown collection(s): {', '.join(unknown)} (see --mode collections).")
+        sys.exit(1)
+
     # --- Mode: APP (NEW) ---
     if args.mode == "app":
         try:
@@ -68,16 +154,35 @@ def main():
         sys.exit(0)
 
 
+    # --- Mode: COLLECTIONS ---
+    elif args.mode == "collections":
+        for name in list_collections():
+            try:
+                count = get_vector_db(name).count()
+            except Exception as e:
+                count = f"unavailable ({e})"
+            markers = [label for label, active in (("indexing", name == COLLECTION_NAME),
+                                                   ("queried", name in QUERY_COLLECTIONS)) if active]
+            print(f"- {name}: {count} chunks" + (f" [{', '.join(markers)}]" if markers else ""))
+        sys.exit(0)
+
     # --- Mode: WIPE ---
     elif args.mode == "wipe":
         try:
-            collection = get_vector_db()
+            shard = open_collection(collection_name)
             confirm = input(
-                "❗ WARNING: Are you sure you want to wipe the entire vector database? Type 'yes' to confirm: ").strip().lower()
+                f"❗ WARNING: Are you sure you want to wipe the entire collection '{collection_name}'? "
+                "Type 'yes' to confirm: ").strip().lower()
             if confirm == "yes":
                 # Deleting by empty where={} deletes all documents in the collection
-                collection.delete(where={})
-                print("✅ Vector database completely wiped.")
+                shard.collection.delete(where={})
+                # Forget the indexed files too, otherwise the next index run would skip them all.
+                # The embedding cache is kept on purpose so re-indexing is cheap.
+                # Other collections are left untouched.
+                shard.manifest.clear()
+                if shard.lexical_index is not None:
+                    shard.lexical_index.clear()
+                print(f"✅ Collection '{collection_name}' completely wiped.")
             else:
                 print("❌ Wipe cancelled.")
             sys.exit(0)
@@ -85,26 +190,80 @@ def main():
             print(f"❌ Error during wipe operation: {e}")
             sys.exit(1)
 
+    # --- Mode: SERVE ---
+    elif args.mode == "serve":
+        try:
+            service = QueryService(AgenticRAG(collections)) if collections else None
+            serve(host=args.host or SERVE_HOST, port=args.port or SERVE_PORT, service=service)
+        except Exception as e:
+            print(f"❌ An error occurred in serve mode: {e}")
+            traceback.print_exc()
+            sys.exit(1)
+
+    # --- Mode: NORMALIZE ---
+    elif args.mode == "normalize":
+        print("🧹 Normalizing the text of already indexed chunks...")
+        try:
+            asyncio.run(IngestPipeline(collection=collection_name).normalize_collection())
+            print("✅ Normalization complete.")
+        except Exception as e:
+            print(f"❌ An error occurred during normalization: {e}")
+            traceback.print_exc()
+            sys.exit(1)
+
+    # --- Mode: REEMBED ---
+    elif args.mode == "reembed":
+        print(f"🔁 Re-embedding the chunks of collection '{collection_name}'...")
+        try:
+            asyncio.run(IngestPipeline(collection=collection_name).reembed_collection())
+            print("✅ Re-embedding complete.")
+        except Exception as e:
+            print(f"❌ An error occurred during re-embedding: {e}")
+            traceback.print_exc()
+            sys.exit(1)
+
+    # --- Mode: COMPACT ---
+    elif args.mode == "compact":
+        collection = get_vector_db(collection_name)
+        if not hasattr(collection, "compact"):
+            print("ℹ️ Nothing to compact: the configured vector database manages its own storage.")
+            sys.exit(0)
+        try:
+            reclaimed = collection.compact()
+            print(f"🧹 Reclaimed {reclaimed} deleted rows ({collection.count()} chunks stored).")
+            if collection.index_type == "ivf":
+                nlist = collection.build_index()
+                print(f"✅ IVF index rebuilt with {nlist} lists.")
+            footprint = collection.footprint()
+            print(f"📦 Vectors: {footprint['float32_bytes'] / 1e6:.1f} MB float32, "
+                  f"{footprint['search_bytes'] / 1e6:.1f} MB scanned per search "
+                  f"(quantization: {footprint['quantization']}).")
+        except Exception as e:
+            print(f"❌ An error occurred during compaction: {e}")
+            traceback.print_exc()
+            sys.exit(1)
+
     # --- Mode: INDEX ---
     elif args.mode == "index":
         if not args.folder:
             print("❌ Error: --folder is required in 'index' mode.")
             sys.exit(1)
 
-        print(f"🚀 Starting indexing pipeline for folder: {args.folder}")
+        print(f"🚀 Starting indexing pipeline for folder: {args.folder} (collection: {collection_name})")
         try:
-            idx = IngestPipeline()
+            pipeline_options = {"verify": args.verify, "collection": collection_name}
+            if args.workers is not None:
+                pipeline_options["parse_workers"] = args.workers
+            idx = IngestPipeline(**pipeline_options)
 
             # CRITICAL UPDATE: Call cleanup_deleted_files, passing the required folder path
             idx.cleanup_deleted_files(args.folder)
 
-            # 2. Parse documents and check for changes
-            documents = idx.parse_docs(args.folder)
+            # 2. Stream changed documents through parse -> split -> embed -> upsert.
+            # Chunks become queryable batch by batch while later files are still parsing.
+            stats = asyncio.run(run_indexing(idx, args.folder))
 
-            # 3. Index new documents
-            if documents:
-                # Correctly run the async indexing function
-                asyncio.run(run_indexing(idx, documents))
+            if stats["files"]:
                 print("✅ Indexing complete.")
             else:
                 print("⚠️ No new or changed documents found to index.")
@@ -114,24 +273,60 @@ def main():
             traceback.print_exc()
             sys.exit(1)
 
+    # --- Mode: WATCH ---
+    elif args.mode == "watch":
+        folder = args.folder or MASTER_DOCS_PATH
+        if not os.path.isdir(folder):
+            print(f"❌ Error: folder to watch does not exist: {folder}")
+            sys.exit(1)
+
+        print(f"👀 Starting watch mode for folder: {folder} (collection: {collection_name}, Ctrl+C to stop)")
+        try:
+            pipeline_options = {"verify": args.verify, "collection": collection_name}
+            if args.workers is not None:
+                pipeline_options["parse_workers"] = args.workers
+            watcher = IndexWatcher(IngestPipeline(**pipeline_options), folder)
+            asyncio.run(watcher.run())
+        except KeyboardInterrupt:
+            print("\n🛑 Watch mode stopped.")
+        except Exception as e:
+            print(f"❌ An error occurred in watch mode: {e}")
+            traceback.print_exc()
+            sys.exit(1)
+
     # --- Mode: QUERY ---
     elif args.mode == "query":
         if not args.query:
             print("❌ Error: --query is required in 'query' mode.")
             sys.exit(1)
 
+        try:
+            search_filter = SearchFilter(args.path_prefix, args.file_type, args.modified_after, args.modified_before)
+        except ValueError as e:
+            print(f"❌ Error: {e}")
+            sys.exit(1)
+
         # The query call now relies on internal RAG agent settings for top_k
         print(f"🔎 Querying RAG agent with: '{args.query}' (using internal re-ranking logic)")
+        if not search_filter.is_empty():
+            print(f"🗂️ Search filter: {search_filter.describe()}")
         try:
-            rag = AgenticRAG()
+            rag = AgenticRAG(collections or None)
+            print(f"📚 Collections: {', '.join(rag.collections)}")
 
-            # The AgenticRAG object handles retrieval, re-ranking, and LLM generation
-            res = rag.query(args.query)
+            # The AgenticRAG object handles retrieval, re-ranking, and LLM generation.
+            # query_stream() returns after retrieval; the answer is printed as it is generated.
+            res = rag.query_stream(args.query, search_filter=search_filter)
 
             # Display formatted output
+            if res.get("cached"):
+                print(f"⚡ Served from the semantic answer cache (similarity {res['similarity']:.2f}).")
+
             print("\n" + "=" * 50)
             print("🤖 Answer:")
-            print(res["answer"])
+            for piece in res["answer_stream"]:
+                print(piece, end="", flush=True)
+            print()
             print("=" * 50)
 
             print("\n📚 Sources Used:")
@@ -151,6 +346,13 @@ def main():
 
             print("--------------------------------------------------")
 
+            generation_stats = res["generation_stats"]
+            ttft_ms = generation_stats.get("query_ttft_ms")
+            if ttft_ms is not None:
+                print(f"⏱️ Time to first token: {ttft_ms / 1000:.2f}s "
+                      f"(retrieval {(ttft_ms - generation_stats['ttft_ms']) / 1000:.2f}s, "
+                      f"total generation {generation_stats['generation_ms'] / 1000:.2f}s)")
+
         except Exception as e:
             print(f"❌ An error occurred during query: {e}")
             # print the traceback for easier debugging if a new error occurs
@@ -0,0 +1,47 @@
+import glob
+import os
+import re
+
+from config import FILE_MANIFEST_PATH
+
+# The original single collection; it keeps the configured storage paths unchanged
+DEFAULT_COLLECTION = "rag_docs"
+
+# Valid as a Chroma collection name and as part of a file name: 3-63 letters, digits, '_' or
+# '-', starting and ending with a letter or digit (no dots, which separate the name in paths)
+_NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{1,61}[A-Za-z0-9]$")
+
+
+def validate_collection_name(name):
+    """Returns the name if it is a valid collection name; raises ValueError otherwise."""
+    if not isinstance(name, str) or not _NAME_PATTERN.match(name):
+        raise ValueError(f"Invalid collection name: {name!r} (3-63 letters, digits, '_' or '-', "
+                         "starting and ending with a letter or digit)")
+    return name
+
+
+def collection_path(path, name):
+    """
+    Storage path of a collection's copy of a configured file or directory: the path itself
+    for the default collection, otherwise the name inserted before the extension
+    (file_manifest.sqlite3 -> file_manifest.projects.sqlite3, numpy_store -> numpy_store.projects).
+    """
+    if name == DEFAULT_COLLECTION:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{validate_collection_name(name)}{ext}"
+
+
+def list_collections():
+    """
+    Names of the collections that exist on disk, default first. Every indexed collection has
+    a file manifest, so the manifests double as the registry of collections.
+    """
+    root, ext = os.path.splitext(FILE_MANIFEST_PATH)
+    names = set()
+    for path in glob.glob(glob.escape(root) + ".*" + glob.escape(ext)):
+        name = path[len(root) + 1:len(path) - len(ext)]
+        if _NAME_PATTERN.match(name):
+            names.add(name)
+    names.discard(DEFAULT_COLLECTION)
+    return [DEFAULT_COLLECTION] + sorted(names)
@@ -0,0 +1,651 @@
+import os
+import json
+import sqlite3
+import threading
+
+import numpy as np
+import rich
+
+from ivf_index import IVFIndex, default_nlist
+from quantization import QuantizedVectors
+from vector_store import VectorStore, metadata_matches
+
+console = rich.get_console()
+
+# Rows the embedding file grows by at least (it doubles beyond that)
+_MIN_CAPACITY = 1024
+# SQLite limits the number of bound parameters per statement; stay well below it
+_SQL_PARAM_CHUNK = 500
+# Rows re-encoded per step when (re)building the compressed copy
+_ENCODE_BLOCK = 65536
+
+
+def _source_of(metadata):
+    return metadata.get("source") if metadata else None
+
+
+def _sources_in(where):
+    """
+    The source paths a where filter restricts to, when it is a plain source filter
+    ({"source": path}, {"source": {"$eq": path}} or {"source": {"$in": [...]}}); else None.
+    """
+    if len(where) != 1 or "source" not in where:
+        return None
+    condition = where["source"]
+    if isinstance(condition, str):
+        return [condition]
+    if isinstance(condition, dict) and len(condition) == 1:
+        if "$eq" in condition:
+            return [condition["$eq"]]
+        if "$in" in condition:
+            return list(condition["$in"])
+    return None
+
+
+def _smallest(values, k):
+    """Indices of the k smallest values, smallest first."""
+    top = np.argpartition(values, k - 1)[:k] if k < len(values) else np.arange(len(values))
+    return top[np.argsort(values[top], kind="stable")]
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process vector store: exact nearest-neighbour search over a memory-mapped float32
+    embedding matrix, with chunk IDs, documents and metadata in a SQLite sidecar.
+
+    Files (in `path`):
+      - embeddings.f32   row-major float32 matrix, one row ("slot") per chunk
+      - store.sqlite3    slot -> chunk ID, document, metadata JSON and squared norm
+
+    Search is one matrix-vector product per query vector over the live rows followed by
+    np.argpartition for the top K, so there is no server process, no index build and no
+    warm-up: opening the store only reads the ID/norm columns of the sidecar, while the
+    matrix is paged in by the OS on first use. Deleted chunks leave a tombstone (the slot
+    is marked dead and excluded from search); tombstoned slots are reused by later inserts.
+
+    With index="ivf", search goes through an IVF index (ivf_index.py) once the store holds
+    `train_min` chunks: only the rows of the `nprobe` clusters nearest to the query are
+    scored, exactly. The index is trained automatically, retrained when the store has grown
+    `retrain_growth` times since, and each slot's cluster is kept in the sidecar so opening
+    the store does not re-assign anything. When more than `compact_ratio` of the slots are
+    tombstones (e.g. after cleanup_deleted_files), the store compacts itself: live rows move
+    into the holes, the file shrinks and the posting lists are rebuilt.
+
+    Every slot's source file is also kept as an integer code in memory (and as a sidecar
+    column), so a source filter ({"source": {"$in": [...]}}, what filtered retrieval sends)
+    becomes one vectorized lookup, and only the matching rows are scored.
+
+    With quantization="float16" or "int8" (quantization.py), candidates are scored on a
+    compressed copy of the matrix, 2x or ~4x smaller, so a scan reads far less memory; only
+    the best `rescore` * K candidates are then re-scored exactly from the float32 rows.
+    """
+
+    def __init__(self, path, name="rag_docs", index="flat", nlist=0, nprobe=16, train_min=20000,
+                 retrain_growth=4.0, compact_ratio=0.25, quantization="none", rescore=4):
+        self.path = path
+        self.name = name
+        if index not in ("flat", "ivf"):
+            raise ValueError(f"Unsupported numpy vector index: {index}")
+        if quantization != "none" and quantization not in QuantizedVectors.KINDS:
+            raise ValueError(f"Unsupported vector quantization: {quantization}")
+        self.index_type = index
+        self.quantization = quantization
+        self.rescore = max(1, rescore)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_min = train_min
+        self.retrain_growth = retrain_growth
+        self.compact_ratio = compact_ratio
+        os.makedirs(path, exist_ok=True)
+        self._matrix_path = os.path.join(path, "embeddings.f32")
+        self._centroids_path = os.path.join(path, "ivf_centroids.npy")
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(path, "store.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS meta (
+                key   TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS chunks (
+                slot     INTEGER PRIMARY KEY,
+                chunk_id TEXT    NOT NULL UNIQUE,
+                document TEXT,
+                metadata TEXT,
+                norm     REAL    NOT NULL,
+                cluster  INTEGER NOT NULL DEFAULT -1
+            );
+            """
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")]
+        # Stores created before the IVF index have no cluster column yet
+        if "cluster" not in columns:
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN cluster INTEGER NOT NULL DEFAULT -1")
+        # ... and stores created before filtered retrieval no source column
+        if "source" not in columns:
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN source TEXT")
+            for slot, metadata in self._conn.execute("SELECT slot, metadata FROM chunks").fetchall():
+                source = _source_of(json.loads(metadata) if metadata else None)
+                if source is not None:
+                    self._conn.execute("UPDATE chunks SET source = ? WHERE slot = ?", (source, slot))
+        self._conn.commit()
+
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        self.dim = int(row[0]) if row else None
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'ivf_trained_on'").fetchone()
+        self._trained_on = int(row[0]) if row else 0
+        self._matrix = None
+        self._capacity = 0
+        self.codes = None
+        self.index = None
+        self._load()
+
+    # --- State ---
+
+    def _load(self):
+        """Loads slot bookkeeping from the sidecar and maps the embedding file."""
+        rows = self._conn.execute("SELECT slot, chunk_id, norm, cluster, source FROM chunks").fetchall()
+        self._slot_of = {row[1]: row[0] for row in rows}
+        size = max((row[0] for row in rows), default=-1) + 1
+        # _ids has one entry per used slot; the per-slot arrays are sized to the file's capacity
+        self._ids = [None] * size
+        self._norms = np.zeros(size, dtype=np.float32)
+        self._alive = np.zeros(size, dtype=bool)
+        self._clusters = np.full(size, -1, dtype=np.int32)
+        # Source file of every slot as an integer code (-1 = none); _source_codes maps path -> code
+        self._source_codes = {}
+        self._sources = np.full(size, -1, dtype=np.int32)
+        for slot, chunk_id, norm, cluster, source in rows:
+            self._ids[slot] = chunk_id
+            self._norms[slot] = norm
+            self._alive[slot] = True
+            self._clusters[slot] = cluster
+            self._sources[slot] = self._source_code(source)
+        self._free = [slot for slot in range(size) if not self._alive[slot]]
+        if self.dim is not None and os.path.exists(self._matrix_path):
+            self._map(max(size, os.path.getsize(self._matrix_path) // (4 * self.dim)))
+        self._sync_codes(size)
+
+        if self.index_type == "ivf" and os.path.exists(self._centroids_path):
+            self.index = IVFIndex.load(self._centroids_path)
+            # Chunks written while the store was opened with index="flat" have no cluster yet
+            unassigned = np.flatnonzero(self._live() & (self._clusters[:size] < 0))
+            if len(unassigned):
+                self._assign_slots(unassigned, self.index)
+            self._rebuild_lists()
+
+    def _map(self, capacity):
+        """(Re)maps the embedding file with room for exactly `capacity` rows (growing or shrinking it)."""
+        if self._matrix is not None:
+            self._matrix.flush()
+            # The map must be released before the file can be resized (required on Windows)
+            self._matrix = None
+        needed = capacity * self.dim * 4
+        with open(self._matrix_path, "ab") as f:
+            if f.tell() != needed:
+                f.truncate(needed)
+        self._capacity = capacity
+        self._matrix = np.memmap(self._matrix_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        if self.quantization != "none":
+            if self.codes is None:
+                self.codes = QuantizedVectors(self.path, self.quantization, self.dim)
+            self.codes.map(capacity)
+        if len(self._norms) < capacity:
+            grow = capacity - len(self._norms)
+            self._norms = np.concatenate([self._norms, np.zeros(grow, dtype=np.float32)])
+            self._alive = np.concatenate([self._alive, np.zeros(grow, dtype=bool)])
+            self._clusters = np.concatenate([self._clusters, np.full(grow, -1, dtype=np.int32)])
+            self._sources = np.concatenate([self._sources, np.full(grow, -1, dtype=np.int32)])
+        else:
+            self._norms = self._norms[:capacity]
+            self._alive = self._alive[:capacity]
+            self._clusters = self._clusters[:capacity]
+            self._sources = self._sources[:capacity]
+
+    def _sync_codes(self, size):
+        """
+        Re-encodes the compressed copy when it was not kept up to date with the float32
+        matrix: the store was last written with another quantization setting (or none).
+        """
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'quantization'").fetchone()
+        if (row[0] if row else "none") == self.quantization:
+            return
+        if self.codes is not None and size:
+            console.print(f"Encoding {size} stored vectors as {self.quantization}...")
+            for start in range(0, size, _ENCODE_BLOCK):
+                end = min(size, start + _ENCODE_BLOCK)
+                self.codes.write(np.arange(start, end), self._matrix[start:end])
+            self.codes.flush()
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('quantization', ?)",
+                               (self.quantization,))
+
+    def _size(self):
+        return len(self._ids)
+
+    def _source_code(self, source):
+        if source is None:
+            return -1
+        return self._source_codes.setdefault(source, len(self._source_codes))
+
+    def _live(self, where=None):
+        """Mask over the used slots: live chunks, optionally restricted by a where filter."""
+        live = self._alive[:self._size()]
+        return live & self._where_mask(where) if where else live
+
+    def _allocate(self):
+        """Returns a slot for a new chunk: a tombstoned one if available, else a new row."""
+        if self._free:
+            return self._free.pop()
+        slot = self._size()
+        if slot >= self._capacity:
+            self._map(max(_MIN_CAPACITY, self._capacity * 2))
+        self._ids.append(None)
+        return slot
+
+    def _vectors(self, embeddings):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2:
+            raise ValueError("embeddings must be a list of vectors")
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?)", (str(self.dim),))
+            self._map(_MIN_CAPACITY)
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the store's {self.dim}")
+        return vectors
+
+    def _rows(self, slots, include):
+        """Documents/metadatas of slots, in order, read from the sidecar."""
+        want_documents = "documents" in include
+        want_metadatas = "metadatas" in include
+        by_slot = {}
+        if want_documents or want_metadatas:
+            for i in range(0, len(slots), _SQL_PARAM_CHUNK):
+                part = [int(s) for s in slots[i:i + _SQL_PARAM_CHUNK]]
+                placeholders = ",".join("?" * len(part))
+                for slot, document, metadata in self._conn.execute(
+                        f"SELECT slot, document, metadata FROM chunks WHERE slot IN ({placeholders})", part):
+                    by_slot[slot] = (document, json.loads(metadata) if metadata else None)
+        result = {"ids": [self._ids[s] for s in slots]}
+        result["documents"] = [by_slot[s][0] for s in slots] if want_documents else None
+        result["metadatas"] = [by_slot[s][1] for s in slots] if want_metadatas else None
+        result["embeddings"] = [self._matrix[s].tolist() for s in slots] if "embeddings" in include else None
+        return result
+
+    def _where_mask(self, where):
+        """Slots whose metadata matches a Chroma-style where filter."""
+        sources = _sources_in(where)
+        if sources is not None:
+            # Source filters use the in-memory source codes instead of parsing every metadata row
+            codes = [self._source_codes[source] for source in sources if source in self._source_codes]
+            return np.isin(self._sources[:self._size()], codes)
+        mask = np.zeros(self._size(), dtype=bool)
+        for slot, metadata in self._conn.execute("SELECT slot, metadata FROM chunks"):
+            if metadata_matches(json.loads(metadata) if metadata else {}, where):
+                mask[slot] = True
+        return mask
+
+    # --- Maintenance ---
+
+    def _rebuild_lists(self):
+        """Rebuilds the IVF posting lists from the clusters of the live slots."""
+        slots = np.flatnonzero(self._live() & (self._clusters[:self._size()] >= 0))
+        self.index.rebuild(slots, self._clusters[slots])
+
+    def _assign_slots(self, slots, index):
+        """Assigns stored rows to their nearest IVF centroid and persists the clusters."""
+        clusters = index.assign(self._matrix, rows=slots)
+        with self._conn:
+            self._conn.executemany("UPDATE chunks SET cluster = ? WHERE slot = ?",
+                                   zip(clusters.tolist(), slots.tolist()))
+        self._clusters[slots] = clusters
+
+    def build_index(self):
+        """
+        (Re)trains the IVF index on the live vectors and assigns every chunk to a cluster.
+
+        Returns:
+            int: Number of IVF lists (0 if the store is empty).
+        """
+        with self._lock:
+            slots = np.flatnonzero(self._live())
+            if not len(slots):
+                return 0
+            nlist = self.nlist or default_nlist(len(slots))
+            console.print(f"Training IVF index: {nlist} lists over {len(slots)} chunks...")
+            index = IVFIndex.train(self._matrix, nlist, rows=slots)
+            index.save(self._centroids_path)
+            self._assign_slots(slots, index)
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('ivf_trained_on', ?)",
+                                   (str(len(slots)),))
+            self._trained_on = len(slots)
+            self.index = index
+            self._rebuild_lists()
+            return index.nlist
+
+    def compact(self):
+        """
+        Moves the last live rows into tombstoned slots, shrinks the embedding file to the
+        live rows and purges stale IVF posting list entries.
+
+        Returns:
+            int: Number of slots reclaimed.
+        """
+        with self._lock:
+            size = self._size()
+            live = np.flatnonzero(self._alive[:size])
+            count = len(live)
+            movers = live[live >= count]
+            holes = np.flatnonzero(~self._alive[:count])
+            if len(movers):
+                self._matrix[holes] = self._matrix[movers]
+                if self.codes is not None:
+                    self.codes.move(holes, movers)
+                    self.codes.flush()
+                # Copies first: until the sidecar commit, the moved rows are still found at the old slots
+                self._matrix.flush()
+                with self._conn:
+                    self._conn.executemany("UPDATE chunks SET slot = ? WHERE slot = ?",
+                                           zip(holes.tolist(), movers.tolist()))
+                for hole, mover in zip(holes.tolist(), movers.tolist()):
+                    self._ids[hole] = self._ids[mover]
+                    self._slot_of[self._ids[hole]] = hole
+                self._norms[holes] = self._norms[movers]
+                self._clusters[holes] = self._clusters[movers]
+                self._sources[holes] = self._sources[movers]
+                self._alive[holes] = True
+            self._alive[count:] = False
+            self._clusters[count:] = -1
+            self._sources[count:] = -1
+            del self._ids[count:]
+            self._free = []
+            if self.dim is not None:
+                self._map(max(_MIN_CAPACITY, count))
+            if self.index is not None:
+                self._rebuild_lists()
+            return size - count
+
+    def _maintain(self):
+        """Upkeep after writes and deletes: compaction, IVF (re)training and posting list purges."""
+        size = self._size()
+        if size >= _MIN_CAPACITY and len(self._free) > self.compact_ratio * size:
+            self.compact()
+        if self.index_type != "ivf":
+            return
+        count = len(self._slot_of)
+        if self.index is None:
+            if count >= self.train_min:
+                self.build_index()
+        elif count >= self.retrain_growth * self._trained_on:
+            # The lists were sized for a much smaller store; retrain for the current size
+            self.build_index()
+        elif self.index.stale_ratio() > self.compact_ratio:
+            self._rebuild_lists()
+
+    # --- Search ---
+
+    def _distances(self, queries, slots=None, exact=False):
+        """
+        Squared L2 distances (Chroma's default space), |q|^2 + |x|^2 - 2 q.x, of query vectors
+        to the given slots (default: every used slot). Computed from the compressed copy when
+        the store is quantized, unless `exact`.
+        """
+        size = self._size()
+        norms = self._norms[:size] if slots is None else self._norms[slots]
+        if self.codes is not None and not exact:
+            dots = self.codes.dot(queries, slots, size)
+        else:
+            rows = self._matrix[:size] if slots is None else np.asarray(self._matrix[slots])
+            dots = queries @ rows.T
+        return norms[None, :] + np.einsum("ij,ij->i", queries, queries)[:, None] - 2.0 * dots
+
+    def _rank(self, query, slots, k):
+        """
+        The k nearest of the given slots to one query vector: (slots, exact distances), nearest
+        first. On a quantized store the slots are first narrowed down to a shortlist of
+        `rescore` * k by their compressed vectors; only the shortlist's float32 rows are read.
+        """
+        if self.codes is not None and len(slots) > k * self.rescore:
+            approximate = self._distances(query[None, :], slots)[0]
+            slots = slots[_smallest(approximate, k * self.rescore)]
+        distances = self._distances(query[None, :], slots, exact=True)[0]
+        top = _smallest(distances, k)
+        return slots[top], distances[top]
+
+    def _search_flat(self, queries, live, k):
+        distances = self._distances(queries)
+        distances[:, ~live] = np.inf
+        hits = []
+        for query, row in zip(queries, distances):
+            if self.codes is None:
+                top = _smallest(row, k)
+                hits.append((top, row[top]))
+            else:
+                shortlist = _smallest(row, k * self.rescore)
+                hits.append(self._rank(query, shortlist[live[shortlist]], k))
+        return hits
+
+    def _search_ivf(self, queries, live, k, selectivity=1.0):
+        # A where filter keeps only a share of every list: probe proportionally more lists so
+        # the nearest matching chunks are still found, or score the matching rows exactly when
+        # that would cover most lists anyway
+        nprobe = int(np.ceil(self.nprobe / max(selectivity, 1e-9)))
+        if nprobe * 2 >= self.index.nlist and selectivity < 1.0:
+            matching = np.flatnonzero(live)
+            return [self._rank(query, matching, k) for query in queries]
+
+        hits = []
+        for query, probes in zip(queries, self.index.probe(queries, nprobe)):
+            candidates = self.index.candidates(probes, self._clusters, live)
+            nprobe = len(probes)
+            # Too few live (or filter-matching) chunks in the probed lists: probe more lists
+            while len(candidates) < k and nprobe < self.index.nlist:
+                nprobe = min(self.index.nlist, nprobe * 2)
+                candidates = self.index.candidates(self.index.probe(query[None, :], nprobe)[0],
+                                                   self._clusters, live)
+            hits.append(self._rank(query, candidates, k))
+        return hits
+
+    # --- VectorStore API ---
+
+    def count(self):
+        with self._lock:
+            return len(self._slot_of)
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=None):
+        include = ["documents", "metadatas"] if include is None else include
+        with self._lock:
+            if ids is not None:
+                slots = [self._slot_of[i] for i in dict.fromkeys(ids) if i in self._slot_of]
+                if where:
+                    mask = self._live(where)
+                    slots = [s for s in slots if mask[s]]
+            else:
+                # Slot order is stable while no chunks are added or removed, which is what
+                # limit/offset paging relies on
+                slots = np.flatnonzero(self._live(where)).tolist()
+            slots = slots[offset or 0:]
+            if limit is not None:
+                slots = slots[:limit]
+            return self._rows(slots, include)
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None, ids=None):
+        include = ["documents", "metadatas", "distances"] if include is None else include
+        with self._lock:
+            empty = {key: [] for key in ("ids", "documents", "metadatas", "distances")}
+            if self._matrix is None or not self._slot_of:
+                return {key: [[] for _ in query_embeddings] for key in empty}
+
+            queries = self._vectors(query_embeddings)
+            live = self._live(where)
+            if ids is not None:
+                allowed = np.zeros(len(live), dtype=bool)
+                allowed[[self._slot_of[i] for i in ids if i in self._slot_of]] = True
+                live = live & allowed
+            restricted = bool(where) or ids is not None
+            k = min(n_results, int(live.sum()))
+            if k <= 0:
+                hits = [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+            elif self.index is not None:
+                hits = self._search_ivf(queries, live, k, int(live.sum()) / len(self._slot_of) if restricted else 1.0)
+            elif restricted and live.sum() * 2 < len(self._slot_of):
+                # Selective filter: score only the matching rows instead of masking a full scan
+                matching = np.flatnonzero(live)
+                hits = [self._rank(query, matching, k) for query in queries]
+            else:
+                hits = self._search_flat(queries, live, k)
+
+            result = {key: [] for key in empty}
+            for top, distances in hits:
+                rows = self._rows(top.tolist(), include)
+                for key in ("ids", "documents", "metadatas"):
+                    result[key].append(rows[key])
+                result["distances"].append(np.maximum(distances, 0.0).tolist() if "distances" in include else None)
+            for key in ("documents", "metadatas", "distances"):
+                if key not in include:
+                    result[key] = None
+            return result
+
+    def add(self, ids, embeddings, documents=None, metadatas=None):
+        with self._lock:
+            rows = [i for i, chunk_id in enumerate(ids) if chunk_id not in self._slot_of]
+            if rows:
+                self._write([ids[i] for i in rows], [embeddings[i] for i in rows],
+                            [documents[i] for i in rows] if documents is not None else None,
+                            [metadatas[i] for i in rows] if metadatas is not None else None)
+                self._maintain()
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        with self._lock:
+            self._write(ids, embeddings, documents, metadatas)
+            self._maintain()
+
+    def _write(self, ids, embeddings, documents, metadatas):
+        # Duplicate IDs within one call: the last occurrence wins
+        last = list(dict((chunk_id, i) for i, chunk_id in enumerate(ids)).values())
+        if len(last) < len(ids):
+            ids = [ids[i] for i in last]
+            embeddings = [embeddings[i] for i in last]
+            documents = [documents[i] for i in last] if documents is not None else None
+            metadatas = [metadatas[i] for i in last] if metadatas is not None else None
+        vectors = self._vectors(embeddings)
+        norms = np.einsum("ij,ij->i", vectors, vectors)
+        slots = []
+        for chunk_id in ids:
+            slot = self._slot_of.get(chunk_id)
+            slots.append(self._allocate() if slot is None else slot)
+        clusters = self.index.assign(vectors) if self.index is not None else np.full(len(ids), -1)
+        for slot, vector in zip(slots, vectors):
+            self._matrix[slot] = vector
+        if self.codes is not None:
+            self.codes.write(slots, vectors)
+            self.codes.flush()
+        # Vectors first: a crash before the sidecar commit leaves only unreferenced rows
+        self._matrix.flush()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (slot, chunk_id, document, metadata, norm, cluster, source) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(slot, chunk_id,
+                  documents[i] if documents is not None else None,
+                  json.dumps(metadatas[i]) if metadatas is not None and metadatas[i] is not None else None,
+                  float(norms[i]), int(clusters[i]), _source_of(metadatas[i]) if metadatas is not None else None)
+                 for i, (slot, chunk_id) in enumerate(zip(slots, ids))])
+        if self.index is not None:
+            # Replaced chunks leave their old posting list entry behind
+            self.index.discard(int((self._clusters[slots] >= 0).sum()))
+            self.index.add(slots, clusters)
+        for i, (slot, chunk_id, norm, cluster) in enumerate(zip(slots, ids, norms, clusters)):
+            self._ids[slot] = chunk_id
+            self._slot_of[chunk_id] = slot
+            self._norms[slot] = norm
+            self._alive[slot] = True
+            self._clusters[slot] = cluster
+            self._sources[slot] = self._source_code(_source_of(metadatas[i]) if metadatas is not None else None)
+
+    def update(self, ids, embeddings=None, documents=None, metadatas=None):
+        with self._lock:
+            known = [i for i, chunk_id in enumerate(ids) if chunk_id in self._slot_of]
+            if not known:
+                return
+            if embeddings is not None:
+                vectors = self._vectors([embeddings[i] for i in known])
+                slots = [self._slot_of[ids[i]] for i in known]
+                for slot, vector in zip(slots, vectors):
+                    self._matrix[slot] = vector
+                    self._norms[slot] = float(vector @ vector)
+                if self.codes is not None:
+                    self.codes.write(slots, vectors)
+                    self.codes.flush()
+                self._matrix.flush()
+                if self.index is not None:
+                    # Changed vectors may belong to another cluster now
+                    self.index.discard(len(slots))
+                    self._clusters[slots] = self.index.assign(vectors)
+                    self.index.add(slots, self._clusters[slots])
+            with self._conn:
+                for i in known:
+                    slot = self._slot_of[ids[i]]
+                    if embeddings is not None:
+                        self._conn.execute("UPDATE chunks SET norm = ?, cluster = ? WHERE slot = ?",
+                                           (float(self._norms[slot]), int(self._clusters[slot]), slot))
+                    if documents is not None:
+                        self._conn.execute("UPDATE chunks SET document = ? WHERE slot = ?", (documents[i], slot))
+                    if metadatas is not None:
+                        # e.g. the new path of a moved file
+                        self._conn.execute("UPDATE chunks SET metadata = ?, source = ? WHERE slot = ?",
+                                           (json.dumps(metadatas[i]), _source_of(metadatas[i]), slot))
+                        self._sources[slot] = self._source_code(_source_of(metadatas[i]))
+
+    def delete(self, ids=None, where=None):
+        with self._lock:
+            if ids is None:
+                ids = [self._ids[slot] for slot in np.flatnonzero(self._live(where))]
+            slots = [self._slot_of.pop(chunk_id) for chunk_id in dict.fromkeys(ids) if chunk_id in self._slot_of]
+            if not slots:
+                return
+            with self._conn:
+                for i in range(0, len(slots), _SQL_PARAM_CHUNK):
+                    part = slots[i:i + _SQL_PARAM_CHUNK]
+                    self._conn.execute(f"DELETE FROM chunks WHERE slot IN ({','.join('?' * len(part))})", part)
+            if self.index is not None:
+                self.index.discard(int((self._clusters[slots] >= 0).sum()))
+            # Tombstones: the rows stay in the matrix, excluded from search until reused
+            for slot in slots:
+                self._ids[slot] = None
+                self._alive[slot] = False
+                self._clusters[slot] = -1
+                self._sources[slot] = -1
+                self._free.append(slot)
+            self._maintain()
+
+    def footprint(self):
+        """
+        Returns:
+            dict: chunks, quantization, float32_bytes (full-precision matrix) and search_bytes
+            (what scoring every chunk reads: the compressed copy when quantized).
+        """
+        with self._lock:
+            size = self._size()
+            float32_bytes = size * (self.dim or 0) * 4
+            return {
+                "chunks": len(self._slot_of),
+                "quantization": self.quantization,
+                "float32_bytes": float32_bytes,
+                "search_bytes": size * self.codes.bytes_per_vector if self.codes is not None else float32_bytes,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._matrix is not None:
+                self._matrix.flush()
+            if self.codes is not None:
+                self.codes.flush()
+            self._conn.close()
@@ -0,0 +1,140 @@
+import os
+import re
+import json
+import sqlite3
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from config import QUERY_CACHE_PATH, QUERY_CACHE_TTL_SECONDS, QUERY_CACHE_MAX_ENTRIES
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    """Case- and whitespace-insensitive form of a question, so trivial variations share a cache entry."""
+    return _WHITESPACE.sub(" ", query).strip().lower()
+
+
+class QueryCache:
+    """
+    Two-tier cache for per-question artefacts of AgenticRAG.retrieve (HyDE documents,
+    query embeddings).
+
+    Tier 1 is an in-process LRU (`max_entries`), tier 2 an optional SQLite file that
+    survives restarts and Streamlit reloads. Entries are keyed by
+    (kind, model names, normalized question) and carry:
+      - a creation time: entries older than `ttl_seconds` are ignored, and
+      - the collection generation they were computed against (FileManifest.generation()):
+        an entry from an older generation is treated as a miss, so re-indexing
+        invalidates everything cached before it.
+    """
+
+    def __init__(self, path=QUERY_CACHE_PATH, ttl_seconds=QUERY_CACHE_TTL_SECONDS,
+                 max_entries=QUERY_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (value, created_at, generation)
+
+        # path=None keeps the cache in memory only
+        self._conn = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS query_cache (
+                    key        TEXT PRIMARY KEY,
+                    value      TEXT    NOT NULL,
+                    created_at REAL    NOT NULL,
+                    generation INTEGER NOT NULL
+                )
+                """
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def _key(kind, models, query):
+        raw = "\x1f".join([kind, *models, normalize_query(query)])
+        return hashlib.sha256(raw.encode("utf-8", errors="ignore")).hexdigest()
+
+    def _fresh(self, created_at, generation, current_generation):
+        return generation == current_generation and time.time() - created_at <= self.ttl_seconds
+
+    def get(self, kind, models, query, generation):
+        """
+        Looks up a cached value.
+
+        Args:
+            kind (str): What is cached, e.g. "hyde" or "query_embedding".
+            models (tuple[str, ...]): Model names the value depends on.
+            query (str): The user question (normalized internally).
+            generation (int): Current collection generation.
+
+        Returns:
+            The cached (JSON-compatible) value, or None on a miss.
+        """
+        key = self._key(kind, models, query)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at, entry_generation = entry
+                if self._fresh(created_at, entry_generation, generation):
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, created_at, generation FROM query_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created_at, entry_generation = row
+                    if self._fresh(created_at, entry_generation, generation):
+                        value = json.loads(value)
+                        # Promote to the memory tier
+                        self._remember(key, (value, created_at, entry_generation))
+                        self.disk_hits += 1
+                        return value
+                    self._conn.execute("DELETE FROM query_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+
+            self.misses += 1
+            return None
+
+    def put(self, kind, models, query, value, generation):
+        """Stores a JSON-compatible value in both tiers."""
+        key = self._key(kind, models, query)
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, (value, created_at, generation))
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO query_cache (key, value, created_at, generation) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), created_at, generation)
+                )
+                # Entries from older generations can never be served again
+                self._conn.execute("DELETE FROM query_cache WHERE generation != ?", (generation,))
+                self._conn.commit()
+
+    def _remember(self, key, entry):
+        """Inserts into the LRU tier, evicting the least recently used entry. Lock must be held."""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,165 @@
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from query_service import QueryService
+from search_filters import SearchFilter
+from config import SERVE_HOST, SERVE_PORT, SERVE_MAX_TOP_K
+
+# Request bodies larger than this are rejected
+_MAX_BODY_BYTES = 1024 * 1024
+
+
+class _BadRequest(Exception):
+    pass
+
+
+def _filter_param(body):
+    try:
+        return SearchFilter.from_dict(body.get("filters"))
+    except ValueError as e:
+        raise _BadRequest(str(e))
+
+
+def _collections_param(body, rag):
+    names = body.get("collections")
+    if names is None:
+        return None
+    if isinstance(names, str):
+        names = [names]
+    if not isinstance(names, list) or not names or not all(isinstance(n, str) for n in names):
+        raise _BadRequest("'collections' must be a collection name or a non-empty list of names")
+    try:
+        rag._shards_for(names)
+    except ValueError as e:
+        raise _BadRequest(str(e))
+    return names
+
+
+def _int_param(body, key):
+    value = body.get(key)
+    if value is None:
+        return None
+    if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+        raise _BadRequest(f"'{key}' must be a positive integer")
+    if value > SERVE_MAX_TOP_K:
+        raise _BadRequest(f"'{key}' must be at most {SERVE_MAX_TOP_K}")
+    return value
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API over a shared QueryService (set on the server as `service`):
+
+      GET  /health    -> {"status": "ok", "chunks": ..., "collections": {name: chunks}, "service": {...}}
+      POST /retrieve  {"query", "top_k"?, "top_n"?, "filters"?, "collections"?}
+                      -> context chunks, sources, chunk IDs
+      POST /query     {"query", "chat_history"?, "top_k"?, "top_n"?, "filters"?, "collections"?}
+                      -> answer, sources, context chunks
+
+    "filters" restricts the search to part of the indexed files: {"path_prefixes": [...],
+    "file_types": [...], "modified_after": ..., "modified_before": ...} (see SearchFilter).
+    "collections" names the collections to search (default: the agent's QUERY_COLLECTIONS).
+    "top_k" and "top_n" are limited to SERVE_MAX_TOP_K.
+
+    ThreadingHTTPServer handles every connection on its own thread; the requests meet on the
+    service's event loop, where their embeddings and vector searches are micro-batched.
+    """
+
+    server_version = "CoralRAG/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > _MAX_BODY_BYTES:
+            raise _BadRequest("request body too large")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise _BadRequest("request body is not valid JSON")
+        if not isinstance(body, dict):
+            raise _BadRequest("request body must be a JSON object")
+        query = body.get("query")
+        if not isinstance(query, str) or not query.strip():
+            raise _BadRequest("'query' is required")
+        return body
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/health":
+            self._send_json(404, {"error": f"unknown endpoint: {self.path}"})
+            return
+        service = self.server.service
+        try:
+            collections = {shard.name: shard.collection.count() for shard in service.rag._shards_for()}
+        except Exception as e:
+            self._send_json(503, {"status": "error", "error": str(e)})
+            return
+        self._send_json(200, {"status": "ok", "chunks": sum(collections.values()), "collections": collections,
+                              "service": service.stats()})
+
+    def do_POST(self):
+        route = {"/retrieve": self._retrieve, "/query": self._query}.get(self.path.rstrip("/"))
+        if route is None:
+            self._send_json(404, {"error": f"unknown endpoint: {self.path}"})
+            return
+        started = time.perf_counter()
+        try:
+            payload = route(self._read_json())
+        except _BadRequest as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            print(f"Error while serving {self.path}: {e}")
+            self._send_json(500, {"error": str(e)})
+            return
+        payload["elapsed_ms"] = (time.perf_counter() - started) * 1000
+        self._send_json(200, payload)
+
+    def _retrieve(self, body):
+        context, metadata, documents, chunk_ids = self.server.service.retrieve(
+            body["query"], top_k=_int_param(body, "top_k"), top_n=_int_param(body, "top_n"),
+            search_filter=_filter_param(body), collections=_collections_param(body, self.server.service.rag))
+        return {
+            "context_chunks": documents,
+            "chunk_ids": chunk_ids,
+            "metadata": metadata,
+            "sources": list(dict.fromkeys(md.get("source", "Unknown Source") for md in metadata)),
+        }
+
+    def _query(self, body):
+        chat_history = body.get("chat_history") or []
+        if not isinstance(chat_history, list) or not all(
+                isinstance(h, dict) and "speaker" in h and "message" in h for h in chat_history):
+            raise _BadRequest("'chat_history' must be a list of {\"speaker\", \"message\"} objects")
+        return self.server.service.query(
+            body["query"], chat_history=chat_history, top_k=_int_param(body, "top_k"),
+            top_n=_int_param(body, "top_n"), search_filter=_filter_param(body),
+            collections=_collections_param(body, self.server.service.rag))
+
+    def log_message(self, format, *args):
+        # One line per request, without the default stderr timestamp noise
+        print(f"{self.address_string()} - {format % args}")
+
+
+def serve(host=SERVE_HOST, port=SERVE_PORT, service=None):
+    """Runs the HTTP query API until interrupted (Ctrl+C)."""
+    server = ThreadingHTTPServer((host, port), QueryRequestHandler)
+    server.daemon_threads = True
+    server.service = service if service is not None else QueryService()
+    print(f"🌐 Query API listening on http://{host}:{server.server_address[1]} "
+          f"(GET /health, POST /retrieve, POST /query)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Query API stopped.")
+    finally:
+        server.server_close()
+        server.service.close()
@@ -0,0 +1,142 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from rag_agentic import AgenticRAG
+from config import (QUERY_MAX_CONCURRENCY, QUERY_MAX_CONCURRENT_GENERATIONS, REQUEST_BATCH_WINDOW_MS,
+                    REQUEST_BATCH_MAX_SIZE)
+
+
+class QueryService:
+    """
+    Serves queries from many callers (Streamlit sessions, HTTP handlers) with one shared
+    AgenticRAG instance and one long-lived event loop.
+
+    - The event loop runs on a background thread for the lifetime of the service, so a
+      request does not create (and tear down) a loop of its own.
+    - Per-request parameters (top_k, top_n, search_filter, collections) travel with the request; nothing on the shared
+      AgenticRAG is mutated, so concurrent sessions cannot change each other's settings.
+    - At most `max_concurrency` requests retrieve at once (embedding, HyDE, Chroma, re-ranking)
+      and at most `max_generations` answers are generated at once; further requests wait
+      their turn instead of piling onto Ollama and Chroma.
+    - With a batch window > 0, the query embeddings and vector searches of concurrent
+      requests are micro-batched into shared embedder and collection.query calls.
+
+    Blocking callers use query() / query_stream(); coroutines running on the service loop
+    (see loop) can await aquery() directly.
+    """
+
+    def __init__(self, rag=None, max_concurrency=QUERY_MAX_CONCURRENCY,
+                 max_generations=QUERY_MAX_CONCURRENT_GENERATIONS, batch_window_ms=REQUEST_BATCH_WINDOW_MS,
+                 max_batch=REQUEST_BATCH_MAX_SIZE):
+        self.rag = rag if rag is not None else AgenticRAG()
+        if batch_window_ms > 0:
+            self.rag.enable_request_batching(batch_window_ms, max_batch)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_generations = max(1, max_generations)
+
+        self.loop = asyncio.new_event_loop()
+        # asyncio.to_thread() work (Chroma queries, re-ranking, Ollama calls) of all requests.
+        # Sized for every admitted request running its concurrent searches at once.
+        self.loop.set_default_executor(ThreadPoolExecutor(
+            max_workers=self.max_concurrency * 4 + self.max_generations, thread_name_prefix="query-service"))
+        self._thread = threading.Thread(target=self.loop.run_forever, name="query-service-loop", daemon=True)
+        self._thread.start()
+
+        # Created on the service loop, which they belong to
+        self._request_slots, self._generation_slots = self._run(self._create_slots())
+        self.active_requests = 0
+
+    async def _create_slots(self):
+        return asyncio.Semaphore(self.max_concurrency), asyncio.Semaphore(self.max_generations)
+
+    def _run(self, coro, timeout=None):
+        """Runs a coroutine on the service loop and waits for its result (from any other thread)."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    async def _prepare(self, question, chat_history, top_k, top_n, search_filter, collections):
+        """Retrieval half of a request, within a request slot."""
+        async with self._request_slots:
+            self.active_requests += 1
+            try:
+                return await self.rag._aprepare_answer(question, chat_history, top_k, top_n, search_filter,
+                                                       collections)
+            finally:
+                self.active_requests -= 1
+
+    async def aquery(self, question, chat_history=None, top_k=None, top_n=None, search_filter=None,
+                     collections=None):
+        """
+        Answers a question. Must be awaited on the service loop.
+
+        Returns:
+            dict: The AgenticRAG.query() response.
+        """
+        chat_history = chat_history if chat_history is not None else []
+        result, state = await self._prepare(question, chat_history, top_k, top_n, search_filter, collections)
+        if result is not None:
+            return result
+
+        async with self._generation_slots:
+            answer = await asyncio.to_thread(self.rag.generate, question, state["context"], chat_history,
+                                             state["packed"])
+        result = self.rag._answer_result(state, answer)
+        self.rag._remember_answer(state, chat_history, result)
+        return result
+
+    async def aretrieve(self, question, top_k=None, top_n=None, search_filter=None, collections=None):
+        """Retrieval only (context, metadata, documents, chunk IDs). Must be awaited on the service loop."""
+        async with self._request_slots:
+            return await self.rag.retrieve(question, top_k=top_k, top_n=top_n, search_filter=search_filter,
+                                           collections=collections)
+
+    def query(self, question, chat_history=None, top_k=None, top_n=None, search_filter=None, collections=None,
+              timeout=None):
+        """Blocking aquery() for callers outside the service loop."""
+        return self._run(self.aquery(question, chat_history, top_k, top_n, search_filter, collections), timeout)
+
+    def retrieve(self, question, top_k=None, top_n=None, search_filter=None, collections=None, timeout=None):
+        """Blocking aretrieve() for callers outside the service loop."""
+        return self._run(self.aretrieve(question, top_k, top_n, search_filter, collections), timeout)
+
+    def query_stream(self, question, chat_history=None, top_k=None, top_n=None, search_filter=None,
+                     collections=None):
+        """
+        Blocking AgenticRAG.query_stream() for callers outside the service loop: retrieval runs
+        on the service loop; the answer is generated while the caller iterates 'answer_stream',
+        holding a generation slot until the stream is exhausted or closed.
+        """
+        chat_history = chat_history if chat_history is not None else []
+        result, state = self._run(self._prepare(question, chat_history, top_k, top_n, search_filter, collections))
+        result = self.rag._streaming_result(question, chat_history, result, state)
+        if "packed" in state:
+            result["answer_stream"] = self._with_generation_slot(result["answer_stream"])
+        return result
+
+    def _with_generation_slot(self, stream):
+        self._run(self._generation_slots.acquire())
+        try:
+            yield from stream
+        finally:
+            self.loop.call_soon_threadsafe(self._generation_slots.release)
+
+    def stats(self):
+        """
+        Returns:
+            dict: active_requests (retrieving right now), the configured limits and, when
+            batching, the embedding / search batch figures.
+        """
+        stats = {
+            "active_requests": self.active_requests,
+            "max_concurrency": self.max_concurrency,
+            "max_generations": self.max_generations,
+        }
+        if self.rag.embed_batcher is not None:
+            stats["embedding_batches"] = self.rag.embed_batcher.stats()
+            stats["search_batches"] = self.rag.search_batcher.stats()
+        return stats
+
+    def close(self):
+        """Stops the service loop. Requests still running are abandoned."""
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
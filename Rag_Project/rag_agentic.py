@@ -1,23 +1,57 @@
 import os
-import re
 import chromadb
 import ollama
 import asyncio
+import json
+import threading
+import time
 # Assuming these imports are available in the project environment
-from vector_db_factory import get_vector_db
+from vector_db_factory import open_collection
+from named_collections import DEFAULT_COLLECTION, validate_collection_name, list_collections
 from rag_embedder import OllamaBatchEmbedder
+from query_cache import QueryCache
+from semantic_cache import SemanticAnswerCache
+from fusion import reciprocal_rank_fusion
+from reranker import get_reranker
+from context_builder import ContextBuilder, CHUNK_SEPARATOR, count_tokens, llm_options
+from request_batcher import MicroBatcher
+from config import (QUERY_CACHE_ENABLED, QUERY_CACHE_PATH, SEMANTIC_CACHE_ENABLED, RETRIEVAL_MODE,
+                    QUERY_REWRITES, RRF_K, HYDE_MAX_TOKENS, MASTER_DOCS_PATH, QUERY_COLLECTIONS)
+
+
+def _check_unit_vectors(shard):
+    """
+    Refuses collections indexed before embeddings were L2-normalized: their unnormalized
+    vectors, compared by L2 distance with unit-length query vectors, would rank chunks
+    mostly by vector norm instead of by relevance.
+    """
+    unit_vectors = shard.manifest.unit_vectors()
+    if unit_vectors is False or (unit_vectors is None and shard.collection.count() > 0):
+        raise ValueError(f"Collection '{shard.name}' holds embeddings from before vector normalization; "
+                         f"run 'python main.py --mode reembed --collection {shard.name}' before querying it")
 
 
 class AgenticRAG:
     """
     Implements the Retrieval-Augmented Generation (RAG) agent using a two-stage
-    retrieval process (Candidate Generation + Simulated Re-Ranking) and Ollama
+    retrieval process (Candidate Generation + Re-Ranking) and Ollama
     for both embeddings and generation, now incorporating HyDE (Hypothetical Document Embedding).
+
+    Searches one or more named collections (see named_collections.py): by default
+    QUERY_COLLECTIONS, or the collections a request asks for. Several collections are
+    searched in parallel and their candidates merged by distance (or BM25 score).
     """
 
-    def __init__(self):
-        # Initialize the database connection
-        self.collection = get_vector_db()
+    def __init__(self, collections=None):
+        # Named collections searched when a request does not choose its own; every collection
+        # (vector store, manifest, lexical index) is opened once, on first use
+        self.collections = [validate_collection_name(name) for name in (collections or QUERY_COLLECTIONS)]
+        self._shards = {}
+        self._shards_lock = threading.Lock()
+        primary = self._shards_for(self.collections[:1])[0]
+
+        # Initialize the database connection (of the first collection; see _shards_for for the others)
+        self.collection = primary.collection
 
         # Initialize the Ollama embedder for generating query vectors (1024-dim)
         self.embedder = OllamaBatchEmbedder()
@@ -25,11 +59,114 @@ class AgenticRAG:
         # LLM to be used for final answer generation and HyDE generation
         self.model = "llama3.2:latest"
 
-        # Configuration for Two-Stage Retrieval
+        # Configuration for Two-Stage Retrieval (defaults; requests can override them per call)
         # Stage 1: Initial number of candidates retrieved from Vector DB
         self.top_k_retrieve = 15
         # Stage 2: Final number of best chunks passed to the LLM (Re-Ranked subset)
         self.top_n_rank = 5
+        # Stage 2 scorer (cross-encoder / Ollama / lexical, see RERANKER); None keeps retrieval order
+        self.reranker = get_reranker()
+
+        # "multi" = raw question + HyDE (+ rewrites) searched concurrently and fused; "hyde" = HyDE only
+        self.retrieval_mode = RETRIEVAL_MODE
+        self.query_rewrites = QUERY_REWRITES
+        # Timings of the last retrieve() call (e.g. first_candidates_ms), for instrumentation.
+        # Every call fills its own dict and publishes it here when done, so concurrent
+        # requests never write into each other's figures.
+        self.last_retrieval_stats = {}
+        # Time-to-first-token etc. of the last generate_stream() call (same convention)
+        self.last_generation_stats = {}
+        # Fits history and chunks into the context window and sizes num_ctx per call
+        self.context_builder = ContextBuilder()
+        # BM25 index over the same chunks, fused with the dense results (None = dense only)
+        self.lexical_index = primary.lexical_index
+
+        # HyDE documents and query embeddings for repeated questions (None = disabled)
+        self.query_cache = QueryCache(path=QUERY_CACHE_PATH or None) if QUERY_CACHE_ENABLED else None
+        # The manifest's generation counter changes whenever the indexed collection does; the
+        # manifests' indexes also resolve search filters (path prefix, file type, mtime) into source files
+        self.manifest = primary.manifest
+        # Opt-in: answers to paraphrased questions (None = disabled)
+        self.semantic_cache = SemanticAnswerCache() if SEMANTIC_CACHE_ENABLED else None
+
+        # Micro-batching of concurrent requests' embeddings and vector searches
+        # (None = every request calls the embedder / vector DB on its own; see enable_request_batching)
+        self.embed_batcher = None
+        self.search_batcher = None
+
+    def _shards_for(self, collections: list = None):
+        """
+        The opened CollectionShards of the named collections (default: self.collections).
+        Raises ValueError for an invalid name, a collection that does not exist, or one that
+        still holds embeddings from before vector normalization.
+        """
+        shards = []
+        for name in dict.fromkeys(collections or self.collections):
+            shard = self._shards.get(name)
+            if shard is None:
+                with self._shards_lock:
+                    shard = self._shards.get(name)
+                    if shard is None:
+                        validate_collection_name(name)
+                        # Never create an empty collection for a mistyped name (the configured ones may be new)
+                        if name not in self.collections and name not in list_collections():
+                            raise ValueError(f"Unknown collection: {name}")
+                        shard = open_collection(name)
+                        _check_unit_vectors(shard)
+                        self._shards[name] = shard
+            shards.append(shard)
+        return shards
+
+    def enable_request_batching(self, window_ms: float, max_batch: int):
+        """
+        Coalesces the query embeddings and vector searches of concurrent requests running on
+        one event loop (e.g. a QueryService) into shared embedder calls and multi-vector
+        collection.query calls, waiting at most window_ms for a batch to fill.
+        """
+        self.embed_batcher = MicroBatcher(self.embedder.embed_batch, window_ms, max_batch)
+        self.search_batcher = MicroBatcher(self._search_batch, window_ms, max_batch)
+
+    async def _embed_texts(self, texts: list):
+        """Embeds query-time texts, through the request batcher when enabled."""
+        if self.embed_batcher is None:
+            return await self.embedder.embed_batch(texts)
+        return list(await asyncio.gather(*(self.embed_batcher.submit(text) for text in texts)))
+
+    def _collection_generation(self):
+        """Returns the current collection generation, used to invalidate cached query artefacts."""
+        try:
+            return self.manifest.generation()
+        except Exception:
+            # Unreadable manifest: use a value no entry was stored under, i.e. a cache miss
+            return -1
+
+    async def _embed_question(self, question: str):
+        """Embeds the raw question (not the HyDE document), reusing the query cache when possible."""
+        cache = self.query_cache
+        generation = self._collection_generation() if cache else None
+        embedding = cache.get("question_embedding", (self.embedder.model,), question, generation) if cache else None
+        if embedding is None:
+            embedding = (await self._embed_texts([question]))[0]
+            if cache:
+                cache.put("question_embedding", (self.embedder.model,), question, embedding, generation)
+        return embedding
+
+    def _chunks_exist(self, chunk_ids, shards: list = None):
+        """True if every chunk ID is still in one of the collections (IDs are content hashes)."""
+        unique_ids = list(dict.fromkeys(chunk_ids))
+        if not unique_ids:
+            return False
+        found = set()
+        for shard in shards or self._shards_for():
+            found.update(shard.collection.get(ids=unique_ids, include=[])["ids"])
+        return len(found) == len(unique_ids)
+
+    def _answer_cache_models(self, shards: list):
+        """Semantic cache key of the models and the searched collections (answers differ per collection set)."""
+        models = f"{self.model}|{self.embedder.model}"
+        names = sorted(shard.name for shard in shards)
+        # Answers from the original single collection keep the key they were cached under
+        return models if names == [DEFAULT_COLLECTION] else f"{models}|{','.join(names)}"
 
     def _generate_hypothetical_document(self, query: str) -> str:
         """
@@ -53,7 +190,8 @@ class AgenticRAG:
             response = ollama.chat(
                 model=self.model,
                 messages=messages,
-                options={"temperature": 0.7, "num_ctx": 8000, "num_predict": 8000}
+                # A 3-4 sentence answer: a small window and output cap keep this call fast
+                options={"temperature": 0.7, **llm_options(messages, HYDE_MAX_TOKENS)}
             )
             return response["message"]["content"]
         except Exception as e:
@@ -61,90 +199,405 @@ class AgenticRAG:
             print(f"Error during HyDE generation: {e}. Falling back to original query.")
             return query
 
-    def _rerank(self, query: str, results: dict):
+    def _generate_rewrites(self, query: str) -> list:
         """
-        Simulates the re-ranking step. Since we don't use a dedicated cross-encoder
-        here, we rely on Chroma's similarity score ordering and simply truncate
-        the results to the top_n_rank.
+        Asks the LLM for alternative phrasings of the query (one per line).
+        Returns an empty list on error; rewrites only add recall, they are never required.
+        """
+        rewrite_prompt = (
+            f"Rewrite the following search query in {self.query_rewrites} different ways, using different "
+            "wording and synonyms while keeping the meaning. "
+            "Output one rewrite per line, with no numbering and no extra text."
+        )
+
+        messages = [
+            {"role": "system", "content": rewrite_prompt},
+            {"role": "user", "content": query}
+        ]
+
+        try:
+            response = ollama.chat(
+                model=self.model,
+                messages=messages,
+                options={"temperature": 0.7, **llm_options(messages, 64 * self.query_rewrites)}
+            )
+        except Exception as e:
+            print(f"Error during query rewriting: {e}. Continuing without rewrites.")
+            return []
+
+        lines = [line.strip(" -*\t") for line in response["message"]["content"].splitlines()]
+        return [line for line in lines if line and line != query][:self.query_rewrites]
+
+    def _rerank(self, query: str, results: dict, top_n: int = None):
+        """
+        Re-ranking step: scores the retrieved candidates against the query with the
+        configured RerankingEngine and keeps the best top_n (default: top_n_rank). Without
+        a re-ranker, Chroma's (or the fused) ordering is simply truncated.
         """
 
         # ChromaDB query results are lists nested inside another list (e.g., [[]])
-        # We assume the results are already sorted by distance (similarity)
-        documents = results["documents"][0]
-        metadata = results["metadatas"][0]
-        distances = results["distances"][0]
+        candidates = [
+            {"id": i, "document": doc, "metadata": md, "distance": dist}
+            for i, doc, md, dist in zip(results["ids"][0], results["documents"][0], results["metadatas"][0],
+                                        results["distances"][0])
+        ]
+
+        if self.reranker is not None:
+            try:
+                candidates = self.reranker.rerank(query, candidates)
+            except Exception as e:
+                # Fall back to the retrieval order rather than failing the query
+                print(f"Error during re-ranking: {e}. Using retrieval order.")
 
         # Select the final, most relevant subset (top N)
-        top_documents = documents[:self.top_n_rank]
-        top_metadata = metadata[:self.top_n_rank]
-        top_distances = distances[:self.top_n_rank]
+        top = candidates[:self.top_n_rank if top_n is None else top_n]
+        top_documents = [c["document"] for c in top]
+        top_metadata = [c["metadata"] for c in top]
+        top_distances = [c["distance"] for c in top]
+        top_ids = [c["id"] for c in top]
 
-        return top_documents, top_metadata, top_distances
+        return top_documents, top_metadata, top_distances, top_ids
 
-    async def retrieve(self, query: str):
+    async def _search(self, query_embeddings: list, top_k: int, scope: dict = None, shards: tuple = None):
         """
-        Retrieves relevant context chunks from the vector database using HyDE.
-        This is an async method because it calls the asynchronous embedder.
+        Returns one best-first candidate list per query vector, searching through the request
+        batcher when enabled. Each candidate is a dict with id, document, metadata and distance.
         """
+        shards = tuple(shards or self._shards_for())
+        if self.search_batcher is None:
+            return await self._query_collection(query_embeddings, top_k, scope, shards)
+        return list(await asyncio.gather(
+            *(self.search_batcher.submit((embedding, top_k, scope, shards)) for embedding in query_embeddings)))
+
+    async def _search_batch(self, searches: list):
+        """
+        Batch handler for the search batcher: one collection.query per distinct filter scope
+        and collection set for the (embedding, top_k, scope, shards) searches of several
+        requests, asking for the largest K and truncating per search.
+        """
+        groups = {}
+        for position, (_, _, scope, shards) in enumerate(searches):
+            # One scope object is shared by all searches of a request and is alive while they
+            # are queued, so its identity tells the filters apart without serializing them
+            key = (id(scope) if scope is not None else None, tuple(shard.name for shard in shards))
+            groups.setdefault(key, []).append(position)
+
+        async def run_group(positions):
+            first = searches[positions[0]]
+            return await self._query_collection([searches[p][0] for p in positions],
+                                                max(searches[p][1] for p in positions), first[2], first[3])
+
+        outcomes = await asyncio.gather(*(run_group(positions) for positions in groups.values()))
+        results = [None] * len(searches)
+        for positions, candidate_lists in zip(groups.values(), outcomes):
+            for position, candidates in zip(positions, candidate_lists):
+                results[position] = candidates[:searches[position][1]]
+        return results
+
+    async def _query_collection(self, query_embeddings: list, top_k: int, scope: dict = None,
+                                shards: tuple = None):
+        """
+        Runs one vector store query for one or more query vectors (in a worker thread, so
+        concurrent searches and LLM calls overlap) and returns one best-first candidate
+        list per vector. A filter scope (see _resolve_filter) restricts the search itself
+        to the chunks of the matching files.
+
+        With several collections, every collection is queried in parallel for the top_k of
+        each vector and the per-collection lists are merged by distance (all collections are
+        embedded with the same model, so their distances are comparable).
+        """
+        shards = shards or self._shards_for()
+        if scope is not None:
+            # Collections without a matching chunk are not queried at all
+            shards = [shard for shard in shards if scope[shard.name]]
+            if not shards:
+                return [[] for _ in query_embeddings]
+        per_shard = await asyncio.gather(*(asyncio.to_thread(
+            shard.collection.query,
+            query_embeddings=query_embeddings,
+            n_results=top_k,  # Retrieve the larger candidate set (dynamic K)
+            ids=list(scope[shard.name]) if scope is not None else None,
+            include=['documents', 'metadatas', 'distances']
+        ) for shard in shards))
+        shard_lists = [self._candidate_lists(results) for results in per_shard]
+        if scope is not None:
+            shard_lists = [[self._scoped_candidates(candidates, scope[shard.name]) for candidates in lists]
+                           for shard, lists in zip(shards, shard_lists)]
+        if len(shard_lists) == 1:
+            return shard_lists[0]
+
+        merged_lists = []
+        for position in range(len(query_embeddings)):
+            candidates = [c for lists in shard_lists if position < len(lists) for c in lists[position]]
+            merged, seen = [], set()
+            # The same chunk (same content hash) may be stored in several collections
+            for candidate in sorted(candidates, key=lambda c: c["distance"]):
+                if candidate["id"] not in seen:
+                    seen.add(candidate["id"])
+                    merged.append(candidate)
+            merged_lists.append(merged[:top_k])
+        return merged_lists
+
+    @staticmethod
+    def _candidate_lists(results: dict):
+        """Turns a collection.query result into one candidate dict list per query vector."""
+        candidate_lists = []
+        for ids, documents, metadatas, distances in zip(results.get("ids") or [], results.get("documents") or [],
+                                                        results.get("metadatas") or [],
+                                                        results.get("distances") or []):
+            candidate_lists.append([
+                {"id": i, "document": doc, "metadata": md, "distance": dist}
+                for i, doc, md, dist in zip(ids, documents, metadatas, distances)
+            ])
+        return candidate_lists
+
+    @staticmethod
+    def _scoped_candidates(candidates: list, sources: dict):
+        """
+        Reports each candidate under a file the filter matched. A chunk shared by several files
+        is stored once, labelled with the first file indexed, which may be out of scope.
+        """
+        scoped = []
+        for candidate in candidates:
+            paths = sources.get(candidate["id"], ())
+            metadata = candidate["metadata"] or {}
+            if paths and metadata.get("source") not in paths:
+                candidate = {**candidate, "metadata": {**metadata, "source": paths[0]}}
+            scoped.append(candidate)
+        return scoped
+
+    async def _hyde_embedding(self, query: str, fallback_to_query: bool):
+        """
+        Returns the embedding of the HyDE document for the query (cached per question).
+
+        If HyDE generation fails, embeds the query itself when fallback_to_query is set
+        (the "hyde" mode behaviour) and returns None otherwise.
+        """
+        # A repeated question skips both the HyDE generation and the embedding round trip
+        cache = self.query_cache
+        generation = self._collection_generation() if cache else None
+        query_embedding = cache.get("query_embedding", (self.model, self.embedder.model), query,
+                                    generation) if cache else None
+        if query_embedding is not None:
+            return query_embedding
 
         # --- HyDE Step (New) ---
-        # 1. Generate the hypothetical document
-        hypothetical_document = self._generate_hypothetical_document(query)
+        # 1. Generate the hypothetical document (or reuse a cached one)
+        hypothetical_document = cache.get("hyde", (self.model,), query, generation) if cache else None
+        if hypothetical_document is None:
+            hypothetical_document = await asyncio.to_thread(self._generate_hypothetical_document, query)
+            # A failed generation falls back to the query itself; don't cache the fallback
+            if cache and hypothetical_document != query:
+                cache.put("hyde", (self.model,), query, hypothetical_document, generation)
+
+        if hypothetical_document == query and not fallback_to_query:
+            return None
 
         # Determine which text to embed: the HyDE result or the original query if HyDE failed
         search_text = hypothetical_document if hypothetical_document != query else query
         # ------------------------
 
         # 2. Generate the query vector using the Ollama embedder (using the HyDE document's text)
-        query_embedding_list = await self.embedder.embed_batch([search_text])
-        query_embedding = query_embedding_list[0]
+        query_embedding = (await self._embed_texts([search_text]))[0]
+        if cache and hypothetical_document != query:
+            cache.put("query_embedding", (self.model, self.embedder.model), query, query_embedding, generation)
+        return query_embedding
+
+    async def _raw_candidates(self, query: str, top_k: int, started: float, stats: dict, scope: dict = None,
+                              shards: tuple = None):
+        """Searches with the question itself: one embedding round trip to the first candidates."""
+        candidates = (await self._search([await self._embed_question(query)], top_k, scope, shards))
+        stats.setdefault("first_candidates_ms", (time.perf_counter() - started) * 1000)
+        return candidates
+
+    async def _hyde_candidates(self, query: str, top_k: int, started: float, stats: dict,
+                               fallback_to_query: bool = False, scope: dict = None, shards: tuple = None):
+        """Searches with the HyDE document's embedding."""
+        embedding = await self._hyde_embedding(query, fallback_to_query)
+        if embedding is None:
+            return []
+        candidates = await self._search([embedding], top_k, scope, shards)
+        stats.setdefault("first_candidates_ms", (time.perf_counter() - started) * 1000)
+        return candidates
+
+    async def _rewrite_candidates(self, query: str, top_k: int, scope: dict = None, shards: tuple = None):
+        """Searches with LLM rewrites of the question (all rewrites in one embed call and one query)."""
+        cache = self.query_cache
+        generation = self._collection_generation() if cache else None
+        rewrites = cache.get("rewrites", (self.model, str(self.query_rewrites)), query, generation) if cache else None
+        if rewrites is None:
+            rewrites = await asyncio.to_thread(self._generate_rewrites, query)
+            if cache and rewrites:
+                cache.put("rewrites", (self.model, str(self.query_rewrites)), query, rewrites, generation)
+        if not rewrites:
+            return []
+        return await self._search(await self._embed_texts(rewrites), top_k, scope, shards)
+
+    async def _lexical_candidates(self, query: str, top_k: int, started: float, stats: dict,
+                                  scope: dict = None, shards: tuple = None):
+        """
+        BM25 search over the lexical index. Needs no embedding, so it also returns
+        candidates while the embedding server is cold, busy or down. A filter scope
+        restricts scoring to the chunks of the matching files.
 
-        # 3. Query the vector store for a large number of candidate chunks (Stage 1)
-        results = self.collection.query(
-            query_embeddings=[query_embedding],  # Use the HyDE vector
-            n_results=self.top_k_retrieve,  # Retrieve the larger candidate set (dynamic K)
-            include=['documents', 'metadatas', 'distances']
-        )
+        Every collection's lexical index is searched in parallel and the hits merged by BM25
+        score (each index has its own term statistics, so scores of different collections
+        are only roughly comparable; fusion only uses the resulting rank).
+        """
+        shards = shards or self._shards_for()
+        per_shard = await asyncio.gather(*(asyncio.to_thread(
+            shard.lexical_index.search, query, top_k, scope[shard.name].keys() if scope is not None else None)
+            for shard in shards))
+        hits = sorted(((score, chunk_id, shard) for shard, shard_hits in zip(shards, per_shard)
+                       for chunk_id, score in shard_hits), key=lambda hit: -hit[0])
+        owner = {}
+        for _, chunk_id, shard in hits:
+            if len(owner) == top_k:
+                break
+            owner.setdefault(chunk_id, shard)
+        if not owner:
+            return []
+        ids = list(owner)
+
+        # Fetch the hits' text from the collections that found them
+        async def fetch(shard):
+            shard_ids = [i for i in ids if owner[i] is shard]
+            if not shard_ids:
+                return {"ids": [], "documents": [], "metadatas": []}
+            return await asyncio.to_thread(shard.collection.get, ids=shard_ids, include=['documents', 'metadatas'])
+
+        by_id = {}
+        for found in await asyncio.gather(*(fetch(shard) for shard in shards)):
+            by_id.update({i: (doc, md) for i, doc, md in zip(found['ids'], found['documents'], found['metadatas'])})
+        stats.setdefault("first_candidates_ms", (time.perf_counter() - started) * 1000)
+        # No vector distance for lexical hits; their rank is what fusion uses
+        candidates = [{"id": i, "document": by_id[i][0], "metadata": by_id[i][1], "distance": None}
+                      for i in ids if i in by_id]
+        if scope is not None:
+            candidates = [self._scoped_candidates([c], scope[owner[c["id"]].name])[0] for c in candidates]
+        return [candidates]
+
+    def _resolve_filter(self, search_filter, shards: tuple = None):
+        """
+        Resolves a SearchFilter on the manifests' indexes (path range scans, file type and
+        mtime indexes) into the matching source files and their chunk IDs, per collection.
+        The dense and lexical searches then only score those chunks instead of filtering an
+        oversized top K afterwards.
+
+        The manifests' file -> chunk table decides what is in scope, not the chunks' stored
+        source: a chunk shared by several files is stored once, labelled with the first file
+        indexed, and is in scope (and reported) under any matching file that contains it.
+
+        Returns:
+            dict: files (number of matching files), scope (collection name -> {chunk_id:
+                matching files containing it}).
+        """
+        paths, scope = set(), {}
+        for shard in shards or self._shards_for():
+            shard_paths = shard.manifest.matching_files(search_filter, MASTER_DOCS_PATH)
+            paths.update(shard_paths)
+            scope[shard.name] = shard.manifest.chunk_sources(shard_paths)
+        return {"files": len(paths), "scope": scope}
+
+    async def retrieve(self, query: str, top_k: int = None, top_n: int = None, search_filter=None,
+                       collections: list = None):
+        """
+        Retrieves relevant context chunks from the vector database.
+        This is an async method because it calls the asynchronous embedder.
+
+        top_k / top_n override top_k_retrieve / top_n_rank for this call only. search_filter
+        (a SearchFilter) restricts every search to the chunks of the matching files, and
+        collections (names) to those collections instead of self.collections.
+
+        In "multi" mode the raw question is embedded and searched immediately while the
+        HyDE document (and optional rewrites) are generated concurrently; every result
+        list is then merged with reciprocal rank fusion. In "hyde" mode only the HyDE
+        document is searched, as before. In both modes a BM25 search over the lexical
+        index runs alongside and is fused in as well.
+        """
+        started = time.perf_counter()
+        top_k = self.top_k_retrieve if top_k is None else top_k
+        shards = tuple(self._shards_for(collections))
+        stats = {"collections": [shard.name for shard in shards]}
+
+        # 0. Filtered retrieval: find the matching files (and their chunks) first
+        scope = None
+        if search_filter is not None and not search_filter.is_empty():
+            scope = await asyncio.to_thread(self._resolve_filter, search_filter, shards)
+            stats["filter_files"] = scope["files"]
+            if not scope["files"]:
+                stats["retrieve_ms"] = (time.perf_counter() - started) * 1000
+                self.last_retrieval_stats = stats
+                return "", [], [], []
+            scope = scope["scope"]
+
+        # 1-3. Candidate Generation (Stage 1)
+        if self.retrieval_mode == "hyde":
+            searches = [self._hyde_candidates(query, top_k, started, stats, fallback_to_query=True, scope=scope,
+                                              shards=shards)]
+        else:
+            searches = [self._raw_candidates(query, top_k, started, stats, scope, shards),
+                        self._hyde_candidates(query, top_k, started, stats, scope=scope, shards=shards)]
+            if self.query_rewrites > 0:
+                searches.append(self._rewrite_candidates(query, top_k, scope, shards))
+        if self.lexical_index is not None:
+            searches.append(self._lexical_candidates(query, top_k, started, stats, scope, shards))
+
+        outcomes = await asyncio.gather(*searches, return_exceptions=True)
+        candidate_lists = []
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                # One failed search (e.g. HyDE, or every dense search while Ollama is down)
+                # must not lose the others' candidates
+                print(f"Error during candidate search: {outcome}")
+                continue
+            candidate_lists.extend(outcome)
+        failures = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+        if not candidate_lists and failures:
+            raise failures[0]
+
+        # Merge the candidate lists by rank (a single list passes through unchanged)
+        by_id = {}
+        for candidates in candidate_lists:
+            for candidate in candidates:
+                best = by_id.get(candidate["id"])
+                if best is None or (candidate["distance"] is not None and
+                                    (best["distance"] is None or candidate["distance"] < best["distance"])):
+                    by_id[candidate["id"]] = candidate
+        fused = reciprocal_rank_fusion([[c["id"] for c in candidates] for candidates in candidate_lists], k=RRF_K)
+        ranked = [by_id[chunk_id] for chunk_id, _ in fused][:top_k]
+
+        stats["candidate_lists"] = len(candidate_lists)
+        stats["retrieve_ms"] = (time.perf_counter() - started) * 1000
+        self.last_retrieval_stats = stats
+
+        # Same shape as a single Chroma query result, so the re-ranking stage is unchanged
+        results = {
+            "ids": [[c["id"] for c in ranked]],
+            "documents": [[c["document"] for c in ranked]],
+            "metadatas": [[c["metadata"] for c in ranked]],
+            "distances": [[c["distance"] for c in ranked]],
+        }
 
         if not results.get("documents") or not results["documents"][0]:
             # No results found
-            return "", [], []
+            return "", [], [], []
 
         # 4. Apply Re-Ranking/Filtering to get the best N chunks (Stage 2)
-        documents, metadata, _ = self._rerank(query, results) # _rerank uses self.top_n_rank (dynamic N)
-
-        # --- Whitespace Normalization (ENHANCED LOGIC) ---
-        normalized_documents = []
-        for doc in documents:
-            normalized_doc = doc
-
-            # 1. Fix CamelCase/Run-on Words
-            normalized_doc = re.sub(r'([a-z])([A-Z])', r'\1 \2', normalized_doc)
-
-            # 2. Fix Punctuation Run-ons
-            normalized_doc = re.sub(r'([\.?!,:;])([a-zA-Z0-9])', r'\1 \2', normalized_doc)
-
-            # 3. Fix Digit Run-ons (Letter followed by digit)
-            normalized_doc = re.sub(r'([a-zA-Z])([0-9])', r'\1 \2', normalized_doc)
+        # (in a worker thread: a cross-encoder or LLM judge must not block the event loop)
+        documents, metadata, _, chunk_ids = await asyncio.to_thread(self._rerank, query, results, top_n) # dynamic N
 
-            # 4. Fix Digit Run-ons (Digit followed by letter)
-            normalized_doc = re.sub(r'([0-9])([a-zA-Z])', r'\1 \2', normalized_doc)
+        # Create context string from re-ranked documents (their text was already normalized
+        # at ingest time, see text_normalizer.py)
+        context = CHUNK_SEPARATOR.join(documents)
 
-            normalized_documents.append(normalized_doc)
+        # 5. Return the context string, metadata, the list of documents and their chunk IDs
+        return context, metadata, documents, chunk_ids
 
-        # Create context string from re-ranked and normalized documents
-        context = "\n\n---\n\n".join(normalized_documents)
-
-        # 5. Return the context string, metadata, and the list of normalized documents
-        return context, metadata, normalized_documents
-
-    def generate(self, query: str, context: str, chat_history: list):
+    def _answer_messages(self, query: str, context: str, history_str: str):
         """
-        Generates the final answer using the LLM based on the retrieved context.
+        Builds the chat messages for the final answer from the packed context and history.
         """
-        # Format the conversational history for the LLM prompt
-        history_str = "\n".join([f"{h['speaker']}: {h['message']}" for h in chat_history])
-
         # FINALIZED SYSTEM PROMPT: Strong directive for grounded generation
         system_prompt = (
             "You are a helpful assistant. Use the provided CONTEXT to formulate your answer. "
@@ -162,53 +615,219 @@ class AgenticRAG:
             f"Please answer the QUESTION based ONLY on the provided CONTEXT."
         )
 
-        messages = [
+        return [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_message_content}
         ]
 
-        response = ollama.chat(
-            model=self.model,
-            messages=messages,
-            # Options for detailed and long response
-            options={"temperature": 0.7, "num_ctx": 8000, "num_predict": 8000}
-        )
+    def _pack_answer_prompt(self, query: str, chunks: list, chat_history: list):
+        """
+        Fits the chat history and the retrieved chunks around the question within the
+        context window (see ContextBuilder.build for the returned dict).
+        """
+        template_tokens = sum(count_tokens(m["content"]) for m in self._answer_messages(query, "", ""))
+        return self.context_builder.build(template_tokens, chunks, chat_history)
+
+    def _answer_request(self, query: str, context: str, chat_history: list, packed: dict = None):
+        """Returns the (messages, options) of the answer call, packing the prompt if needed."""
+        if packed is None:
+            packed = self._pack_answer_prompt(query, context.split(CHUNK_SEPARATOR) if context else [], chat_history)
+        messages = self._answer_messages(query, packed["context"], packed["history"])
+        # num_ctx covers the packed prompt plus the answer, instead of a fixed 8000-token window
+        options = {"temperature": 0.7, "num_ctx": packed["num_ctx"], "num_predict": packed["num_predict"]}
+        return messages, options, packed
+
+    def generate(self, query: str, context: str, chat_history: list, packed: dict = None):
+        """
+        Generates the final answer using the LLM based on the retrieved context.
+
+        Args:
+            packed (dict): The prompt already packed by query(); built from context and
+                chat_history when omitted.
+        """
+        messages, options, _ = self._answer_request(query, context, chat_history, packed)
+        response = ollama.chat(model=self.model, messages=messages, options=options)
 
         return response["message"]["content"]
 
-    def query(self, question: str, chat_history: list = None, top_k: int = None, top_n: int = None):
+    def generate_stream(self, query: str, context: str, chat_history: list, query_started: float = None,
+                        packed: dict = None, stats: dict = None):
         """
-        The main synchronous entry point for the query process, now accepting dynamic parameters.
+        Streaming variant of generate(): yields the answer piece by piece as Ollama produces it.
+
+        Records time-to-first-token in stats (a new dict unless one is passed in), also
+        published as self.last_generation_stats: 'ttft_ms' from the start of generation and,
+        if query_started (a time.perf_counter() value) is given, 'query_ttft_ms' from the
+        start of the whole query, retrieval included.
         """
-        chat_history = chat_history if chat_history is not None else []
+        started = time.perf_counter()
+        messages, options, packed = self._answer_request(query, context, chat_history, packed)
+        stats = {} if stats is None else stats
+        stats.update(ttft_ms=None, query_ttft_ms=None, generation_ms=None, pieces=0,
+                     prompt_tokens=packed["prompt_tokens"], num_ctx=packed["num_ctx"])
+        self.last_generation_stats = stats
+
+        stream = ollama.chat(model=self.model, messages=messages, options=options, stream=True)
+        for part in stream:
+            piece = part["message"]["content"]
+            if not piece:
+                continue
+            if stats["ttft_ms"] is None:
+                now = time.perf_counter()
+                stats["ttft_ms"] = (now - started) * 1000
+                if query_started is not None:
+                    stats["query_ttft_ms"] = (now - query_started) * 1000
+            stats["pieces"] += 1
+            yield piece
+        stats["generation_ms"] = (time.perf_counter() - started) * 1000
+
+    async def _aprepare_answer(self, question: str, chat_history: list, top_k: int = None, top_n: int = None,
+                               search_filter=None, collections: list = None):
+        """
+        Shared front half of aquery() and query_stream(): the semantic answer cache and
+        retrieval, with top_k / top_n / search_filter / collections applied to this request only.
 
-        # --- Dynamic Parameter Update (Accepting Streamlit values) ---
-        # Override instance parameters if they are passed from the Streamlit UI
-        if top_k is not None:
-            self.top_k_retrieve = top_k
-        if top_n is not None:
-            self.top_n_rank = top_n
+        Returns:
+            tuple[dict | None, dict]: (finished response, state). The response is set when no
+            generation is needed (cache hit, nothing found, retrieval error); otherwise state
+            carries the retrieved context for the generation step.
+        """
+        # --- Semantic Answer Cache (opt-in) ---
+        state = {"started": time.perf_counter(), "question_embedding": None}
+        try:
+            shards = self._shards_for(collections)
+        except ValueError as e:
+            return {"answer": f"Cannot search: {e}", "sources": [], "context_chunks": []}, state
+        state["cache_models"] = self._answer_cache_models(shards)
+        filtered = search_filter is not None and not search_filter.is_empty()
+        # A cached answer may be grounded in files outside the filter, so filtered queries skip the cache
+        if self.semantic_cache is not None and not filtered:
+            try:
+                state["question_embedding"] = await self._embed_question(question)
+                cached = self.semantic_cache.lookup(state["question_embedding"], state["cache_models"],
+                                                    lambda chunk_ids: self._chunks_exist(chunk_ids, shards))
+            except Exception as e:
+                # The cache is an optimisation; never let it break a query
+                print(f"Semantic cache lookup failed: {e}")
+                cached = None
+            if cached:
+                self.semantic_cache.record_saving(
+                    cached.pop("original_seconds") - (time.perf_counter() - state["started"]))
+                cached["cached"] = True
+                return cached, state
         # ---------------------------------
 
-        # Use asyncio.run to execute the async retrieval function
         try:
-            # We call the async method from the sync context
-            context, metadata, documents = asyncio.run(self.retrieve(question))
+            context, metadata, documents, chunk_ids = await self.retrieve(question, top_k=top_k, top_n=top_n,
+                                                                          search_filter=search_filter,
+                                                                          collections=collections)
         except Exception as e:
             # Handle retrieval errors gracefully
             print(f"Error during async retrieval: {e}")
             return {"answer": f"An unexpected error occurred during context retrieval: {e}", "sources": [],
-                    "context_chunks": []}
+                    "context_chunks": []}, state
 
         if not context:
+            if filtered:
+                return {"answer": "I could not find any relevant documents matching the search filters "
+                                  f"({search_filter.describe()}) to answer your question.",
+                        "sources": [], "context_chunks": []}, state
             return {"answer": "I could not find any relevant documents in the database to answer your question.",
-                    "sources": [], "context_chunks": []}
-
-        # Generate the final answer
-        answer = self.generate(question, context, chat_history)
-
+                    "sources": [], "context_chunks": []}, state
+
+        # Fit history and chunks into the context window; sources follow the chunks that made it
+        packed = self._pack_answer_prompt(question, documents, chat_history)
+        state.update(context=packed["context"], packed=packed,
+                     metadata=[metadata[i] for i in packed["kept"]],
+                     documents=[documents[i] for i in packed["kept"]],
+                     chunk_ids=[chunk_ids[i] for i in packed["kept"]])
+        return None, state
+
+    def _answer_result(self, state: dict, answer: str = None):
+        """Builds the response dict for a generated answer."""
         # Extract unique source names (file paths)
-        unique_sources = list(set(md.get("source", "Unknown Source") for md in metadata))
+        unique_sources = list(set(md.get("source", "Unknown Source") for md in state["metadata"]))
 
         # The documents list here only contains the final, re-ranked and normalized chunks
-        return {"answer": answer, "sources": unique_sources, "context_chunks": documents, "raw_context_text": context}
+        return {"answer": answer, "sources": unique_sources, "context_chunks": state["documents"],
+                "raw_context_text": state["context"]}
+
+    def _remember_answer(self, state: dict, chat_history: list, result: dict):
+        """Stores a generated answer in the semantic answer cache, if enabled."""
+        # Only standalone questions are cached: an answer shaped by earlier turns of a
+        # conversation is not a valid answer to the same question asked elsewhere.
+        if state["question_embedding"] is not None and not chat_history:
+            payload = {key: result[key] for key in ("answer", "sources", "context_chunks", "raw_context_text")}
+            self.semantic_cache.store(state["question_embedding"], state["cache_models"],
+                                      state["chunk_ids"], payload, time.perf_counter() - state["started"])
+
+    async def aquery(self, question: str, chat_history: list = None, top_k: int = None, top_n: int = None,
+                     search_filter=None, collections: list = None):
+        """
+        Async entry point of the query process. top_k / top_n / search_filter / collections
+        apply to this request only, so concurrent requests with different settings do not interfere.
+        """
+        chat_history = chat_history if chat_history is not None else []
+
+        result, state = await self._aprepare_answer(question, chat_history, top_k, top_n, search_filter,
+                                                    collections)
+        if result is not None:
+            return result
+
+        # Generate the final answer (blocking Ollama call, off the event loop)
+        answer = await asyncio.to_thread(self.generate, question, state["context"], chat_history, state["packed"])
+        result = self._answer_result(state, answer)
+        self._remember_answer(state, chat_history, result)
+        return result
+
+    def query(self, question: str, chat_history: list = None, top_k: int = None, top_n: int = None,
+              search_filter=None, collections: list = None):
+        """
+        The main synchronous entry point for the query process, now accepting dynamic parameters.
+        Runs aquery() on a new event loop; long-lived callers should use QueryService instead.
+        """
+        return asyncio.run(self.aquery(question, chat_history, top_k, top_n, search_filter, collections))
+
+    def _streaming_result(self, question: str, chat_history: list, result: dict, state: dict):
+        """
+        Turns the outcome of _aprepare_answer() into a query_stream() response, with the answer
+        generated lazily by 'answer_stream' and its timings collected in 'generation_stats'.
+        """
+        if result is not None:
+            result["answer_stream"] = iter([result["answer"]])
+            result["generation_stats"] = {}
+            return result
+
+        result = self._answer_result(state)
+        result["generation_stats"] = {}
+
+        def answer_stream():
+            pieces = []
+            try:
+                for piece in self.generate_stream(question, state["context"], chat_history,
+                                                  query_started=state["started"], packed=state["packed"],
+                                                  stats=result["generation_stats"]):
+                    pieces.append(piece)
+                    yield piece
+            finally:
+                # Also when generation fails mid-stream: callers keep the text produced so far
+                result["answer"] = "".join(pieces)
+            # Only a complete answer is cached
+            self._remember_answer(state, chat_history, result)
+
+        result["answer_stream"] = answer_stream()
+        return result
+
+    def query_stream(self, question: str, chat_history: list = None, top_k: int = None, top_n: int = None,
+                     search_filter=None, collections: list = None):
+        """
+        Streaming variant of query(). Returns as soon as retrieval is done: 'sources' and
+        'context_chunks' are filled in, and 'answer_stream' is an iterator yielding the answer
+        as it is generated. Once the stream is exhausted, 'answer' holds the full text; if it
+        fails part-way, 'answer' holds the text generated before the error.
+        Responses that need no generation (cache hit, nothing found) stream their answer at once.
+        """
+        chat_history = chat_history if chat_history is not None else []
+        result, state = asyncio.run(self._aprepare_answer(question, chat_history, top_k, top_n, search_filter,
+                                                          collections))
+        return self._streaming_result(question, chat_history, result, state)
@@ -1,48 +1,248 @@
 import asyncio
+import math
+import time
 from concurrent.futures import ThreadPoolExecutor
+import httpx
 import ollama
 
+from config import (EMBED_SUB_BATCH_SIZE, EMBED_MAX_TOKENS_PER_REQUEST, EMBED_INITIAL_CONCURRENCY,
+                    EMBED_MIN_CONCURRENCY, EMBED_MAX_CONCURRENCY, EMBED_LATENCY_TOLERANCE,
+                    EMBED_REQUEST_TIMEOUT_SECONDS, EMBED_MAX_RETRIES)
+from embedding_cache import content_hash
+from concurrency_limiter import AdaptiveConcurrencyLimiter, backoff_delay
+
+# Rough characters-per-token ratio used to keep each request inside the token budget.
+# The embedding model uses its own tokenizer, so this is only an estimate.
+CHARS_PER_TOKEN = 4
+
+# HTTP status codes an older Ollama server returns when /api/embed does not exist
+_UNSUPPORTED_STATUS_CODES = (404, 405, 501)
+
+# HTTP status codes that mean "overloaded / try again later"
+_RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def _estimate_tokens(text):
+    """Cheap token estimate for request sizing (no tokenizer round trip)."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _is_retryable(error):
+    """Timeouts, dropped connections and overload responses are retried; anything else is a real error."""
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code in _RETRYABLE_STATUS_CODES
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError, ConnectionError, TimeoutError))
+
+
+def _l2_normalize(vector):
+    """Scales a vector to unit length, matching what /api/embed returns."""
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm == 0:
+        return list(vector)
+    return [v / norm for v in vector]
+
 
 class OllamaBatchEmbedder:
     """
     Handles concurrent, batched embedding generation using the Ollama Python client.
 
-    Uses ThreadPoolExecutor to run blocking ollama.embeddings calls concurrently
-    without blocking the main asyncio event loop, which is essential for
-    fast, asynchronous ingestion.
+    Texts are grouped into sub-batches (bounded by both item count and an approximate
+    token budget) and each sub-batch is sent as ONE multi-input /api/embed request.
+    Sub-batches run concurrently in a ThreadPoolExecutor so the blocking client calls
+    never block the main asyncio event loop.
+
+    How many requests run at once is decided by an AdaptiveConcurrencyLimiter: it ramps
+    up while throughput improves and backs off on timeouts or when requests start
+    queueing on the server, so the same settings work on a laptop and on a large GPU box.
+    Failed requests are retried with jittered exponential backoff.
+
+    If the server rejects multi-input requests (older Ollama versions without
+    /api/embed), the embedder falls back to one legacy /api/embeddings call per text.
+
+    When an EmbeddingCache is supplied, texts whose (model, content hash) is already
+    cached are served from disk and only the misses are sent to Ollama.
     """
 
-    def __init__(self, model="mxbai-embed-large:335m", max_workers=4):
+    def __init__(self, model="mxbai-embed-large:335m",
+                 sub_batch_size=EMBED_SUB_BATCH_SIZE,
+                 max_tokens_per_request=EMBED_MAX_TOKENS_PER_REQUEST,
+                 host=None, cache=None,
+                 initial_concurrency=EMBED_INITIAL_CONCURRENCY,
+                 min_concurrency=EMBED_MIN_CONCURRENCY,
+                 max_concurrency=EMBED_MAX_CONCURRENCY,
+                 request_timeout=EMBED_REQUEST_TIMEOUT_SECONDS,
+                 max_retries=EMBED_MAX_RETRIES):
         # Recommended embedding model for high-quality RAG
         # This model name should match the one available in the user's Ollama environment.
         self.model = model
-        # Use a small number of workers to manage concurrent blocking calls to Ollama
-        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Decides how many blocking Ollama calls may run at once
+        self.limiter = AdaptiveConcurrencyLimiter(initial=initial_concurrency, min_limit=min_concurrency,
+                                                  max_limit=max_concurrency,
+                                                  latency_tolerance=EMBED_LATENCY_TOLERANCE)
+        # Sized for the limiter's ceiling; the limiter, not the pool, bounds the actual parallelism
+        self.executor = ThreadPoolExecutor(max_workers=self.limiter.max_limit, thread_name_prefix="ollama-embed")
+        # Dedicated client so a custom host (e.g. the benchmark mock server) can be targeted.
+        # host=None falls back to the OLLAMA_HOST environment variable / localhost default.
+        self.client = ollama.Client(host=host, timeout=request_timeout)
+        self.max_retries = max(0, max_retries)
+        self.retries = 0
+        # Optional persistent EmbeddingCache, checked before any request is made
+        self.cache = cache
+
+        self.sub_batch_size = max(1, sub_batch_size)
+        self.max_tokens_per_request = max(1, max_tokens_per_request)
+
+        # None = not probed yet, True = /api/embed works, False = use per-text fallback
+        self.multi_input_supported = None
+
+    def _plan_requests(self, texts):
+        """
+        Splits texts into consecutive (start, end) ranges, each of which becomes one request.
+
+        A range closes when it reaches sub_batch_size items or when adding the next text
+        would exceed the token budget. A single oversized text is still sent on its own.
+        """
+        ranges = []
+        start = 0
+        tokens = 0
+        for i, text in enumerate(texts):
+            text_tokens = _estimate_tokens(text)
+            count = i - start
+            if count > 0 and (count >= self.sub_batch_size or tokens + text_tokens > self.max_tokens_per_request):
+                ranges.append((start, i))
+                start = i
+                tokens = 0
+            tokens += text_tokens
+        if start < len(texts):
+            ranges.append((start, len(texts)))
+        return ranges
+
+    def _embed_per_text(self, texts):
+        """Legacy path: one /api/embeddings request per text."""
+        # /api/embed returns unit-length vectors while /api/embeddings does not.
+        # Normalizing here keeps both paths consistent inside the same collection.
+        return [_l2_normalize(self.client.embeddings(model=self.model, prompt=t)['embedding']) for t in texts]
+
+    def _embed_request(self, texts):
+        """
+        Blocking call that embeds one sub-batch. Runs inside the thread pool.
+        """
+        if self.multi_input_supported is not False:
+            try:
+                response = self.client.embed(model=self.model, input=texts)
+                self.multi_input_supported = True
+                return response['embeddings']
+            except ollama.ResponseError as e:
+                # Only a missing endpoint triggers the fallback; real errors (model not found,
+                # server overloaded, ...) must still surface to the caller.
+                if e.status_code not in _UNSUPPORTED_STATUS_CODES:
+                    raise
+                if self.multi_input_supported is None:
+                    print(f"Ollama server rejected multi-input embedding ({e}). Falling back to per-text requests.")
+                self.multi_input_supported = False
+
+        return self._embed_per_text(texts)
+
+    async def _request(self, texts):
+        """
+        Embeds one sub-batch under a limiter slot, retrying retryable failures with
+        jittered exponential backoff. The slot is released while backing off.
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            started = time.monotonic()
+            try:
+                embeddings = await loop.run_in_executor(self.executor, self._embed_request, texts)
+            except Exception as e:
+                retryable = _is_retryable(e)
+                # Only overload-type failures feed the controller; a bad request says nothing about load
+                self.limiter.release(time.monotonic() - started, len(texts), failed=retryable, record=retryable)
+                if not retryable or attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                delay = backoff_delay(attempt)
+                print(f"Embedding request failed ({e}). Retrying in {delay:.1f}s "
+                      f"(attempt {attempt + 1}/{self.max_retries}).")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled: give the slot back without recording a sample
+                self.limiter.release(0.0, 0, record=False)
+                raise
+            self.limiter.release(time.monotonic() - started, len(texts))
+            return embeddings
+
+    async def _embed_uncached(self, texts):
+        """
+        Embeds texts with Ollama, one request per planned sub-batch.
+
+        A new request task is only created while fewer than `limiter.limit` are running,
+        so the number of live tasks stays bounded however large the batch is.
+        """
+        ranges = self._plan_requests(texts)
+        results = [None] * len(ranges)
+        running = set()
+
+        async def embed(index, start, end):
+            results[index] = await self._request(texts[start:end])
+
+        try:
+            for index, (start, end) in enumerate(ranges):
+                while len(running) >= self.limiter.limit:
+                    done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        task.result()  # Surface a failed request before dispatching more
+                running.add(asyncio.create_task(embed(index, start, end)))
+            if running:
+                await asyncio.gather(*running)
+        except BaseException:
+            for task in running:
+                task.cancel()
+            raise
+
+        # Flatten the results back into input order
+        return [embedding for sub_batch in results for embedding in sub_batch]
+
+    def stats(self):
+        """
+        Returns the current request concurrency, p50/p95 request latency (ms),
+        throughput (texts/sec) and retry count.
+        """
+        stats = self.limiter.stats()
+        stats["retries"] = self.retries
+        return stats
 
     async def embed_batch(self, texts):
         """
-        Generates embeddings for a batch of texts concurrently.
+        Generates embeddings for a batch of texts using as few requests as possible.
 
         Args:
             texts (list[str]): A list of text strings (chunks) to embed.
 
         Returns:
-            list[list[float]]: A list of embeddings (list of float vectors).
+            list[list[float]]: A list of embeddings (list of float vectors), in input order.
         """
-        loop = asyncio.get_event_loop()
+        if not texts:
+            return []
+
+        if self.cache is None:
+            return await self._embed_uncached(texts)
+
+        # 1. Serve whatever we can from the persistent cache
+        hashes = [content_hash(t) for t in texts]
+        cached = self.cache.get_many(self.model, hashes)
 
-        # Helper function to run the blocking Ollama call in the thread pool
-        async def embed(text):
-            # This is the blocking call being run in the background thread
-            return await loop.run_in_executor(
-                self.executor,
-                # The ollama.embeddings function returns a dictionary,
-                # we extract just the 'embedding' vector.
-                lambda: ollama.embeddings(model=self.model, prompt=text)['embedding']
-            )
+        # 2. Embed each missing text once, even if it appears several times in the batch
+        missing = {}
+        for text_hash, text in zip(hashes, texts):
+            if text_hash not in cached and text_hash not in missing:
+                missing[text_hash] = text
 
-        # Create a task for each chunk
-        tasks = [embed(t) for t in texts]
+        if missing:
+            new_embeddings = await self._embed_uncached(list(missing.values()))
+            fresh = list(zip(missing.keys(), new_embeddings))
+            self.cache.put_many(self.model, fresh)
+            cached.update(fresh)
 
-        # Run all tasks concurrently and wait for all results
-        return await asyncio.gather(*tasks)
+        return [cached[h] for h in hashes]
@@ -0,0 +1,77 @@
+import asyncio
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-item requests into batched calls.
+
+    submit(item) waits up to `window_ms` for other submissions (or until `max_batch` items
+    are queued), then passes the whole batch to `handler`, an async function taking a list
+    of items and returning one result per item in the same order. A failing batch fails
+    every submission in it.
+
+    A batcher belongs to the event loop of its first submission; submissions from any other
+    loop (e.g. an asyncio.run() call) bypass batching and call the handler directly.
+    """
+
+    def __init__(self, handler, window_ms=5.0, max_batch=32):
+        self.handler = handler
+        self.window = max(0.0, window_ms) / 1000
+        self.max_batch = max(1, max_batch)
+        self._loop = None
+        self._pending = []  # (item, future)
+        self._timer = None
+        self._tasks = set()  # running batches (kept referenced until done)
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        if self._loop is None:
+            self._loop = loop
+        if loop is not self._loop:
+            return (await self.handler([item]))[0]
+
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = self._loop.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = await self.handler([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            # A cancelled submitter no longer waits for its result
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        """
+        Returns:
+            dict: batches, items and avg_batch_size so far.
+        """
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,257 @@
+import re
+import math
+import time
+import threading
+from collections import OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import ollama
+
+from query_cache import normalize_query
+from config import (RERANKER, RERANKER_MODEL, RERANKER_OLLAMA_MODEL, RERANK_TOP_M, RERANK_BATCH_SIZE,
+                    RERANK_BUDGET_MS, RERANK_CACHE_SIZE)
+
+_TOKEN = re.compile(r"\w+")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+def _tokens(text):
+    return _TOKEN.findall(text.lower())
+
+
+def _min_max(values):
+    """Scales values to [0, 1] (all zeros if they are all equal)."""
+    low, high = min(values), max(values)
+    if high == low:
+        return [0.0 for _ in values]
+    return [(v - low) / (high - low) for v in values]
+
+
+# --- Scoring Backends ---
+# Every backend scores one batch: score(query, candidates) -> one float per candidate, higher is better.
+# Candidates are dicts with at least 'id', 'document' and 'distance'.
+
+class LexicalScorer:
+    """
+    Cheap fallback: BM25 over the candidate set blended with the vector similarity the
+    candidates were retrieved with. No model, no network; a few milliseconds per query.
+    """
+
+    name = "lexical"
+    # Scores are relative to the candidate set (IDF, min-max scaling): the engine scores the
+    # whole set in one batch and never caches them
+    set_relative = True
+
+    def __init__(self, lexical_weight=0.5, k1=1.2, b=0.75):
+        self.lexical_weight = lexical_weight
+        self.k1 = k1
+        self.b = b
+
+    def score(self, query, candidates):
+        query_terms = set(_tokens(query))
+        docs = [Counter(_tokens(c["document"])) for c in candidates]
+        avg_len = sum(sum(d.values()) for d in docs) / max(1, len(docs)) or 1.0
+
+        # IDF over the candidate set: terms every candidate shares carry no signal
+        idf = {}
+        for term in query_terms:
+            df = sum(1 for d in docs if term in d)
+            idf[term] = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+
+        lexical = []
+        for d in docs:
+            length = sum(d.values())
+            total = 0.0
+            for term in query_terms:
+                tf = d.get(term, 0)
+                if tf:
+                    total += idf[term] * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avg_len))
+            lexical.append(total)
+
+        # Smaller distance = more similar, whatever the collection's distance function.
+        # Kept on its absolute scale: near-identical distances should not be stretched into
+        # a large gap, so the lexical signal decides between them.
+        vector = [None if c.get("distance") is None else 1.0 / (1.0 + max(0.0, c["distance"])) for c in candidates]
+        # Lexical-only hits have no distance; rank them like the weakest dense match
+        known = [v for v in vector if v is not None]
+        vector = [min(known, default=0.0) if v is None else v for v in vector]
+
+        lexical = _min_max(lexical)
+        return [self.lexical_weight * lx + (1 - self.lexical_weight) * vc for lx, vc in zip(lexical, vector)]
+
+
+class CrossEncoderScorer:
+    """
+    CPU cross-encoder (sentence-transformers), scoring each (query, chunk) pair jointly.
+    The model is loaded (and downloaded if needed) when the scorer is created.
+    """
+
+    name = "cross-encoder"
+    set_relative = False
+
+    def __init__(self, model_name=RERANKER_MODEL):
+        # Imported here so sentence-transformers stays an optional dependency
+        from sentence_transformers import CrossEncoder
+        self.model_name = model_name
+        self._model = CrossEncoder(model_name)
+
+    def score(self, query, candidates):
+        pairs = [(query, c["document"]) for c in candidates]
+        return [float(s) for s in self._model.predict(pairs)]
+
+
+class OllamaScorer:
+    """
+    Pointwise LLM judge: asks an Ollama model to rate each chunk's relevance from 0 to 10.
+    Requests within a batch run concurrently; generation is capped at a few tokens.
+    """
+
+    name = "ollama"
+    set_relative = False
+
+    def __init__(self, model=RERANKER_OLLAMA_MODEL, max_workers=4):
+        self.model = model
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ollama-rerank")
+
+    def _score_one(self, query, document):
+        messages = [
+            {"role": "system", "content": (
+                "Rate how relevant the PASSAGE is for answering the QUESTION on a scale from 0 (irrelevant) "
+                "to 10 (answers it directly). Reply with the number only.")},
+            {"role": "user", "content": f"QUESTION: {query}\n\nPASSAGE:\n{document}"}
+        ]
+        try:
+            response = ollama.chat(model=self.model, messages=messages,
+                                   options={"temperature": 0.0, "num_ctx": 2048, "num_predict": 4})
+            match = _NUMBER.search(response["message"]["content"])
+            return float(match.group()) if match else 0.0
+        except Exception as e:
+            print(f"Error during Ollama re-ranking: {e}")
+            return 0.0
+
+    def score(self, query, candidates):
+        return list(self.executor.map(lambda c: self._score_one(query, c["document"]), candidates))
+
+
+# --- Engine ---
+
+class RerankingEngine:
+    """
+    Re-orders retrieved candidates with a scoring backend, within a latency budget.
+
+    - Only the first `top_m` candidates (in retrieval order) are scored.
+    - They are scored in batches of `batch_size`; once `budget_ms` is spent, remaining
+      batches are skipped. The first batch is always scored.
+    - Scores are cached per (normalized query, chunk ID), so Streamlit reruns and repeated
+      questions re-use them. Set-relative scorers (lexical) are cheap and never cached.
+
+    Scored candidates come first, best first; unscored candidates follow in retrieval order.
+    """
+
+    def __init__(self, scorer, top_m=RERANK_TOP_M, batch_size=RERANK_BATCH_SIZE, budget_ms=RERANK_BUDGET_MS,
+                 cache_size=RERANK_CACHE_SIZE):
+        self.scorer = scorer
+        self.top_m = max(1, top_m)
+        self.batch_size = max(1, batch_size)
+        self.budget_ms = budget_ms
+        self.cache_size = max(0, cache_size)
+        self._cache = OrderedDict()  # (scorer, query, chunk_id) -> score
+        self._lock = threading.Lock()
+        # Figures of the last rerank() call
+        self.last_stats = {}
+
+    def _cached(self, key):
+        with self._lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _remember(self, key, score):
+        if not self.cache_size:
+            return
+        with self._lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def rerank(self, query, candidates):
+        """
+        Args:
+            query (str): The user question.
+            candidates (list[dict]): Retrieved candidates in retrieval order ('id', 'document', 'distance', ...).
+
+        Returns:
+            list[dict]: The same candidates re-ordered; scored ones gain a 'rerank_score' key.
+        """
+        started = time.perf_counter()
+        head, tail = candidates[:self.top_m], candidates[self.top_m:]
+        normalized = normalize_query(query)
+        set_relative = self.scorer.set_relative
+        batch_size = len(head) or 1 if set_relative else self.batch_size
+
+        scores = {}
+        to_score = []
+        for c in head:
+            score = None if set_relative else self._cached((self.scorer.name, normalized, c["id"]))
+            if score is None:
+                to_score.append(c)
+            else:
+                scores[c["id"]] = score
+        cache_hits = len(scores)
+
+        skipped = []
+        for i in range(0, len(to_score), batch_size):
+            batch = to_score[i:i + batch_size]
+            if i and (time.perf_counter() - started) * 1000 >= self.budget_ms:
+                skipped = to_score[i:]
+                break
+            for c, score in zip(batch, self.scorer.score(query, batch)):
+                scores[c["id"]] = score
+                if not set_relative:
+                    self._remember((self.scorer.name, normalized, c["id"]), score)
+
+        scored = [dict(c, rerank_score=scores[c["id"]]) for c in head if c["id"] in scores]
+        scored.sort(key=lambda c: c["rerank_score"], reverse=True)
+
+        self.last_stats = {
+            "scorer": self.scorer.name,
+            "scored": len(scored) - cache_hits,
+            "cache_hits": cache_hits,
+            "skipped_over_budget": len(skipped),
+            "ms": (time.perf_counter() - started) * 1000,
+        }
+        return scored + skipped + tail
+
+
+def get_reranker(kind=RERANKER):
+    """
+    Builds the re-ranking engine selected by the RERANKER setting.
+
+    Supports 'cross-encoder', 'ollama', 'lexical', 'none' and 'auto' (cross-encoder if
+    sentence-transformers is installed, lexical otherwise).
+
+    Returns:
+        RerankingEngine | None: None when re-ranking is disabled.
+    """
+    kind = kind.lower()
+    if kind == "none":
+        return None
+    if kind in ("auto", "cross-encoder"):
+        try:
+            return RerankingEngine(CrossEncoderScorer())
+        except ImportError:
+            if kind == "cross-encoder":
+                print("sentence-transformers is not installed (pip install sentence-transformers). "
+                      "Falling back to lexical re-ranking.")
+        except Exception as e:
+            # e.g. the model cannot be downloaded; retrieval must keep working
+            print(f"Could not load cross-encoder '{RERANKER_MODEL}': {e}. Falling back to lexical re-ranking.")
+        return RerankingEngine(LexicalScorer())
+    if kind == "ollama":
+        return RerankingEngine(OllamaScorer())
+    if kind == "lexical":
+        return RerankingEngine(LexicalScorer())
+    # Raise an error if the RERANKER variable is set to an unsupported value
+    raise ValueError(f"Unsupported RERANKER specified in config: {kind}")
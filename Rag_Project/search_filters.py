@@ -0,0 +1,115 @@
+import os
+from datetime import date, datetime, time
+
+
+def file_type_of(path):
+    """Normalized file type of a path: its lower-case extension with the dot (e.g. '.md')."""
+    return os.path.splitext(path)[1].lower()
+
+
+def parse_time(value, end_of_day=False):
+    """
+    Parses a filter bound into a Unix timestamp.
+
+    Accepts numbers (timestamps), ISO dates or datetimes ('2024-05-01', '2024-05-01T12:30'),
+    datetime/date objects, or None. A date without a time part means the start of that day,
+    or its last instant with end_of_day=True (for inclusive upper bounds).
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid date: {value!r}")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, date):
+        return datetime.combine(value, time.max if end_of_day else time.min).timestamp()
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    text = str(value).strip()
+    try:
+        return parse_time(date.fromisoformat(text), end_of_day)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid date: {value!r} (expected YYYY-MM-DD or a Unix timestamp)")
+
+
+class SearchFilter:
+    """
+    Restricts retrieval to part of the indexed files. Every set condition must hold:
+
+      - path_prefixes: folders (absolute, or relative to the documents root); a file matches
+        if it is inside any of them (or is one of them)
+      - file_types: extensions such as '.md' or 'pdf' (case-insensitive)
+      - modified_after / modified_before: inclusive range of the file's mtime (Unix timestamps
+        or anything parse_time() accepts). A date without a time covers that whole day:
+        modified_before='2024-05-01' includes files modified on May 1, up to 23:59:59.
+
+    The filter is resolved against the FileManifest's indexes into the matching source files
+    before any vector is scored (see AgenticRAG.retrieve).
+    """
+
+    def __init__(self, path_prefixes=None, file_types=None, modified_after=None, modified_before=None):
+        if isinstance(path_prefixes, str):
+            path_prefixes = [path_prefixes]
+        if isinstance(file_types, str):
+            file_types = [file_types]
+        self.path_prefixes = [p.strip() for p in path_prefixes or [] if p and p.strip()]
+        self.file_types = sorted({("." + t.strip().lower().lstrip(".")) for t in file_types or []
+                                  if t and t.strip().lstrip(".")})
+        self.modified_after = parse_time(modified_after)
+        self.modified_before = parse_time(modified_before, end_of_day=True)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Builds a filter from a JSON-style dict (path_prefixes, file_types, modified_after,
+        modified_before). Returns None for an empty or missing dict; raises ValueError for
+        malformed values.
+        """
+        if not data:
+            return None
+        if not isinstance(data, dict):
+            raise ValueError("'filters' must be an object")
+        unknown = set(data) - {"path_prefixes", "file_types", "modified_after", "modified_before"}
+        if unknown:
+            raise ValueError(f"Unknown filter keys: {', '.join(sorted(unknown))}")
+        for key in ("path_prefixes", "file_types"):
+            value = data.get(key)
+            if value is not None and not isinstance(value, str) and not (
+                    isinstance(value, list) and all(isinstance(v, str) for v in value)):
+                raise ValueError(f"'{key}' must be a string or a list of strings")
+        search_filter = cls(data.get("path_prefixes"), data.get("file_types"),
+                            data.get("modified_after"), data.get("modified_before"))
+        return None if search_filter.is_empty() else search_filter
+
+    def is_empty(self):
+        return not (self.path_prefixes or self.file_types or self.modified_after is not None
+                    or self.modified_before is not None)
+
+    def resolved_prefixes(self, root):
+        """Absolute path prefixes; relative ones are taken relative to `root`."""
+        return [os.path.abspath(p if os.path.isabs(p) else os.path.join(root, p)) for p in self.path_prefixes]
+
+    def key(self):
+        """Hashable identity of the filter (equal filters, equal keys)."""
+        return (tuple(sorted(self.path_prefixes)), tuple(self.file_types), self.modified_after, self.modified_before)
+
+    def describe(self):
+        """Short human-readable summary, e.g. for console output."""
+        parts = []
+        if self.path_prefixes:
+            parts.append("under " + ", ".join(self.path_prefixes))
+        if self.file_types:
+            parts.append("types " + ", ".join(self.file_types))
+        if self.modified_after is not None:
+            parts.append(f"modified after {datetime.fromtimestamp(self.modified_after):%Y-%m-%d %H:%M}")
+        if self.modified_before is not None:
+            parts.append(f"modified before {datetime.fromtimestamp(self.modified_before):%Y-%m-%d %H:%M}")
+        return "; ".join(parts) or "no filter"
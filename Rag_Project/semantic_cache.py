@@ -0,0 +1,192 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from config import SEMANTIC_CACHE_PATH, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES
+
+# Candidates (of the requested model key, above the threshold) checked before giving up
+# (stale entries are skipped)
+_MAX_CANDIDATES = 3
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache for paraphrased questions.
+
+    Stores (question embedding, chunk IDs the answer was grounded in, answer payload)
+    and serves a stored answer when a new question's embedding has cosine similarity
+    >= `threshold` with a stored one AND every chunk the answer was built from is still
+    in the vector database. Chunk IDs are content hashes, so an existing ID means the
+    exact same text is still indexed.
+
+    The embeddings live in a small in-memory matrix (one dot product per lookup);
+    entries are persisted to SQLite and reloaded on start. Beyond `max_entries`, the
+    least recently used entries are evicted.
+    """
+
+    def __init__(self, path=SEMANTIC_CACHE_PATH, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.lookups = 0
+        self.hits = 0
+        self.seconds_saved = 0.0
+
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                id        INTEGER PRIMARY KEY,
+                models    TEXT    NOT NULL,
+                embedding BLOB    NOT NULL,
+                chunk_ids TEXT    NOT NULL,
+                result    TEXT    NOT NULL,
+                seconds   REAL    NOT NULL,
+                last_used REAL    NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+        # In-memory index: row ids, model keys (an array, to mask scores by key) and a (n, dim)
+        # matrix of unit vectors
+        self._ids = []
+        self._models = np.empty(0, dtype=object)
+        self._matrix = None
+        self._load()
+
+    def _load(self):
+        rows = self._conn.execute("SELECT id, models, embedding FROM answers ORDER BY id").fetchall()
+        if len({len(r[2]) for r in rows}) > 1:
+            # Entries of different embedding dimensions cannot share the matrix: keep the newest
+            # entry's dimension, the others belong to a replaced embedding model
+            size = len(rows[-1][2])
+            self._conn.execute("DELETE FROM answers WHERE length(embedding) != ?", (size,))
+            self._conn.commit()
+            rows = [r for r in rows if len(r[2]) == size]
+        self._ids = [r[0] for r in rows]
+        self._models = np.array([r[1] for r in rows], dtype=object)
+        self._matrix = np.stack([np.frombuffer(r[2], dtype=np.float32) for r in rows]) if rows else None
+
+    def lookup(self, embedding, models, chunks_exist):
+        """
+        Finds a cached answer for a semantically equivalent question.
+
+        Args:
+            embedding (list[float]): Embedding of the new question.
+            models (str): Model key (LLM + embedding model) the answer must have been produced with.
+            chunks_exist (Callable[[list[str]], bool]): Returns True if all given chunk IDs are still indexed.
+
+        Returns:
+            dict | None: The stored result payload plus 'similarity' and 'original_seconds'
+            (how long the answer originally took), or None on a miss.
+        """
+        query = _unit(embedding)
+        with self._lock:
+            self.lookups += 1
+            if self._matrix is None or self._matrix.shape[1] != query.shape[0]:
+                return None
+            scores = self._matrix @ query
+            # Only entries of this model key compete for the candidate slots; entries of other
+            # keys (other models, other collection sets) must not crowd out a valid hit
+            scores[self._models != models] = -np.inf
+            candidates = [i for i in np.argsort(-scores)[:_MAX_CANDIDATES] if scores[i] >= self.threshold]
+            rows = [(self._ids[i], float(scores[i])) for i in candidates]
+
+        for row_id, score in rows:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT chunk_ids, result, seconds FROM answers WHERE id = ?", (row_id,)).fetchone()
+            if row is None:
+                continue
+            chunk_ids, result, seconds = row
+            if not chunks_exist(json.loads(chunk_ids)):
+                # The answer was grounded in chunks that have since been re-indexed or removed
+                self._delete(row_id)
+                continue
+            with self._lock:
+                self._conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), row_id))
+                self._conn.commit()
+                self.hits += 1
+            result = json.loads(result)
+            result["similarity"] = score
+            result["original_seconds"] = seconds
+            return result
+        return None
+
+    def store(self, embedding, models, chunk_ids, result, seconds):
+        """
+        Adds an answer to the cache.
+
+        Args:
+            embedding (list[float]): Embedding of the question.
+            models (str): Model key (LLM + embedding model).
+            chunk_ids (list[str]): IDs of the chunks the answer was generated from.
+            result (dict): JSON-serializable result payload returned on a hit.
+            seconds (float): How long producing the answer took (reported as time saved on hits).
+        """
+        vector = _unit(embedding)
+        with self._lock:
+            if self._matrix is not None and self._matrix.shape[1] != vector.shape[0]:
+                # A new embedding model: entries of the old dimension can never match again
+                self._conn.execute("DELETE FROM answers WHERE length(embedding) != ?", (vector.nbytes,))
+                self._load()
+            cursor = self._conn.execute(
+                "INSERT INTO answers (models, embedding, chunk_ids, result, seconds, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (models, vector.tobytes(), json.dumps(list(chunk_ids)), json.dumps(result), seconds, time.time())
+            )
+            self._ids.append(cursor.lastrowid)
+            self._models = np.append(self._models, np.array([models], dtype=object))
+            row = vector[np.newaxis, :]
+            self._matrix = row if self._matrix is None else np.vstack([self._matrix, row])
+
+            overflow = len(self._ids) - self.max_entries
+            if overflow > 0:
+                victims = [r[0] for r in self._conn.execute(
+                    "SELECT id FROM answers ORDER BY last_used ASC LIMIT ?", (overflow,))]
+                self._conn.executemany("DELETE FROM answers WHERE id = ?", [(v,) for v in victims])
+                self._load()
+            self._conn.commit()
+
+    def record_saving(self, seconds):
+        """Adds the wall time a hit saved (original answer time minus the lookup's own cost)."""
+        with self._lock:
+            self.seconds_saved += max(0.0, seconds)
+
+    def _delete(self, row_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM answers WHERE id = ?", (row_id,))
+            self._conn.commit()
+            if row_id in self._ids:
+                keep = [i for i, rid in enumerate(self._ids) if rid != row_id]
+                self._ids = [self._ids[i] for i in keep]
+                self._models = self._models[keep]
+                self._matrix = self._matrix[keep] if keep else None
+
+    def stats(self):
+        """Returns lookups, hits, hit_rate and seconds_saved since start-up, plus the number of stored answers."""
+        with self._lock:
+            return {
+                "entries": len(self._ids),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "seconds_saved": self.seconds_saved,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,47 @@
+"""
+Checks that LexicalIndex finds identifiers in chunks stored as normalized text (as the
+ingest pipeline stores them), whether the query names the identifier in its raw form or not.
+
+Run with: python -m pytest test_lexical_index.py
+"""
+import pytest
+
+from lexical_index import LexicalIndex
+from text_normalizer import normalize_texts
+
+CHUNKS = {
+    "error": "The upload failed with ERR4012 after the token expired.",
+    "hash": "Files are deduplicated by their sha256 digest before indexing.",
+    "paths": "Build the target with os.path.join(root, name) on every platform.",
+    "other": "Meeting notes: the release moves to the second week of March.",
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite3"), normalize=True)
+    index.add_chunks(zip(CHUNKS, normalize_texts(CHUNKS.values())))
+    return index
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("ERR4012", "error"),
+    ("what does err4012 mean", "error"),
+    ("sha256", "hash"),
+    ("os.path.join", "paths"),
+])
+def test_identifier_with_digits_matches_normalized_chunk(index, query, expected):
+    results = index.search(query, limit=3)
+    assert results and results[0][0] == expected
+
+
+def test_chunk_ids_restrict_results(index):
+    assert index.search("ERR4012", chunk_ids={"hash", "other"}) == []
+
+
+def test_raw_chunks_still_match(tmp_path):
+    # Chunks indexed before text normalization keep their run-together identifiers
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite3"), normalize=True)
+    index.add_chunks(CHUNKS.items())
+    assert index.search("ERR4012", limit=1)[0][0] == "error"
+    assert index.search("sha256", limit=1)[0][0] == "hash"
@@ -0,0 +1,148 @@
+"""
+Checks NumpyVectorStore against brute-force search over a plain Python model of its
+contents, after upserts, deletes, metadata moves, compaction and reopening, for every
+index (flat, ivf) and quantization (none, float16, int8).
+
+The IVF store probes every list, so it must match the exact answer; what is tested there is
+the bookkeeping (tombstones, free-slot reuse, posting lists, source codes), not recall.
+Quantized stores shortlist rescore * K candidates from the compressed copy and re-score them
+exactly, which on this data finds the exact top K, so a stale or mis-encoded compressed row
+shows up as a wrong result.
+
+Run with: python -m pytest test_numpy_vector_store.py
+"""
+import numpy as np
+import pytest
+
+from numpy_vector_store import NumpyVectorStore
+
+DIM = 16
+NLIST = 8
+K = 5
+SOURCES = [f"/docs/file{i}.md" for i in range(12)]
+
+
+class Model:
+    """What the store should contain: chunk ID -> (vector, document, metadata)."""
+
+    def __init__(self):
+        self.rows = {}
+
+    def upsert(self, store, ids, vectors, sources):
+        metadatas = [{"source": source, "n": int(chunk_id)} for chunk_id, source in zip(ids, sources)]
+        documents = [f"chunk {chunk_id}" for chunk_id in ids]
+        store.upsert(ids, vectors.tolist(), documents=documents, metadatas=metadatas)
+        for chunk_id, vector, document, metadata in zip(ids, vectors, documents, metadatas):
+            self.rows[chunk_id] = (vector, document, metadata)
+
+    def delete(self, store, ids):
+        store.delete(ids=ids)
+        for chunk_id in ids:
+            del self.rows[chunk_id]
+
+    def nearest(self, query, k, where=None):
+        matches = [(chunk_id, vector) for chunk_id, (vector, _, metadata) in self.rows.items()
+                   if where is None or where(metadata)]
+        distances = [float(np.sum((vector - query) ** 2)) for _, vector in matches]
+        order = np.argsort(distances, kind="stable")[:k]
+        return [matches[i][0] for i in order], [distances[i] for i in order]
+
+
+def open_store(path, index, quantization):
+    return NumpyVectorStore(str(path), index=index, nlist=NLIST, nprobe=NLIST, train_min=64,
+                            quantization=quantization, rescore=4)
+
+
+def check(store, model, rng):
+    """Compares count, get and query (plain and filtered) with the model."""
+    assert store.count() == len(model.rows)
+
+    ids = sorted(model.rows)[:20]
+    got = store.get(ids=ids, include=["documents", "metadatas", "embeddings"])
+    by_id = {i: (doc, md, emb) for i, doc, md, emb in
+             zip(got["ids"], got["documents"], got["metadatas"], got["embeddings"])}
+    assert set(by_id) == set(ids)
+    for chunk_id in ids:
+        vector, document, metadata = model.rows[chunk_id]
+        assert by_id[chunk_id][0] == document
+        assert by_id[chunk_id][1] == metadata
+        np.testing.assert_allclose(by_id[chunk_id][2], vector, rtol=1e-6)
+
+    some_sources = list(rng.choice(SOURCES, 3, replace=False))
+    filters = [
+        (None, None),
+        ({"source": {"$in": some_sources}}, lambda md: md["source"] in some_sources),
+        ({"source": some_sources[0]}, lambda md: md["source"] == some_sources[0]),
+        ({"n": {"$lt": 150}}, lambda md: md["n"] < 150),
+    ]
+    for query in rng.standard_normal((10, DIM)).astype(np.float32):
+        for where, predicate in filters:
+            expected_ids, expected_distances = model.nearest(query, K, predicate)
+            result = store.query([query.tolist()], n_results=K, where=where,
+                                 include=["distances", "metadatas"])
+            assert result["ids"][0] == expected_ids
+            np.testing.assert_allclose(result["distances"][0], expected_distances, rtol=1e-4, atol=1e-4)
+            if predicate is not None:
+                assert all(predicate(md) for md in result["metadatas"][0])
+
+        # ID restriction (filtered retrieval by manifest chunk IDs), including unknown IDs
+        allowed = set(rng.choice(sorted(model.rows), min(40, len(model.rows)), replace=False)) | {"missing"}
+        expected_ids, _ = model.nearest(query, K, lambda md: str(md["n"]) in allowed)
+        result = store.query([query.tolist()], n_results=K, ids=sorted(allowed), include=[])
+        assert result["ids"][0] == expected_ids
+
+
+@pytest.mark.parametrize("quantization", ["none", "float16", "int8"])
+@pytest.mark.parametrize("index", ["flat", "ivf"])
+def test_query_matches_brute_force(tmp_path, index, quantization):
+    rng = np.random.default_rng(0)
+    model = Model()
+    store = open_store(tmp_path, index, quantization)
+
+    # Initial load (large enough to train the IVF index)
+    ids = [str(i) for i in range(300)]
+    model.upsert(store, ids, rng.standard_normal((300, DIM)).astype(np.float32), rng.choice(SOURCES, 300))
+    if index == "ivf":
+        assert store.index is not None
+    check(store, model, rng)
+
+    # Deletes leave tombstones (and, past compact_ratio, trigger a compaction)
+    model.delete(store, [str(i) for i in rng.choice(300, 100, replace=False)])
+    check(store, model, rng)
+
+    # Upserts of existing chunks move them (new vector, new source); new chunks reuse free slots
+    moved = sorted(model.rows)[:50]
+    model.upsert(store, moved, rng.standard_normal((50, DIM)).astype(np.float32), rng.choice(SOURCES, 50))
+    added = [str(i) for i in range(300, 360)]
+    model.upsert(store, added, rng.standard_normal((60, DIM)).astype(np.float32), rng.choice(SOURCES, 60))
+    check(store, model, rng)
+
+    # Metadata-only update changes the source a filter sees
+    target = sorted(model.rows)[0]
+    vector, document, metadata = model.rows[target]
+    metadata = {**metadata, "source": SOURCES[-1]}
+    store.update([target], metadatas=[metadata])
+    model.rows[target] = (vector, document, metadata)
+    check(store, model, rng)
+
+    # Explicit compaction after more deletes
+    model.delete(store, sorted(model.rows)[::7])
+    store.compact()
+    check(store, model, rng)
+
+    # Reopen from the files on disk
+    store.close()
+    store = open_store(tmp_path, index, quantization)
+    check(store, model, rng)
+
+    # Delete by where, then everything
+    doomed = [chunk_id for chunk_id, (_, _, md) in model.rows.items() if md["source"] == SOURCES[0]]
+    store.delete(where={"source": SOURCES[0]})
+    for chunk_id in doomed:
+        del model.rows[chunk_id]
+    check(store, model, rng)
+    store.delete(where={})
+    model.rows.clear()
+    assert store.count() == 0
+    assert store.query([np.zeros(DIM).tolist()], n_results=K)["ids"] == [[]]
+    store.close()
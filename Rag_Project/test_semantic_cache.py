@@ -0,0 +1,58 @@
+"""
+Checks SemanticAnswerCache across a change of embedding dimension (a new embedding model):
+entries of the old dimension are dropped, both in memory and in SQLite, so lookups keep
+working and the cache still loads after a restart.
+
+Run with: python -m pytest test_semantic_cache.py
+"""
+import sqlite3
+
+import numpy as np
+
+from semantic_cache import SemanticAnswerCache
+
+MODELS = "llm|embedder"
+
+
+def always(chunk_ids):
+    return True
+
+
+def open_cache(tmp_path):
+    return SemanticAnswerCache(str(tmp_path / "semantic_cache.sqlite3"), threshold=0.9, max_entries=10)
+
+
+def test_dimension_change_drops_old_entries(tmp_path):
+    cache = open_cache(tmp_path)
+    cache.store([1.0, 0.0, 0.0], MODELS, ["a"], {"answer": "three"}, 1.0)
+    cache.store([0.0, 1.0, 0.0], MODELS, ["b"], {"answer": "three again"}, 1.0)
+    cache.store([1.0, 0.0, 0.0, 0.0], MODELS, ["c"], {"answer": "four"}, 1.0)
+
+    assert cache.stats()["entries"] == 1
+    assert cache.lookup([1.0, 0.0, 0.0], MODELS, always) is None
+    assert cache.lookup([1.0, 0.1, 0.0, 0.0], MODELS, always)["answer"] == "four"
+    cache.close()
+
+    cache = open_cache(tmp_path)
+    assert cache.stats()["entries"] == 1
+    assert cache.lookup([1.0, 0.0, 0.0, 0.0], MODELS, always)["answer"] == "four"
+    cache.close()
+
+
+def test_load_purges_mixed_dimensions(tmp_path):
+    # A database holding entries of two dimensions, as older versions could leave behind
+    cache = open_cache(tmp_path)
+    cache.store([1.0, 0.0, 0.0], MODELS, ["a"], {"answer": "three"}, 1.0)
+    cache.close()
+    with sqlite3.connect(str(tmp_path / "semantic_cache.sqlite3")) as conn:
+        conn.execute("INSERT INTO answers (models, embedding, chunk_ids, result, seconds, last_used) "
+                     "VALUES (?, ?, ?, ?, ?, ?)",
+                     (MODELS, np.array([0.0, 1.0, 0.0, 0.0], dtype=np.float32).tobytes(), '["b"]',
+                      '{"answer": "four"}', 1.0, 0.0))
+
+    cache = open_cache(tmp_path)
+    assert cache.stats()["entries"] == 1
+    assert cache.lookup([0.0, 1.0, 0.0, 0.0], MODELS, always)["answer"] == "four"
+    cache.close()
+    with sqlite3.connect(str(tmp_path / "semantic_cache.sqlite3")) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] == 1
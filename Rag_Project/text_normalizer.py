@@ -0,0 +1,34 @@
+import re
+
+# Spacing fixes for text extracted from PDFs and notes, where words, numbers and sentences
+# often run together. The four rules (formerly four re.sub passes per retrieved chunk on every
+# query) are compiled once into a single pattern that matches the zero-width boundaries
+# where a space is missing:
+#   1. CamelCase / run-on words:   "endOf"  -> "end Of"
+#   2. Punctuation run-ons:        "end.Next" -> "end. Next"
+#   3. Letter followed by digit:   "page12" -> "page 12"
+#   4. Digit followed by letter:   "12pages" -> "12 pages"
+# Inserting a space at every boundary in one pass gives the same result as the sequential
+# passes: a space never creates or hides a boundary for another rule.
+_MISSING_SPACE = re.compile(
+    r"(?<=[a-z])(?=[A-Z])"
+    r"|(?<=[.?!,:;])(?=[a-zA-Z0-9])"
+    r"|(?<=[a-zA-Z])(?=[0-9])"
+    r"|(?<=[0-9])(?=[a-zA-Z])"
+)
+
+
+def normalize_text(text):
+    """
+    Inserts the spaces missing between run-together words, numbers and sentences.
+
+    Applied once per chunk at ingest time, so the stored text is clean and the
+    embedding is computed from the cleaned text.
+    """
+    return _MISSING_SPACE.sub(" ", text)
+
+
+def normalize_texts(texts):
+    """Normalizes a batch of texts (see normalize_text)."""
+    sub = _MISSING_SPACE.sub
+    return [sub(" ", text) for text in texts]
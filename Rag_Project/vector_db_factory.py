@@ -1,25 +1,68 @@
-from config import VECTOR_DB, CHROMA_DB_PATH
+from collections import namedtuple
 
+from file_manifest import FileManifest
+from lexical_index import LexicalIndex
+from named_collections import collection_path, validate_collection_name
+from config import (VECTOR_DB, CHROMA_DB_PATH, NUMPY_DB_PATH, NUMPY_INDEX, IVF_NLIST, IVF_NPROBE, IVF_TRAIN_MIN_CHUNKS,
+                    IVF_RETRAIN_GROWTH, NUMPY_COMPACT_RATIO, NUMPY_QUANTIZATION, NUMPY_RESCORE_FACTOR,
+                    COLLECTION_NAME, FILE_MANIFEST_PATH, LEXICAL_INDEX_ENABLED, LEXICAL_INDEX_PATH)
 
-def get_vector_db():
+# Everything stored for one named collection (lexical_index is None when LEXICAL_INDEX_ENABLED is off)
+CollectionShard = namedtuple("CollectionShard", ["name", "collection", "manifest", "lexical_index"])
+
+
+def get_vector_db(name=COLLECTION_NAME):
     """
     Initializes and returns the vector database collection based on configuration.
 
-    Currently supports ChromaDB, providing persistence and collection management.
+    Supports ChromaDB (persistent client) and the in-process NumPy engine ("numpy").
+    Both implement the VectorStore interface (vector_store.py), which mirrors the
+    Chroma collection API used by the pipeline and the agent.
+
+    Args:
+        name (str): Named collection (see named_collections.py); default COLLECTION_NAME.
 
     Returns:
-        chromadb.Collection: The ChromaDB collection object for RAG documents.
+        VectorStore: The collection object for RAG documents.
     """
+    validate_collection_name(name)
     if VECTOR_DB.lower() == "chroma":
         # Imports are done locally to avoid errors if the chosen DB is not installed
         from chromadb.config import Settings
         import chromadb
+        from vector_store import ChromaVectorStore
 
         # Initialize a persistent ChromaDB client using the configured path
         client = chromadb.PersistentClient(path=CHROMA_DB_PATH, settings=Settings(anonymized_telemetry=False))
 
-        # Get or create the main collection where all RAG documents are stored
-        return client.get_or_create_collection("rag_docs")
+        # Get or create the named collection (all collections share one Chroma database)
+        return ChromaVectorStore(client.get_or_create_collection(name))
+    elif VECTOR_DB.lower() == "numpy":
+        from numpy_vector_store import NumpyVectorStore
+
+        # Memory-mapped embedding matrix + SQLite sidecar; no server. With NUMPY_INDEX=ivf an
+        # IVF index is trained automatically once the store is large enough; with
+        # NUMPY_QUANTIZATION candidates are scored on compressed vectors, then re-scored
+        return NumpyVectorStore(collection_path(NUMPY_DB_PATH, name), name=name, index=NUMPY_INDEX.lower(),
+                                nlist=IVF_NLIST, nprobe=IVF_NPROBE, train_min=IVF_TRAIN_MIN_CHUNKS, retrain_growth=IVF_RETRAIN_GROWTH,
+                                compact_ratio=NUMPY_COMPACT_RATIO, quantization=NUMPY_QUANTIZATION.lower(),
+                                rescore=NUMPY_RESCORE_FACTOR)
     else:
         # Raise an error if the VECTOR_DB variable is set to an unsupported value
         raise ValueError(f"Unsupported VECTOR_DB specified in config: {VECTOR_DB}")
+
+
+def open_collection(name=COLLECTION_NAME):
+    """
+    Opens a named collection: its vector store collection, file manifest and lexical index,
+    each stored separately from those of every other collection.
+
+    Returns:
+        CollectionShard: (name, collection, manifest, lexical_index).
+    """
+    return CollectionShard(
+        name=name,
+        collection=get_vector_db(name),
+        manifest=FileManifest(collection_path(FILE_MANIFEST_PATH, name)),
+        lexical_index=LexicalIndex(collection_path(LEXICAL_INDEX_PATH, name)) if LEXICAL_INDEX_ENABLED else None,
+    )
@@ -0,0 +1,143 @@
+from abc import ABC, abstractmethod
+
+
+class VectorStore(ABC):
+    """
+    Interface of a vector store backend: the subset of the Chroma collection API used by
+    IngestPipeline, AgenticRAG, FileManifest and LexicalIndex, with Chroma's argument names
+    and result shapes, so any backend can stand in for a Chroma collection.
+
+    Results of get() are dicts of flat lists ('ids', plus the included 'documents',
+    'metadatas', 'embeddings'); results of query() hold one list per query vector
+    ('ids', plus the included 'documents', 'metadatas', 'distances'). Distances are
+    squared L2, smaller is more similar.
+
+    Backends must implement every method; a backend missing one cannot be instantiated.
+    """
+
+    name = "rag_docs"
+
+    @abstractmethod
+    def count(self):
+        """Number of stored chunks."""
+
+    @abstractmethod
+    def get(self, ids=None, where=None, limit=None, offset=None, include=None):
+        """Chunks by ID, or a page of all chunks (limit/offset) in a stable order."""
+
+    @abstractmethod
+    def query(self, query_embeddings, n_results=10, where=None, include=None, ids=None):
+        """
+        The n_results nearest chunks for each query vector, nearest first; ids restricts the
+        search to those chunks (unknown IDs are ignored).
+        """
+
+    @abstractmethod
+    def add(self, ids, embeddings, documents=None, metadatas=None):
+        """Stores new chunks; IDs that already exist are left unchanged."""
+
+    @abstractmethod
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        """Stores chunks, replacing existing ones with the same ID."""
+
+    @abstractmethod
+    def update(self, ids, embeddings=None, documents=None, metadatas=None):
+        """Replaces the given fields of existing chunks; unknown IDs are ignored."""
+
+    @abstractmethod
+    def delete(self, ids=None, where=None):
+        """Deletes chunks by ID, or every chunk matching where ({} = all)."""
+
+
+_COMPARISONS = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$gt": lambda value, operand: value is not None and value > operand,
+    "$gte": lambda value, operand: value is not None and value >= operand,
+    "$lt": lambda value, operand: value is not None and value < operand,
+    "$lte": lambda value, operand: value is not None and value <= operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+}
+
+
+def metadata_matches(metadata, where):
+    """
+    Evaluates a Chroma-style where filter against one metadata dict, for backends without
+    a query engine of their own: {"key": value}, {"key": {"$op": operand}} with $eq, $ne,
+    $gt, $gte, $lt, $lte, $in, $nin, and {"$and": [...]} / {"$or": [...]}.
+    """
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(metadata_matches(metadata, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(metadata_matches(metadata, part) for part in condition):
+                return False
+        elif isinstance(condition, dict):
+            for op, operand in condition.items():
+                if op not in _COMPARISONS:
+                    raise ValueError(f"Unsupported where operator: {op}")
+                try:
+                    if not _COMPARISONS[op](metadata.get(key), operand):
+                        return False
+                except TypeError:
+                    # Mismatched types (e.g. a string compared with a number) never match
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def _kwargs(**kwargs):
+    """Drops unset arguments so the backend's own defaults apply."""
+    return {key: value for key, value in kwargs.items() if value is not None}
+
+
+class ChromaVectorStore(VectorStore):
+    """VectorStore backed by a persistent ChromaDB collection."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.name = collection.name
+
+    def count(self):
+        return self.collection.count()
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=None):
+        return self.collection.get(**_kwargs(ids=ids, where=where, limit=limit, offset=offset, include=include))
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None, ids=None):
+        if ids is not None:
+            # Chroma fails the whole query on an unknown ID
+            ids = self.collection.get(ids=list(ids), include=[])["ids"]
+            if not ids:
+                return {key: [[] for _ in query_embeddings] for key in ("ids", "documents", "metadatas", "distances")}
+        return self.collection.query(**_kwargs(query_embeddings=query_embeddings, n_results=n_results,
+                                               where=where, include=include, ids=ids))
+
+    def add(self, ids, embeddings, documents=None, metadatas=None):
+        existing = set(self.collection.get(ids=list(ids), include=[])["ids"])
+        rows = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing]
+        if rows:
+            self.collection.add(**_kwargs(
+                ids=[ids[i] for i in rows],
+                embeddings=[embeddings[i] for i in rows],
+                documents=[documents[i] for i in rows] if documents is not None else None,
+                metadatas=[metadatas[i] for i in rows] if metadatas is not None else None))
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        self.collection.upsert(**_kwargs(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas))
+
+    def update(self, ids, embeddings=None, documents=None, metadatas=None):
+        self.collection.update(**_kwargs(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas))
+
+    def delete(self, ids=None, where=None):
+        if ids is None and not where:
+            # Chroma rejects an empty where filter; delete everything page by page instead
+            while True:
+                page = self.collection.get(include=[], limit=5000)["ids"]
+                if not page:
+                    return
+                self.collection.delete(ids=page)
+        self.collection.delete(**_kwargs(ids=ids, where=where))
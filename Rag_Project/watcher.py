@@ -0,0 +1,153 @@
+import os
+import time
+import asyncio
+import threading
+import rich
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+from ingest_pipeline import is_supported_file
+from config import WATCH_DEBOUNCE_SECONDS
+
+console = rich.get_console()
+
+# How often the flush loop checks for paths whose debounce window has elapsed
+_POLL_SECONDS = 0.5
+
+
+class _ChangeCollector(FileSystemEventHandler):
+    """
+    Records filesystem events as {path: time of last event}, coalescing bursts.
+
+    Runs on watchdog's observer thread; the indexer drains it from the event loop.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._touched = {}  # file path -> last event time (index or remove, decided at flush)
+        self._removed_dirs = {}  # directory path -> last event time
+
+    def _touch(self, path):
+        with self._lock:
+            self._touched[os.path.abspath(path)] = time.monotonic()
+
+    def _touch_dir(self, path):
+        with self._lock:
+            self._removed_dirs[os.path.abspath(path)] = time.monotonic()
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._touch(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._touch(event.src_path)
+
+    def on_deleted(self, event):
+        if event.is_directory:
+            self._touch_dir(event.src_path)
+        else:
+            self._touch(event.src_path)
+
+    def on_moved(self, event):
+        if event.is_directory:
+            # Every indexed file under the old directory is gone; every file under the new
+            # one is (re)checked. Content-hash matching turns these into metadata moves.
+            self._touch_dir(event.src_path)
+            for root, _, fs in os.walk(event.dest_path):
+                for f in fs:
+                    self._touch(os.path.join(root, f))
+        else:
+            self._touch(event.src_path)
+            self._touch(event.dest_path)
+
+    def drain(self, quiet_seconds):
+        """
+        Pops every path that has not seen an event for quiet_seconds.
+
+        Returns:
+            tuple[list[str], list[str]]: (settled file paths, settled removed directories)
+        """
+        cutoff = time.monotonic() - quiet_seconds
+        with self._lock:
+            files = [p for p, t in self._touched.items() if t <= cutoff]
+            dirs = [p for p, t in self._removed_dirs.items() if t <= cutoff]
+            for p in files:
+                del self._touched[p]
+            for p in dirs:
+                del self._removed_dirs[p]
+        return files, dirs
+
+
+class IndexWatcher:
+    """
+    Long-running incremental indexer driven by filesystem events (--mode watch).
+
+    Changes are debounced per file: a path is processed once it has been quiet for
+    `debounce_seconds`. Settled paths go through the normal incremental ingest path:
+      - existing files -> IngestPipeline.index_files() (stat/hash check, chunk diff, move detection)
+      - missing files  -> IngestPipeline.remove_files() (targeted chunk removal)
+    Files are indexed before removals are applied, so a rename is recognised by its content
+    hash and becomes a metadata-only move instead of a delete + re-embed.
+    """
+
+    def __init__(self, pipeline, folder, debounce_seconds=WATCH_DEBOUNCE_SECONDS):
+        self.pipeline = pipeline
+        self.folder = os.path.abspath(folder)
+        self.debounce_seconds = debounce_seconds
+        self._collector = _ChangeCollector()
+        self._observer = Observer()
+
+    async def _flush(self):
+        """Pushes settled changes through the pipeline."""
+        files, removed_dirs = self._collector.drain(self.debounce_seconds)
+
+        # Files that vanished with a deleted/moved directory
+        for directory in removed_dirs:
+            files.extend(self.pipeline.manifest.paths_under(directory))
+
+        files = [f for f in dict.fromkeys(files) if is_supported_file(f)]
+        if not files:
+            return
+
+        existing = [f for f in files if os.path.isfile(f)]
+        missing = [f for f in files if not os.path.isfile(f)]
+
+        if existing:
+            console.print(f"[cyan]Watch:[/cyan] {len(existing)} changed file(s)")
+            await self.pipeline.index_files(existing)
+        if missing:
+            self.pipeline.remove_files(missing)
+
+    async def run(self, initial_scan=True):
+        """
+        Watches the folder until cancelled (Ctrl+C).
+
+        Args:
+            initial_scan (bool): Catch up on changes made while the watcher was not running
+                (stale cleanup + a stat-first index pass) before processing events.
+        """
+        # A collection that cannot take new chunks fails here instead of on every change
+        self.pipeline.check_writable()
+
+        # Subscribe first so nothing that changes during the initial scan is missed
+        self._observer.schedule(self._collector, self.folder, recursive=True)
+        self._observer.start()
+        console.print(f"[bold green]Watching[/bold green] {self.folder} (debounce {self.debounce_seconds:.1f}s)")
+
+        try:
+            if initial_scan:
+                self.pipeline.cleanup_deleted_files(self.folder)
+                await self.pipeline.index_folder(self.folder)
+
+            while True:
+                await asyncio.sleep(_POLL_SECONDS)
+                try:
+                    await self._flush()
+                except Exception as e:
+                    # Keep the daemon alive; the affected files are retried on their next change
+                    console.print(f"[red]Watch: error while indexing changes:[/red] {e}")
+        finally:
+            self._observer.stop()
+            self._observer.join()